@@ -51,11 +51,207 @@ COMMAND_PERMISSIONS = {
     'upstaff': ['administrator', 'owner'],
     'ban': ['administrator', 'owner'],
     'warn': ['moderator', 'administrator', 'owner'],
-    'kick': ['moderator', 'administrator', 'owner']
+    'kick': ['moderator', 'administrator', 'owner'],
+    'find': ['moderator', 'administrator', 'owner']
 }
 
-# Rate limits (in seconds)
+# Rate limits per <command>_<rank>: seconds between uses, or (uses, window seconds).
+# Chats can override them in rate_limit_overrides (see data/rate_limiter.py).
 RATE_LIMITS = {
     'warn_moderator': 3600,  # 1 hour for moderators
     'kick_moderator': 900    # 15 minutes for moderators
-}
\ No newline at end of file
+}
+
+RATE_LIMITER_SETTINGS = {
+    'maxsize': 50000,      # (chat, user, command) windows held before expired ones are swept
+    'persist': True,       # Keep cooldowns across restarts in rate_limit_hits
+    'flush_interval': 5,   # Seconds between batched writes of new uses
+    'max_pending': 10000   # Unwritten uses kept while the database fails, oldest dropped first
+}
+
+# Anti-flood guard in front of every handler (see middlewares/flood_guard.py)
+FLOOD_SETTINGS = {
+    'enabled': True,
+    'user_limit': 8,          # Messages from one user in one chat...
+    'user_window': 5,         # ...within this many seconds count as flooding
+    'chat_limit': 150,        # Messages in one chat...
+    'chat_window': 5,         # ...within this many seconds count as a raid
+    'action': 'restrict',     # 'restrict' (mute) or 'warn' for flooding users
+    'restrict_seconds': 300,  # Mute duration for 'restrict'
+    'notice_cooldown': 60,    # Seconds between actions against the same user / raid notices per chat
+    'max_tracked': 100000     # Counters kept in memory, least recently active dropped first
+}
+
+# Outbound message pacing (see middlewares/send_scheduler.py)
+SEND_SCHEDULER_SETTINGS = {
+    'global_rate': 30,     # Messages per second across all chats
+    'global_burst': 30,
+    'group_rate': 1,       # Messages per second in one group
+    'group_burst': 3,      # Short bursts a group may receive at once
+    'private_rate': 5,     # Private chats only limited loosely; the global rate applies too
+    'private_burst': 5,
+    'max_retries': 3,      # Re-sends after a 429 before the error reaches the handler
+    'max_chats': 20000     # Chat buckets kept before idle ones are dropped
+}
+
+# How updates are received: 'polling' (getUpdates) or 'webhook' (aiohttp server, see utils/webhook_server.py)
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+
+WEBHOOK_SETTINGS = {
+    'base_url': os.environ.get("WEBHOOK_BASE_URL"),     # Public https://host; unset = don't call setWebhook (local testing, or set elsewhere)
+    'path': os.environ.get("WEBHOOK_PATH", "/webhook"),
+    'host': os.environ.get("WEBHOOK_HOST", "0.0.0.0"),
+    'port': int(os.environ.get("WEBHOOK_PORT", "8080")),
+    'secret_token': os.environ.get("WEBHOOK_SECRET"),   # Checked against X-Telegram-Bot-Api-Secret-Token
+    'drain_timeout': 30,          # Seconds to let accepted updates finish on shutdown
+    'drop_pending_updates': False
+}
+
+# Multi-process mode (see utils/sharding.py): a supervisor receives updates and
+# hands each chat to one of `processes` workers; 1 keeps everything in one process
+WORKER_SETTINGS = {
+    'processes': int(os.environ.get("BOT_WORKERS", "1")),
+    'replicas': 256,           # Points per worker on the consistent-hash ring (more = more even split)
+    'batch_size': 100,         # Updates a worker takes off its queue at once
+    'render_workers': 1,       # Render pool size inside each worker (instead of RENDER_SETTINGS['workers'])
+    'check_interval': 5,       # Seconds between liveness checks; dead workers are restarted
+    'drain_timeout': 30        # Seconds a worker gets to finish its queue on shutdown
+}
+
+# Logging (see utils/logs.py): records go through a queue to a writer thread
+LOGGING_SETTINGS = {
+    'level': os.environ.get("LOG_LEVEL", "INFO"),
+    'levels': os.environ.get("LOG_LEVELS", "aiogram.event=WARNING"),  # Per-module levels: "name=LEVEL,name=LEVEL"
+    'format': os.environ.get("LOG_FORMAT", "text"),  # "text" or "json" (one object per line)
+    'queue_size': 10000,       # Records waiting for the writer thread; beyond that they are dropped and counted
+    'debug_limit': 20,         # DEBUG records per call site and window...
+    'debug_window': 60,        # ...seconds
+    'debug_sample': 100,       # Past the limit keep every Nth record (0 = none)
+    'slow_update': 1.0         # Seconds; slower updates are logged as warnings
+}
+
+# Prometheus text endpoint (see utils/metrics.py); with BOT_WORKERS each worker uses port + its index
+METRICS_SETTINGS = {
+    'enabled': os.environ.get("METRICS_ENABLED", "1") == "1",
+    'host': os.environ.get("METRICS_HOST", "127.0.0.1"),
+    'port': int(os.environ.get("METRICS_PORT", "9310")),
+    'path': "/metrics",
+    # Histogram bucket bounds in seconds
+    'handler_buckets': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'db_buckets': (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    'api_buckets': (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+}
+
+# SQLite connection settings (see data/database.py)
+DATABASE_SETTINGS = {
+    'readers': 4,               # Size of the read-only connection pool
+    'synchronous': 'NORMAL',    # Safe with WAL, avoids an fsync per commit
+    'cache_size': -16000,       # Negative value = size in KiB (16 MB)
+    'mmap_size': 134217728,     # 128 MB memory-mapped I/O
+    'busy_timeout': 5000,       # Milliseconds to wait on a locked database
+    'identity_cache_size': 50000,  # Users whose last written profile is remembered
+    'incremental_vacuum': True     # Convert to auto_vacuum=INCREMENTAL at startup (one full VACUUM)
+}
+
+# Write-behind buffer for message counters (see data/message_buffer.py).
+# At most this many milliseconds / messages can be lost on a crash.
+MESSAGE_BUFFER_SETTINGS = {
+    'flush_interval_ms': 1000,
+    'max_pending_events': 500,
+    'max_retry_keys': 50000     # (user, chat, day) counters kept for retry while writes fail; a larger failed batch is dropped
+}
+
+# Cache for ranks resolved through get_chat_member (seconds)
+RANK_CACHE_SETTINGS = {
+    'maxsize': 20000,
+    'ttl': 120,          # How long a resolved rank is trusted
+    'negative_ttl': 15   # API failures and users who left the chat
+}
+
+# Admin roster mirror (see data/roster.py)
+ROSTER_SETTINGS = {
+    'refresh_interval': 3600,   # Seconds before a chat's admins are re-fetched
+    'retry_after_failure': 60   # Seconds to fall back to get_chat_member after a failed load
+}
+
+# OpenAI image generation (see utils/image_generator.py)
+IMAGE_GENERATION_SETTINGS = {
+    'base_url': os.environ.get("OPENAI_BASE_URL") or None,  # Point at a local stand-in for testing
+    'response_format': 'b64_json',  # 'b64_json' skips the second download, 'url' streams it
+    'timeout': 120,          # Seconds per request (generation is slow)
+    'connect_timeout': 10,
+    'max_connections': 10,   # Pooled connections shared by API calls and downloads
+    'max_concurrency': 2,    # Generations running at the same time
+    'max_retries': 2,
+    'chunk_size': 65536      # Bytes per chunk when streaming a download
+}
+
+# Process pool for PIL/matplotlib rendering (see utils/render_engine.py)
+RENDER_SETTINGS = {
+    'workers': 2,
+    'max_in_flight': 4,      # Renders submitted to the pool at once
+    'font_path': "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    'preload_font_sizes': [80, 56, 32, 28]
+}
+
+# Telegram file_ids of uploaded images (see utils/asset_registry.py)
+ASSET_REGISTRY_SETTINGS = {
+    'max_cached': 5000   # file_ids kept in memory; the rest are read from asset_file_ids when needed
+}
+
+# Content-addressed cache of rendered images (see utils/render_cache.py)
+RENDER_CACHE_SETTINGS = {
+    'cache_dir': "images/rendered",
+    'memory_bytes': 16 * 1024 * 1024,  # PNG bytes kept in memory
+    'disk_bytes': 256 * 1024 * 1024    # PNG bytes kept on disk, oldest used files removed first
+}
+
+# In-memory /stats leaderboards (see data/leaderboard.py)
+LEADERBOARD_SETTINGS = {
+    'max_chats': 1000,   # Chats kept in memory, least recently used dropped first
+    'page_size': 20,
+    'max_range_days': 3660  # Longest /stats <from>..<to> window; longer ones keep their last days
+}
+
+# /find member search over the users_fts index (see data/database.py)
+MEMBER_SEARCH_SETTINGS = {
+    'page_size': 10,
+    'min_term_length': 2,   # Shorter words are ignored (prefix index covers 2 and 3 characters)
+    'max_terms': 5
+}
+
+# Member names per chat for resolving command targets (see data/name_index.py)
+NAME_INDEX_SETTINGS = {
+    'max_chats': 1000,     # Chats kept in memory, least recently used dropped first
+    'min_prefix': 2,       # Shortest query matched as a name prefix
+    'max_candidates': 5    # Members listed when a name is ambiguous
+}
+
+# Weekly/monthly rollups behind /stats day|week|month (see data/rollups.py)
+ROLLUP_SETTINGS = {
+    'reconcile_interval': 3600,  # Seconds between rebuilds of recent rollups
+    'reconcile_days': 62,        # Periods touching this many past days are rebuilt
+    'slice_pause': 0.05          # Seconds between chats so message flushes are not held up
+}
+
+# Retention and compaction job (see data/compaction.py)
+COMPACTION_SETTINGS = {
+    'run_interval': 86400,        # Seconds between runs
+    'initial_delay': 600,         # First run this many seconds after startup
+    'daily_retention_days': 180,  # Older daily/weekly rows are folded into monthly rollups (whole months)
+    'warning_ttl_days': 180,      # Warnings older than this stop counting; None keeps them forever
+    'archive_warnings': True,     # Move expired warnings to warnings_archive instead of deleting
+    'batch_size': 2000,           # Warnings handled per transaction
+    'vacuum_pages': 512,          # Free pages released per incremental_vacuum step
+    'analysis_limit': 1000,       # Rows sampled per index by each ANALYZE step
+    'file_id_retention_days': 30, # Stored file_ids not re-uploaded for this long are deleted (one re-upload if used again)
+    'slice_pause': 0.05           # Seconds between slices so message flushes are not held up
+}
+
+# Daily activity chart attached to /stats (see utils/activity_charts.py)
+STATS_CHART_SETTINGS = {
+    'enabled': True,
+    'days': 30,                # Days shown on the chart
+    'change_threshold': 50,    # New messages before today's chart is redrawn
+    'max_chats': 10000         # Chats whose last chart is remembered
+}
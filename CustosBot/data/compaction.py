@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+
+from config import COMPACTION_SETTINGS
+from data.database import Database
+from utils.periods import daily_horizon
+
+logger = logging.getLogger(__name__)
+
+# Tables re-analyzed after compaction, one per slice
+ANALYZE_TABLES = [
+    "message_stats", "message_stats_weekly", "message_stats_monthly",
+    "chat_members", "users", "warnings"
+]
+
+class CompactionJob:
+    """Scheduled retention and compaction for the database file.
+
+    Each run, in short transactions with a pause between them so message
+    flushes keep going:
+
+    - folds daily (and weekly) rows of whole months older than
+      ``daily_retention_days`` into message_stats_monthly, one chat-month
+      per slice
+    - moves warnings older than ``warning_ttl_days`` to warnings_archive
+      (or deletes them), ``batch_size`` per slice
+    - deletes Telegram file_ids not re-uploaded for ``file_id_retention_days``,
+      ``batch_size`` per slice
+    - releases free pages with PRAGMA incremental_vacuum, ``vacuum_pages``
+      per slice
+    - runs ANALYZE one table per slice with a bounded analysis_limit
+    """
+
+    def __init__(self, db: Database, settings: Optional[Dict] = None):
+        self.db = db
+        self.settings = {**COMPACTION_SETTINGS, **(settings or {})}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        """Start the background compaction loop"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the loop, abandoning a run between two slices"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def _pause(self) -> bool:
+        # Yield the writer between slices; False once stop() was called
+        await asyncio.sleep(self.settings['slice_pause'])
+        return not self._stopping
+
+    async def fold_old_stats(self) -> int:
+        """Fold daily rows older than the retention horizon into monthly rollups"""
+        horizon = daily_horizon(self.settings['daily_retention_days'])
+        folded = 0
+        for chat_id, month in await self.db.get_foldable_months(horizon):
+            folded += await self.db.fold_daily_stats(chat_id, month)
+            if not await self._pause():
+                break
+        return folded
+
+    async def expire_warnings(self) -> int:
+        """Archive or delete warnings past their TTL"""
+        ttl_days = self.settings['warning_ttl_days']
+        if not ttl_days:
+            return 0
+        issued_before = datetime.utcnow() - timedelta(days=ttl_days)
+        expired = 0
+        while True:
+            count = await self.db.expire_warnings(issued_before, self.settings['batch_size'],
+                                                  self.settings['archive_warnings'])
+            expired += count
+            if count < self.settings['batch_size'] or not await self._pause():
+                break
+        return expired
+
+    async def prune_file_ids(self) -> int:
+        """Delete stored file_ids of images not re-uploaded within the retention"""
+        updated_before = datetime.utcnow() - timedelta(days=self.settings['file_id_retention_days'])
+        pruned = 0
+        while True:
+            count = await self.db.prune_asset_file_ids(updated_before, self.settings['batch_size'])
+            pruned += count
+            if count < self.settings['batch_size'] or not await self._pause():
+                break
+        return pruned
+
+    async def vacuum(self) -> int:
+        """Release free pages in small steps; returns the pages released"""
+        free_pages = (await self.db.get_storage_stats())['freelist_count']
+        released = 0
+        while free_pages > 0:
+            remaining = await self.db.incremental_vacuum(self.settings['vacuum_pages'])
+            released += free_pages - remaining
+            if remaining >= free_pages or not await self._pause():
+                # auto_vacuum is not INCREMENTAL, or stop() was called
+                break
+            free_pages = remaining
+        return released
+
+    async def analyze(self):
+        """Refresh planner statistics one table at a time"""
+        for table in ANALYZE_TABLES:
+            await self.db.analyze_table(table, self.settings['analysis_limit'])
+            if not await self._pause():
+                break
+
+    async def run(self):
+        """One full compaction pass"""
+        before = await self.db.get_storage_stats()
+        folded = await self.fold_old_stats()
+        expired = await self.expire_warnings() if not self._stopping else 0
+        pruned = await self.prune_file_ids() if not self._stopping else 0
+        released = await self.vacuum() if not self._stopping else 0
+        if not self._stopping:
+            await self.analyze()
+        after = await self.db.get_storage_stats()
+        logger.info(
+            "Compaction: folded %s daily rows, expired %s warnings, pruned %s file_ids, "
+            "released %s pages; file %s KiB -> %s KiB",
+            folded, expired, pruned, released,
+            before['page_count'] * before['page_size'] // 1024,
+            after['page_count'] * after['page_size'] // 1024
+        )
+
+    async def _run(self):
+        delay = self.settings['initial_delay']
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                break
+            delay = self.settings['run_interval']
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error("Compaction failed: %s", e)
@@ -1,106 +1,441 @@
 import aiosqlite
 import asyncio
-from datetime import datetime
-from typing import Optional, List, Dict
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Tuple
 
+from config import DATABASE_SETTINGS, METRICS_SETTINGS
+from utils.cache import LRUCache
+from utils.metrics import metrics, timed_methods
+from utils.periods import week_start, month_end, split_range
+
+# Columns of users indexed by users_fts
+_FTS_COLUMNS = "username, first_name, last_name, nickname, description"
+
+def _fts_values(row: str) -> str:
+    """SQL for row's users_fts columns with ё folded into е"""
+    return ", ".join(f"replace(replace({row}.{column}, 'ё', 'е'), 'Ё', 'Е')"
+                     for column in _FTS_COLUMNS.split(", "))
+
+# Schema migrations: (version, description, statements). Versions are applied
+# in order and recorded in schema_version; never edit an applied migration,
+# append a new one instead.
+MIGRATIONS = [
+    (1, "initial tables", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            nickname TEXT,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chat_members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chat_id INTEGER,
+            rank TEXT DEFAULT 'participant',
+            message_count INTEGER DEFAULT 0,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, chat_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS warnings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chat_id INTEGER,
+            reason TEXT,
+            issued_by INTEGER,
+            issued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id INTEGER PRIMARY KEY,
+            title TEXT,
+            type TEXT,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS message_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chat_id INTEGER,
+            date TEXT,
+            count INTEGER DEFAULT 1,
+            UNIQUE(user_id, chat_id, date)
+        )
+        """,
+    ]),
+    (2, "lookup indexes", [
+        # find_user_by_username / find_user_by_nickname / find_user_by_name
+        "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)",
+        "CREATE INDEX IF NOT EXISTS idx_users_nickname ON users(nickname)",
+        "CREATE INDEX IF NOT EXISTS idx_users_first_name ON users(first_name)",
+        # get_warning_count
+        "CREATE INDEX IF NOT EXISTS idx_warnings_user_chat ON warnings(user_id, chat_id)",
+        # get_chat_stats: covering, already in leaderboard order
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_members_chat_count
+        ON chat_members(chat_id, message_count DESC, user_id)
+        """,
+        # get_staff_list
+        "CREATE INDEX IF NOT EXISTS idx_chat_members_chat_rank ON chat_members(chat_id, rank, user_id)",
+        # get_user_chats
+        "CREATE INDEX IF NOT EXISTS idx_chat_members_user_rank ON chat_members(user_id, chat_id, rank)",
+    ]),
+    (3, "telegram file_id cache", [
+        """
+        CREATE TABLE IF NOT EXISTS asset_file_ids (
+            asset_key TEXT PRIMARY KEY,
+            signature TEXT,
+            file_id TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (4, "daily activity index", [
+        # get_daily_activity: covering range scan per chat
+        "CREATE INDEX IF NOT EXISTS idx_message_stats_chat_date ON message_stats(chat_id, date, count)",
+    ]),
+    (5, "weekly and monthly message rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS message_stats_weekly (
+            chat_id INTEGER,
+            week TEXT,          -- Monday of the week, YYYY-MM-DD
+            user_id INTEGER,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, week, user_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS message_stats_monthly (
+            chat_id INTEGER,
+            month TEXT,         -- YYYY-MM
+            user_id INTEGER,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, month, user_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR REPLACE INTO message_stats_weekly (chat_id, week, user_id, count)
+        SELECT chat_id, date(date, 'weekday 0', '-6 days'), user_id, SUM(count)
+        FROM message_stats GROUP BY 1, 2, 3
+        """,
+        """
+        INSERT OR REPLACE INTO message_stats_monthly (chat_id, month, user_id, count)
+        SELECT chat_id, substr(date, 1, 7), user_id, SUM(count)
+        FROM message_stats GROUP BY 1, 2, 3
+        """,
+        # Daily leaderboards need user_id; this index also covers get_daily_activity
+        "DROP INDEX IF EXISTS idx_message_stats_chat_date",
+        "CREATE INDEX IF NOT EXISTS idx_message_stats_chat_date_user ON message_stats(chat_id, date, user_id, count)",
+    ]),
+    (6, "warning archive", [
+        """
+        CREATE TABLE IF NOT EXISTS warnings_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            chat_id INTEGER,
+            reason TEXT,
+            issued_by INTEGER,
+            issued_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # expire_warnings
+        "CREATE INDEX IF NOT EXISTS idx_warnings_issued_at ON warnings(issued_at)",
+    ]),
+    (7, "rate limiter", [
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit_hits (
+            chat_id INTEGER,
+            user_id INTEGER,
+            command TEXT,
+            used_at REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_rate_limit_hits_used_at ON rate_limit_hits(used_at)",
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit_overrides (
+            chat_id INTEGER,
+            name TEXT,          -- <command>_<rank>, as in config.RATE_LIMITS
+            uses INTEGER,
+            window REAL,
+            PRIMARY KEY (chat_id, name)
+        )
+        """,
+    ]),
+    (8, "member search", [
+        # External-content FTS5 index over users: stores only the index, the text stays in users.
+        # unicode61 does not fold ё into е, so the triggers index folded text (see _fts_values)
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            username, first_name, last_name, nickname, description,
+            content='users', content_rowid='user_id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, {_FTS_COLUMNS})
+            VALUES (new.user_id, {_fts_values('new')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, {_FTS_COLUMNS})
+            VALUES ('delete', old.user_id, {_fts_values('old')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS users_fts_update
+        AFTER UPDATE OF {_FTS_COLUMNS} ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, {_FTS_COLUMNS})
+            VALUES ('delete', old.user_id, {_fts_values('old')});
+            INSERT INTO users_fts (rowid, {_FTS_COLUMNS})
+            VALUES (new.user_id, {_fts_values('new')});
+        END
+        """,
+        # Not 'rebuild': that would index the unfolded text
+        f"INSERT INTO users_fts (rowid, {_FTS_COLUMNS}) SELECT user_id, {_fts_values('users')} FROM users",
+    ]),
+    (9, "file_id retention index", [
+        # load() reads the newest file_ids first; compaction deletes the oldest
+        "CREATE INDEX IF NOT EXISTS idx_asset_file_ids_updated_at ON asset_file_ids(updated_at)",
+    ]),
+]
+
+# bm25 weights of the users_fts columns: username, first_name, last_name, nickname, description
+MEMBER_SEARCH_WEIGHTS = (10.0, 5.0, 3.0, 8.0, 1.0)
+
+def fold_search_text(text: str) -> str:
+    """Fold ё into е, as the users_fts triggers do"""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+def member_search_query(text: str, min_length: int = 2, max_terms: int = 5) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word as a quoted prefix, all required"""
+    terms = []
+    for word in text.replace('@', ' ').split():
+        if len(word) >= min_length:
+            word = fold_search_text(word)
+            terms.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(terms[:max_terms]) or None
+
+DB_CALL_SECONDS = metrics.histogram('custos_db_call_seconds', "Database method duration in seconds",
+                                    ('method',), METRICS_SETTINGS['db_buckets'])
+DB_CALL_ERRORS = metrics.counter('custos_db_call_errors_total', "Database method calls that raised", ('method',))
+DB_WAIT_SECONDS = metrics.histogram('custos_db_wait_seconds', "Wait for a reader connection or the writer lock",
+                                    ('connection',), METRICS_SETTINGS['db_buckets'])
+
+@timed_methods(DB_CALL_SECONDS, DB_CALL_ERRORS)
 class Database:
-    def __init__(self, db_path: str = "data/custos.db"):
+    """Shared SQLite service: one writer connection plus a small reader pool.
+
+    Created once in main.main() and passed to handlers through the dispatcher
+    workflow data, so every handler receives it as the ``db`` argument.
+    """
+
+    def __init__(self, db_path: str = "data/custos.db", settings: Optional[Dict] = None):
         self.db_path = db_path
+        self.settings = {**DATABASE_SETTINGS, **(settings or {})}
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: Optional[asyncio.Queue] = None
+        self._reader_conns: List[aiosqlite.Connection] = []
+        # Last written (username, first_name, last_name) per user_id
+        self._identity_cache = LRUCache(self.settings['identity_cache_size'])
+    
+    async def _open_connection(self, readonly: bool = False) -> aiosqlite.Connection:
+        """Open a connection and apply the configured pragmas"""
+        conn = await aiosqlite.connect(self.db_path, timeout=self.settings['busy_timeout'] / 1000)
+        pragmas = [
+            f"busy_timeout = {int(self.settings['busy_timeout'])}",
+            f"synchronous = {self.settings['synchronous']}",
+            f"cache_size = {int(self.settings['cache_size'])}",
+            f"mmap_size = {int(self.settings['mmap_size'])}",
+            "temp_store = MEMORY",
+        ]
+        if readonly:
+            pragmas.append("query_only = ON")
+        for pragma in pragmas:
+            # Fetch results so no statement is left open holding a lock
+            await conn.execute_fetchall(f"PRAGMA {pragma}")
+        return conn
+    
+    async def connect(self):
+        """Open the writer connection and the reader pool (idempotent)"""
+        if self._writer is not None:
+            return
+        self._writer = await self._open_connection()
+        # WAL lets readers run while the writer holds its lock
+        await self._writer.execute_fetchall("PRAGMA journal_mode = WAL")
+        self._readers = asyncio.Queue()
+        for _ in range(max(1, int(self.settings['readers']))):
+            conn = await self._open_connection(readonly=True)
+            self._reader_conns.append(conn)
+            self._readers.put_nowait(conn)
+    
+    async def close(self):
+        """Close all pooled connections"""
+        for conn in self._reader_conns:
+            await conn.close()
+        self._reader_conns.clear()
+        self._readers = None
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+    
+    @asynccontextmanager
+    async def _read(self):
+        """Borrow a reader connection from the pool"""
+        if self._writer is None:
+            await self.connect()
+        started = time.perf_counter()
+        conn = await self._readers.get()
+        DB_WAIT_SECONDS.observe(time.perf_counter() - started, 'read')
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+    
+    @asynccontextmanager
+    async def _write(self):
+        """Run statements on the writer connection inside one transaction"""
+        if self._writer is None:
+            await self.connect()
+        started = time.perf_counter()
+        async with self._write_lock:
+            DB_WAIT_SECONDS.observe(time.perf_counter() - started, 'write')
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except Exception:
+                await self._writer.rollback()
+                raise
     
     async def init_db(self):
-        """Initialize database with required tables"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Users table
+        """Bring the schema up to date by applying pending migrations"""
+        async with self._write() as db:
             await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    nickname TEXT,
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
                     description TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
-            
-            # Chat members table with ranks
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS chat_members (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    chat_id INTEGER,
-                    rank TEXT DEFAULT 'participant',
-                    message_count INTEGER DEFAULT 0,
-                    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, chat_id)
-                )
-            """)
-            
-            # Warnings table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS warnings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    chat_id INTEGER,
-                    reason TEXT,
-                    issued_by INTEGER,
-                    issued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Chats table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS chats (
-                    chat_id INTEGER PRIMARY KEY,
-                    title TEXT,
-                    type TEXT,
-                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Message statistics
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS message_stats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    chat_id INTEGER,
-                    date TEXT,
-                    count INTEGER DEFAULT 1,
-                    UNIQUE(user_id, chat_id, date)
-                )
-            """)
-            
-            await db.commit()
+            cursor = await db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            current_version = (await cursor.fetchone())[0]
+        
+        for version, description, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+            # Each migration is applied atomically together with its version row
+            async with self._write() as db:
+                for statement in statements:
+                    await db.execute(statement)
+                await db.execute("""
+                    INSERT INTO schema_version (version, description) VALUES (?, ?)
+                """, (version, description))
+        
+        # Refresh planner statistics so new indexes are picked up
+        async with self._write() as db:
+            await db.execute("PRAGMA optimize")
+        
+        if self.settings['incremental_vacuum']:
+            await self._enable_incremental_vacuum()
+    
+    async def _enable_incremental_vacuum(self):
+        # auto_vacuum can only change with a full VACUUM; done once, before the bot starts polling
+        async with self._write_lock:
+            mode = (await self._writer.execute_fetchall("PRAGMA auto_vacuum"))[0][0]
+            if mode == 2:
+                return
+            await self._writer.execute_fetchall("PRAGMA auto_vacuum = INCREMENTAL")
+            await self._writer.execute_fetchall("VACUUM")
+    
+    _UPSERT_USER_SQL = """
+        INSERT INTO users (user_id, username, first_name, last_name)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            username = excluded.username,
+            first_name = excluded.first_name,
+            last_name = excluded.last_name
+        WHERE users.username IS NOT excluded.username
+           OR users.first_name IS NOT excluded.first_name
+           OR users.last_name IS NOT excluded.last_name
+    """
+    
+    def _changed_profiles(self, profiles: Dict[int, tuple]) -> Dict[int, tuple]:
+        """Drop profiles identical to the last ones written"""
+        return {
+            user_id: profile for user_id, profile in profiles.items()
+            if self._identity_cache.get(user_id) != profile
+        }
+    
+    def _remember_profiles(self, profiles: Dict[int, tuple]):
+        for user_id, profile in profiles.items():
+            self._identity_cache.set(user_id, profile)
     
     async def add_user(self, user_id: int, username: Optional[str] = None, first_name: Optional[str] = None, last_name: Optional[str] = None):
-        """Add or update user in database"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO users (user_id, username, first_name, last_name)
-                VALUES (?, ?, ?, ?)
-            """, (user_id, username, first_name, last_name))
-            await db.commit()
+        """Add user or update their Telegram profile if it changed"""
+        profiles = self._changed_profiles({user_id: (username, first_name, last_name)})
+        if not profiles:
+            return
+        async with self._write() as db:
+            await db.execute(self._UPSERT_USER_SQL, (user_id, username, first_name, last_name))
+        self._remember_profiles(profiles)
     
     async def add_chat_member(self, user_id: int, chat_id: int, rank: str = 'participant'):
         """Add user to chat with specified rank"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 INSERT OR IGNORE INTO chat_members (user_id, chat_id, rank)
                 VALUES (?, ?, ?)
             """, (user_id, chat_id, rank))
-            await db.commit()
     
     async def update_user_rank(self, user_id: int, chat_id: int, new_rank: str):
         """Update user rank in specific chat"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE chat_members SET rank = ? WHERE user_id = ? AND chat_id = ?
             """, (new_rank, user_id, chat_id))
-            await db.commit()
+    
+    async def set_user_rank(self, user_id: int, chat_id: int, rank: str):
+        """Insert chat member or change their rank in one statement"""
+        async with self._write() as db:
+            await db.execute("""
+                INSERT INTO chat_members (user_id, chat_id, rank) VALUES (?, ?, ?)
+                ON CONFLICT(user_id, chat_id) DO UPDATE SET rank = excluded.rank
+                WHERE chat_members.rank IS NOT excluded.rank
+            """, (user_id, chat_id, rank))
+    
+    async def sync_chat_admins(self, chat_id: int, admins: Dict[int, str]):
+        """Store Telegram owners/administrators and demote those no longer on the list"""
+        async with self._write() as db:
+            await db.executemany("""
+                INSERT INTO chat_members (user_id, chat_id, rank) VALUES (?, ?, ?)
+                ON CONFLICT(user_id, chat_id) DO UPDATE SET rank = excluded.rank
+                WHERE chat_members.rank IS NOT excluded.rank
+            """, [(user_id, chat_id, rank) for user_id, rank in admins.items()])
+            
+            placeholders = ",".join("?" * len(admins))
+            await db.execute(f"""
+                UPDATE chat_members SET rank = 'participant'
+                WHERE chat_id = ? AND rank IN ('owner', 'administrator')
+                  AND user_id NOT IN ({placeholders})
+            """, (chat_id, *admins.keys()))
     
     async def get_user_rank(self, user_id: int, chat_id: int) -> Optional[str]:
         """Get user rank in specific chat"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT rank FROM chat_members WHERE user_id = ? AND chat_id = ?
             """, (user_id, chat_id))
@@ -109,16 +444,15 @@ class Database:
     
     async def add_warning(self, user_id: int, chat_id: int, reason: str, issued_by: int):
         """Add warning to user"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 INSERT INTO warnings (user_id, chat_id, reason, issued_by)
                 VALUES (?, ?, ?, ?)
             """, (user_id, chat_id, reason, issued_by))
-            await db.commit()
     
     async def get_warning_count(self, user_id: int, chat_id: int) -> int:
         """Get warning count for user in chat"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT COUNT(*) FROM warnings WHERE user_id = ? AND chat_id = ?
             """, (user_id, chat_id))
@@ -127,23 +461,21 @@ class Database:
     
     async def set_user_nickname(self, user_id: int, nickname: str):
         """Set user nickname"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE users SET nickname = ? WHERE user_id = ?
             """, (nickname, user_id))
-            await db.commit()
     
     async def set_user_description(self, user_id: int, description: str):
         """Set user description"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE users SET description = ? WHERE user_id = ?
             """, (description, user_id))
-            await db.commit()
     
     async def get_user_info(self, user_id: int) -> Optional[Dict]:
         """Get user information"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT username, first_name, last_name, nickname, description 
                 FROM users WHERE user_id = ?
@@ -161,7 +493,7 @@ class Database:
     
     async def get_staff_list(self, chat_id: int) -> Dict[str, List]:
         """Get staff list organized by rank"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT u.user_id, u.username, u.first_name, u.nickname, cm.rank
                 FROM users u
@@ -193,16 +525,15 @@ class Database:
     
     async def add_chat(self, chat_id: int, title: str, chat_type: str):
         """Add chat to database"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 INSERT OR REPLACE INTO chats (chat_id, title, type)
                 VALUES (?, ?, ?)
             """, (chat_id, title, chat_type))
-            await db.commit()
     
     async def get_user_chats(self, user_id: int) -> List[Dict]:
         """Get list of chats where user is a member"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT c.chat_id, c.title, c.type, cm.rank
                 FROM chats c
@@ -222,30 +553,57 @@ class Database:
             
             return chats
     
-    async def increment_message_count(self, user_id: int, chat_id: int):
-        """Increment user message count for today"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR IGNORE INTO message_stats (user_id, chat_id, date, count)
-                VALUES (?, ?, ?, 1)
-            """, (user_id, chat_id, today))
-            
-            await db.execute("""
-                UPDATE message_stats SET count = count + 1 
-                WHERE user_id = ? AND chat_id = ? AND date = ?
-            """, (user_id, chat_id, today))
-            
-            await db.execute("""
-                UPDATE chat_members SET message_count = message_count + 1
+    async def apply_message_batch(self, profiles: Dict[int, tuple], counts: Dict[tuple, int]):
+        """Apply buffered profiles and per-(user, chat, day) message counts in one transaction"""
+        profiles = self._changed_profiles(profiles)
+        member_counts: Dict[tuple, int] = {}
+        weekly_counts: Dict[tuple, int] = {}
+        monthly_counts: Dict[tuple, int] = {}
+        for (user_id, chat_id, day), count in counts.items():
+            member_counts[(user_id, chat_id)] = member_counts.get((user_id, chat_id), 0) + count
+            week = (chat_id, week_start(date.fromisoformat(day)).isoformat(), user_id)
+            weekly_counts[week] = weekly_counts.get(week, 0) + count
+            month = (chat_id, day[:7], user_id)
+            monthly_counts[month] = monthly_counts.get(month, 0) + count
+
+        async with self._write() as db:
+            await db.executemany(self._UPSERT_USER_SQL, [
+                (user_id, *profile) for user_id, profile in profiles.items()
+            ])
+
+            await db.executemany("""
+                INSERT OR IGNORE INTO chat_members (user_id, chat_id)
+                VALUES (?, ?)
+            """, list(member_counts.keys()))
+
+            await db.executemany("""
+                INSERT INTO message_stats (user_id, chat_id, date, count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id, chat_id, date) DO UPDATE SET count = count + excluded.count
+            """, [(*key, count) for key, count in counts.items()])
+
+            # Rollups, kept in step with message_stats (see data/rollups.py)
+            await db.executemany("""
+                INSERT INTO message_stats_weekly (chat_id, week, user_id, count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(chat_id, week, user_id) DO UPDATE SET count = count + excluded.count
+            """, [(*key, count) for key, count in weekly_counts.items()])
+
+            await db.executemany("""
+                INSERT INTO message_stats_monthly (chat_id, month, user_id, count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(chat_id, month, user_id) DO UPDATE SET count = count + excluded.count
+            """, [(*key, count) for key, count in monthly_counts.items()])
+
+            await db.executemany("""
+                UPDATE chat_members SET message_count = message_count + ?
                 WHERE user_id = ? AND chat_id = ?
-            """, (user_id, chat_id))
-            
-            await db.commit()
-    
+            """, [(count, user_id, chat_id) for (user_id, chat_id), count in member_counts.items()])
+        self._remember_profiles(profiles)
+
     async def get_user_message_count(self, user_id: int, chat_id: int) -> int:
         """Get total message count for user in chat"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT message_count FROM chat_members 
                 WHERE user_id = ? AND chat_id = ?
@@ -255,7 +613,7 @@ class Database:
     
     async def get_chat_stats(self, chat_id: int, limit: int = 20):
         """Get chat statistics - top active users"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT 
                     u.user_id,
@@ -271,12 +629,225 @@ class Database:
             """, (chat_id, limit))
             return await cursor.fetchall()
     
+    async def get_chat_message_counts(self, chat_id: int) -> List[tuple]:
+        """Get (user_id, message_count) of every member who wrote, most active first"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT user_id, message_count FROM chat_members
+                WHERE chat_id = ? AND message_count > 0
+                ORDER BY message_count DESC, user_id
+            """, (chat_id,))
+            return await cursor.fetchall()
+    
+    async def get_user_names(self, user_ids: List[int]) -> Dict[int, tuple]:
+        """Get {user_id: (nickname, first_name, username)} for the given users"""
+        if not user_ids:
+            return {}
+        placeholders = ", ".join("?" * len(user_ids))
+        async with self._read() as db:
+            cursor = await db.execute(f"""
+                SELECT user_id, nickname, first_name, username FROM users
+                WHERE user_id IN ({placeholders})
+            """, user_ids)
+            return {row[0]: tuple(row[1:]) for row in await cursor.fetchall()}
+    
+    async def get_daily_activity(self, chat_id: int, since: str) -> List[tuple]:
+        """Get (date, message count) per day for a chat, starting at since (YYYY-MM-DD)"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT date, SUM(count) FROM message_stats
+                WHERE chat_id = ? AND date >= ?
+                GROUP BY date
+                ORDER BY date
+            """, (chat_id, since))
+            return await cursor.fetchall()
+    
+    async def get_window_leaderboard(self, chat_id: int, start: date, end: date,
+                                     limit: int = 20, offset: int = 0) -> Tuple[List[tuple], int]:
+        """Top members for the days start..end from the rollup tables.
+
+        Returns rows (user_id, nickname, first_name, username, count) and the
+        number of members who wrote in the window.
+        """
+        months, weeks, days = split_range(start, end)
+        parts, params = [], []
+        for table, column, keys in (("message_stats_monthly", "month", months),
+                                    ("message_stats_weekly", "week", weeks),
+                                    ("message_stats", "date", days)):
+            if keys:
+                placeholders = ", ".join("?" * len(keys))
+                parts.append(f"SELECT user_id, count FROM {table} "
+                             f"WHERE chat_id = ? AND {column} IN ({placeholders})")
+                params += [chat_id, *keys]
+        
+        async with self._read() as db:
+            cursor = await db.execute(f"""
+                WITH totals AS (
+                    SELECT user_id, SUM(count) AS total
+                    FROM ({" UNION ALL ".join(parts)})
+                    GROUP BY user_id
+                    HAVING total > 0
+                )
+                SELECT t.user_id, u.nickname, u.first_name, u.username, t.total,
+                       (SELECT COUNT(*) FROM totals)
+                FROM totals t
+                LEFT JOIN users u ON u.user_id = t.user_id
+                ORDER BY t.total DESC, t.user_id
+                LIMIT ? OFFSET ?
+            """, (*params, limit, offset))
+            rows = await cursor.fetchall()
+        
+        if not rows:
+            return [], 0
+        return [tuple(row[:5]) for row in rows], rows[0][5]
+    
+    async def get_rollup_chats(self, since: date) -> List[int]:
+        """Get chats with daily rows or rollups in periods from since onwards"""
+        week_since = week_start(since).isoformat()
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT chat_id FROM message_stats WHERE date >= ?
+                UNION SELECT chat_id FROM message_stats_weekly WHERE week >= ?
+                UNION SELECT chat_id FROM message_stats_monthly WHERE month >= ?
+            """, (week_since, week_since, since.strftime('%Y-%m')))
+            return [row[0] for row in await cursor.fetchall()]
+    
+    async def reconcile_chat_rollups(self, chat_id: int, since: date):
+        """Rebuild a chat's weekly and monthly rollups for every period from since onwards from message_stats"""
+        week_since = week_start(since).isoformat()
+        month_since = since.strftime('%Y-%m')
+        async with self._write() as db:
+            await db.execute("DELETE FROM message_stats_weekly WHERE chat_id = ? AND week >= ?",
+                             (chat_id, week_since))
+            await db.execute("""
+                INSERT INTO message_stats_weekly (chat_id, week, user_id, count)
+                SELECT chat_id, date(date, 'weekday 0', '-6 days'), user_id, SUM(count)
+                FROM message_stats WHERE chat_id = ? AND date >= ?
+                GROUP BY 1, 2, 3
+            """, (chat_id, week_since))
+            await db.execute("DELETE FROM message_stats_monthly WHERE chat_id = ? AND month >= ?",
+                             (chat_id, month_since))
+            await db.execute("""
+                INSERT INTO message_stats_monthly (chat_id, month, user_id, count)
+                SELECT chat_id, substr(date, 1, 7), user_id, SUM(count)
+                FROM message_stats WHERE chat_id = ? AND date >= ?
+                GROUP BY 1, 2, 3
+            """, (chat_id, month_since + "-01"))
+    
+    async def get_rate_limit_hits(self, since: float) -> List[tuple]:
+        """Get (chat_id, user_id, command, used_at) of command uses after since, oldest first"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT chat_id, user_id, command, used_at FROM rate_limit_hits
+                WHERE used_at >= ? ORDER BY used_at
+            """, (since,))
+            return await cursor.fetchall()
+    
+    async def save_rate_limit_hits(self, hits: List[tuple], expired_before: float):
+        """Store a batch of (chat_id, user_id, command, used_at) and drop expired ones"""
+        async with self._write() as db:
+            await db.executemany("""
+                INSERT INTO rate_limit_hits (chat_id, user_id, command, used_at) VALUES (?, ?, ?, ?)
+            """, hits)
+            await db.execute("DELETE FROM rate_limit_hits WHERE used_at < ?", (expired_before,))
+    
+    async def get_rate_limit_overrides(self) -> List[tuple]:
+        """Get per-chat rate limits as (chat_id, name, uses, window)"""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT chat_id, name, uses, window FROM rate_limit_overrides")
+            return await cursor.fetchall()
+    
+    async def set_rate_limit_override(self, chat_id: int, name: str, uses: Optional[int], window: Optional[float]):
+        """Set (or with uses=None, remove) a chat's own rate limit"""
+        async with self._write() as db:
+            if uses is None:
+                await db.execute("DELETE FROM rate_limit_overrides WHERE chat_id = ? AND name = ?",
+                                 (chat_id, name))
+            else:
+                await db.execute("""
+                    INSERT OR REPLACE INTO rate_limit_overrides (chat_id, name, uses, window)
+                    VALUES (?, ?, ?, ?)
+                """, (chat_id, name, uses, window))
+    
+    async def get_foldable_months(self, horizon: date) -> List[tuple]:
+        """Get (chat_id, 'YYYY-MM') pairs that still have daily rows before the horizon"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT DISTINCT chat_id, substr(date, 1, 7) FROM message_stats
+                WHERE date < ?
+                ORDER BY 1, 2
+            """, (horizon.isoformat(),))
+            return await cursor.fetchall()
+    
+    async def fold_daily_stats(self, chat_id: int, month: str) -> int:
+        """Fold a chat's daily rows for one month into the monthly rollup and drop them.
+
+        Weekly rows starting in that month go too: windows reaching back
+        this far are answered in whole months (see utils.periods).
+        """
+        first_day = date.fromisoformat(f"{month}-01")
+        next_month = (month_end(first_day) + timedelta(days=1)).isoformat()
+        async with self._write() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO message_stats_monthly (chat_id, month, user_id, count)
+                SELECT chat_id, ?, user_id, SUM(count) FROM message_stats
+                WHERE chat_id = ? AND date >= ? AND date < ?
+                GROUP BY chat_id, user_id
+            """, (month, chat_id, first_day.isoformat(), next_month))
+            cursor = await db.execute("""
+                DELETE FROM message_stats WHERE chat_id = ? AND date >= ? AND date < ?
+            """, (chat_id, first_day.isoformat(), next_month))
+            folded = cursor.rowcount
+            await db.execute("""
+                DELETE FROM message_stats_weekly WHERE chat_id = ? AND week < ?
+            """, (chat_id, next_month))
+        return folded
+    
+    async def expire_warnings(self, issued_before: datetime, limit: int, archive: bool = True) -> int:
+        """Move (or delete) up to limit warnings issued before the given time; returns how many"""
+        async with self._write() as db:
+            cursor = await db.execute("""
+                SELECT id FROM warnings WHERE issued_at < ? ORDER BY issued_at LIMIT ?
+            """, (issued_before.strftime('%Y-%m-%d %H:%M:%S'), limit))
+            ids = [row[0] for row in await cursor.fetchall()]
+            if not ids:
+                return 0
+            placeholders = ", ".join("?" * len(ids))
+            if archive:
+                await db.execute(f"""
+                    INSERT OR REPLACE INTO warnings_archive (id, user_id, chat_id, reason, issued_by, issued_at)
+                    SELECT id, user_id, chat_id, reason, issued_by, issued_at FROM warnings
+                    WHERE id IN ({placeholders})
+                """, ids)
+            await db.execute(f"DELETE FROM warnings WHERE id IN ({placeholders})", ids)
+        return len(ids)
+    
+    async def get_storage_stats(self) -> Dict[str, int]:
+        """Get page_size, page_count and freelist_count of the database file"""
+        async with self._read() as db:
+            stats = {}
+            for pragma in ("page_size", "page_count", "freelist_count"):
+                stats[pragma] = (await db.execute_fetchall(f"PRAGMA {pragma}"))[0][0]
+            return stats
+    
+    async def incremental_vacuum(self, pages: int) -> int:
+        """Return up to pages free pages to the filesystem; returns the free pages left"""
+        async with self._write() as db:
+            await db.execute_fetchall(f"PRAGMA incremental_vacuum({int(pages)})")
+            return (await db.execute_fetchall("PRAGMA freelist_count"))[0][0]
+    
+    async def analyze_table(self, table: str, analysis_limit: int):
+        """Refresh planner statistics for one table, sampling at most analysis_limit rows per index"""
+        async with self._write() as db:
+            await db.execute_fetchall(f"PRAGMA analysis_limit = {int(analysis_limit)}")
+            await db.execute(f"ANALYZE {table}")
+    
     async def find_user_by_username(self, username: str, chat_id: int) -> Optional[int]:
         """Find user ID by username in specific chat"""
         # Remove @ if present
         clean_username = username.lstrip('@')
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT u.user_id FROM users u
                 JOIN chat_members cm ON u.user_id = cm.user_id
@@ -287,7 +858,7 @@ class Database:
     
     async def find_user_by_nickname(self, nickname: str, chat_id: int) -> Optional[int]:
         """Find user ID by nickname in specific chat"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT u.user_id FROM users u
                 JOIN chat_members cm ON u.user_id = cm.user_id
@@ -298,7 +869,7 @@ class Database:
     
     async def find_user_by_name(self, name: str, chat_id: int) -> Optional[int]:
         """Find user ID by first name in specific chat"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute("""
                 SELECT u.user_id FROM users u
                 JOIN chat_members cm ON u.user_id = cm.user_id
@@ -307,8 +878,87 @@ class Database:
             result = await cursor.fetchone()
             return result[0] if result else None
     
+    async def get_chat_member_names(self, chat_id: int) -> List[tuple]:
+        """Get (user_id, username, nickname, first_name) of every member of a chat"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT u.user_id, u.username, u.nickname, u.first_name FROM chat_members cm
+                JOIN users u ON u.user_id = cm.user_id
+                WHERE cm.chat_id = ?
+            """, (chat_id,))
+            return await cursor.fetchall()
+    
+    async def search_chat_members(self, chat_id: int, match: str, limit: int, offset: int = 0) -> Tuple[List[tuple], int]:
+        """Members of a chat matching an FTS5 query, best first.
+        
+        Returns ((user_id, username, first_name, last_name, nickname, message_count) rows, total matches).
+        CROSS JOIN keeps the FTS scan outermost; otherwise SQLite walks every
+        member of a big chat and runs the whole MATCH for each of them.
+        """
+        weights = ", ".join(str(weight) for weight in MEMBER_SEARCH_WEIGHTS)
+        async with self._read() as db:
+            cursor = await db.execute(f"""
+                SELECT u.user_id, u.username, u.first_name, u.last_name, u.nickname, cm.message_count
+                FROM users_fts
+                CROSS JOIN chat_members cm ON cm.user_id = users_fts.rowid AND cm.chat_id = ?
+                JOIN users u ON u.user_id = users_fts.rowid
+                WHERE users_fts MATCH ?
+                ORDER BY bm25(users_fts, {weights}), cm.message_count DESC
+                LIMIT ? OFFSET ?
+            """, (chat_id, match, limit, offset))
+            rows = await cursor.fetchall()
+            cursor = await db.execute("""
+                SELECT COUNT(*) FROM users_fts
+                CROSS JOIN chat_members cm ON cm.user_id = users_fts.rowid AND cm.chat_id = ?
+                WHERE users_fts MATCH ?
+            """, (chat_id, match))
+            total = (await cursor.fetchone())[0]
+        return rows, total
+    
     async def ensure_user_exists(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None, chat_id: int = None):
         """Ensure user exists in database and optionally add to chat"""
         await self.add_user(user_id, username, first_name, last_name)
         if chat_id:
-            await self.add_chat_member(user_id, chat_id)
\ No newline at end of file
+            await self.add_chat_member(user_id, chat_id)
+    
+    async def get_asset_file_ids(self, limit: int) -> List[tuple]:
+        """Get the limit most recently stored file_ids as (asset_key, signature, file_id), oldest first"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT asset_key, signature, file_id FROM asset_file_ids
+                ORDER BY updated_at DESC LIMIT ?
+            """, (limit,))
+            return list(reversed(await cursor.fetchall()))
+    
+    async def get_asset_file_id(self, asset_key: str) -> Optional[tuple]:
+        """Get (signature, file_id) stored for one asset"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT signature, file_id FROM asset_file_ids WHERE asset_key = ?
+            """, (asset_key,))
+            row = await cursor.fetchone()
+            return (row[0], row[1]) if row else None
+    
+    async def prune_asset_file_ids(self, updated_before: datetime, limit: int) -> int:
+        """Delete up to limit file_ids last stored before the given time; returns how many"""
+        async with self._write() as db:
+            cursor = await db.execute("""
+                DELETE FROM asset_file_ids WHERE rowid IN (
+                    SELECT rowid FROM asset_file_ids WHERE updated_at < ? ORDER BY updated_at LIMIT ?
+                )
+            """, (updated_before.strftime('%Y-%m-%d %H:%M:%S'), limit))
+            return cursor.rowcount
+    
+    async def set_asset_file_id(self, asset_key: str, signature: str, file_id: Optional[str]):
+        """Store (or with file_id=None, forget) the Telegram file_id of an asset"""
+        async with self._write() as db:
+            if file_id is None:
+                await db.execute("DELETE FROM asset_file_ids WHERE asset_key = ?", (asset_key,))
+            else:
+                await db.execute("""
+                    INSERT INTO asset_file_ids (asset_key, signature, file_id) VALUES (?, ?, ?)
+                    ON CONFLICT(asset_key) DO UPDATE SET
+                        signature = excluded.signature,
+                        file_id = excluded.file_id,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (asset_key, signature, file_id))
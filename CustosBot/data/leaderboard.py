@@ -0,0 +1,91 @@
+import asyncio
+from bisect import bisect_left, insort
+from typing import Optional, Dict, List, Tuple
+
+from config import LEADERBOARD_SETTINGS
+from data.database import Database
+from utils.cache import LRUCache
+
+class ChatLeaderboard:
+    """Members of one chat ordered by message count.
+
+    ``order`` holds (-count, user_id) tuples sorted ascending, the same order
+    as idx_chat_members_chat_count, so a page is a slice and an increment is
+    one removal and one insertion.
+    """
+
+    def __init__(self, rows: List[Tuple[int, int]]):
+        # rows: (user_id, message_count), already sorted by count DESC, user_id
+        self.counts: Dict[int, int] = {}
+        self.order: List[Tuple[int, int]] = []
+        for user_id, count in rows:
+            self.counts[user_id] = count
+            self.order.append((-count, user_id))
+
+    def add(self, user_id: int, delta: int):
+        """Add delta messages to a member and move them to their new place"""
+        old = self.counts.get(user_id)
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, user_id))]
+        new = (old or 0) + delta
+        self.counts[user_id] = new
+        insort(self.order, (-new, user_id))
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, int]]:
+        """(user_id, count) for places offset+1 .. offset+limit"""
+        return [(user_id, -negative) for negative, user_id in self.order[offset:offset + limit]]
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+class Leaderboard:
+    """Per-chat message leaderboards kept in memory for /stats.
+
+    A chat is loaded from chat_members on its first /stats and then updated
+    by MessageBuffer after every flush, so reading a page costs only the
+    page. ``lock`` is held by the buffer around writing a batch and applying
+    it here, and by loads, so a load never misses or double counts a batch.
+    """
+
+    def __init__(self, db: Database, settings: Optional[Dict] = None):
+        self.db = db
+        self.settings = {**LEADERBOARD_SETTINGS, **(settings or {})}
+        self.lock = asyncio.Lock()
+        self._chats = LRUCache(maxsize=self.settings['max_chats'])
+
+    def apply_counts(self, counts: Dict[Tuple[int, int, str], int]):
+        """Apply a flushed MessageBuffer batch to the chats in memory"""
+        for (user_id, chat_id, _), count in counts.items():
+            board = self._chats.get(chat_id)
+            if board is not None:
+                board.add(user_id, count)
+
+    async def get_chat(self, chat_id: int) -> ChatLeaderboard:
+        """Leaderboard of a chat, loading it from the database on a miss"""
+        board = self._chats.get(chat_id)
+        if board is None:
+            async with self.lock:
+                board = self._chats.get(chat_id)
+                if board is None:
+                    board = ChatLeaderboard(await self.db.get_chat_message_counts(chat_id))
+                    self._chats.set(chat_id, board)
+        return board
+
+    async def get_page(self, chat_id: int, page: int = 1) -> Tuple[List[tuple], int]:
+        """Rows (place, user_id, nickname, first_name, username, count) for a page, and the page count"""
+        page_size = self.settings['page_size']
+        board = await self.get_chat(chat_id)
+        pages = max(1, -(-len(board) // page_size))
+        offset = (page - 1) * page_size
+        entries = board.page(offset, page_size)
+        names = await self.db.get_user_names([user_id for user_id, _ in entries])
+
+        rows = []
+        for place, (user_id, count) in enumerate(entries, offset + 1):
+            nickname, first_name, username = names.get(user_id, (None, None, None))
+            rows.append((place, user_id, nickname, first_name, username, count))
+        return rows, pages
+
+    def forget_chat(self, chat_id: int):
+        """Drop a chat the bot is no longer part of"""
+        self._chats.pop(chat_id)
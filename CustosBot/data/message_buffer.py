@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Tuple
+
+from config import MESSAGE_BUFFER_SETTINGS
+from data.database import Database
+from data.leaderboard import Leaderboard
+from data.name_index import NameIndex
+
+logger = logging.getLogger(__name__)
+
+class MessageBuffer:
+    """Write-behind accumulator for message counters coming from track_messages.
+
+    Increments are merged per (user, chat, day) and the latest profile per
+    user is kept; everything is written in a single transaction every
+    ``flush_interval_ms`` or as soon as ``max_pending_events`` messages are
+    pending, whichever comes first. Together these two settings bound how
+    many counted messages can be lost if the process dies. A batch that
+    fails to write is retried with the next one, unless that would hold
+    more than ``max_retry_keys`` counters; then it is dropped and counted
+    in ``stats``. Written batches
+    are also applied to the in-memory leaderboard, when one is given, and
+    authors' names go straight to the name index.
+    """
+
+    def __init__(self, db: Database, settings: Optional[Dict] = None,
+                 leaderboard: Optional[Leaderboard] = None, name_index: Optional[NameIndex] = None):
+        self.db = db
+        self.leaderboard = leaderboard
+        self.name_index = name_index
+        self.settings = {**MESSAGE_BUFFER_SETTINGS, **(settings or {})}
+        self._profiles: Dict[int, Tuple] = {}
+        self._counts: Dict[Tuple[int, int, str], int] = {}
+        self._pending = 0
+        self.stats = {'flushes': 0, 'failed_flushes': 0, 'dropped_messages': 0}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def pending(self) -> int:
+        """Number of messages recorded but not yet written"""
+        return self._pending
+
+    def record_message(self, user_id: int, chat_id: int, username: Optional[str] = None,
+                       first_name: Optional[str] = None, last_name: Optional[str] = None):
+        """Count one message and remember the author's profile"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        self._profiles[user_id] = (username, first_name, last_name)
+        key = (user_id, chat_id, today)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self._pending += 1
+        if self.name_index is not None:
+            self.name_index.observe(chat_id, user_id, username, first_name)
+        if self._pending >= self.settings['max_pending_events']:
+            self._wakeup.set()
+
+    def start(self):
+        """Start the background flush loop"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still pending"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        interval = self.settings['flush_interval_ms'] / 1000
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Message counter flush failed: %s", e)
+
+    async def flush(self):
+        """Write all pending counters and profiles in one transaction"""
+        async with self._flush_lock:
+            if not self._counts and not self._profiles:
+                return
+            profiles, counts = self._profiles, self._counts
+            self._profiles, self._counts = {}, {}
+            pending, self._pending = self._pending, 0
+            try:
+                await self._write_batch(profiles, counts)
+            except Exception:
+                self.stats['failed_flushes'] += 1
+                if len(counts) + len(self._counts) > self.settings['max_retry_keys']:
+                    # The database has been failing for a while; keep memory bounded
+                    self.stats['dropped_messages'] += pending
+                    logger.warning("Dropped a failed batch of %s counted messages", pending)
+                    raise
+                # Put the batch back so the next flush retries it
+                for user_id, profile in profiles.items():
+                    self._profiles.setdefault(user_id, profile)
+                for key, count in counts.items():
+                    self._counts[key] = self._counts.get(key, 0) + count
+                self._pending += pending
+                raise
+            self.stats['flushes'] += 1
+
+    async def _write_batch(self, profiles: Dict[int, Tuple], counts: Dict[Tuple[int, int, str], int]):
+        if self.leaderboard is None:
+            await self.db.apply_message_batch(profiles, counts)
+            return
+        async with self.leaderboard.lock:
+            await self.db.apply_message_batch(profiles, counts)
+            self.leaderboard.apply_counts(counts)
@@ -0,0 +1,174 @@
+import asyncio
+from bisect import bisect_left, insort
+from typing import Optional, Dict, List, Set, Tuple
+
+from config import NAME_INDEX_SETTINGS
+from data.database import Database
+from utils.cache import LRUCache
+
+# Name fields in the order an exact match wins
+USERNAME, NICKNAME, FIRST_NAME = 0, 1, 2
+
+def _key(name: str) -> str:
+    return name.casefold()
+
+class ChatNameIndex:
+    """Usernames, nicknames and first names of one chat's members.
+
+    ``names`` maps a case-folded name to the (field, user_id) pairs that
+    carry it, so an exact lookup is one dict access; ``keys`` is the same
+    set of names kept sorted for prefix lookups.
+    """
+
+    def __init__(self, rows: List[tuple]):
+        # rows: (user_id, username, nickname, first_name)
+        self.members: Dict[int, Tuple[Optional[str], Optional[str], Optional[str]]] = {}
+        self.names: Dict[str, Set[Tuple[int, int]]] = {}
+        self.keys: List[str] = []
+        for user_id, username, nickname, first_name in rows:
+            self.update(user_id, username, nickname, first_name)
+
+    def _add(self, name: Optional[str], field: int, user_id: int):
+        if not name:
+            return
+        key = _key(name)
+        entries = self.names.get(key)
+        if entries is None:
+            entries = self.names[key] = set()
+            insort(self.keys, key)
+        entries.add((field, user_id))
+
+    def _remove(self, name: Optional[str], field: int, user_id: int):
+        if not name:
+            return
+        key = _key(name)
+        entries = self.names.get(key)
+        if entries is None:
+            return
+        entries.discard((field, user_id))
+        if not entries:
+            del self.names[key]
+            del self.keys[bisect_left(self.keys, key)]
+
+    def update(self, user_id: int, username: Optional[str], nickname: Optional[str], first_name: Optional[str]):
+        """Add a member or replace their names"""
+        new = (username, nickname, first_name)
+        old = self.members.get(user_id)
+        if old == new:
+            return
+        for field, name in enumerate(old or (None, None, None)):
+            self._remove(name, field, user_id)
+        for field, name in enumerate(new):
+            self._add(name, field, user_id)
+        self.members[user_id] = new
+
+    def display_name(self, user_id: int) -> str:
+        username, nickname, first_name = self.members.get(user_id, (None, None, None))
+        if nickname or first_name:
+            return nickname or first_name
+        return f"@{username}" if username else str(user_id)
+
+    def label(self, user_id: int) -> str:
+        """Display name with the username, to tell apart members with the same name"""
+        username = self.members.get(user_id, (None, None, None))[USERNAME]
+        name = self.display_name(user_id)
+        return f"{name} (@{username})" if username and name != f"@{username}" else name
+
+    def exact(self, key: str, usernames_only: bool = False) -> List[int]:
+        """Members carrying the name, from the highest-priority field that has any"""
+        entries = self.names.get(key)
+        if not entries:
+            return []
+        if usernames_only:
+            entries = [entry for entry in entries if entry[0] == USERNAME]
+            if not entries:
+                return []
+        best = min(field for field, _ in entries)
+        return sorted(user_id for field, user_id in entries if field == best)
+
+    def prefix(self, key: str, limit: int, usernames_only: bool = False) -> List[int]:
+        """Up to limit members with a name starting with key"""
+        found: List[int] = []
+        for index in range(bisect_left(self.keys, key), len(self.keys)):
+            name = self.keys[index]
+            if not name.startswith(key):
+                break
+            for field, user_id in sorted(self.names[name]):
+                if (not usernames_only or field == USERNAME) and user_id not in found:
+                    found.append(user_id)
+                    if len(found) >= limit:
+                        return found
+        return found
+
+class NameIndex:
+    """Per-chat name index used to resolve command targets in memory.
+
+    A chat is loaded from chat_members on its first lookup and then kept
+    current by MessageBuffer (authors' usernames and first names) and by
+    set_nickname, so resolving ``@username``, a nickname or a first name
+    needs no query. Chats are kept in an LRU of ``max_chats``.
+    """
+
+    def __init__(self, db: Database, settings: Optional[Dict] = None):
+        self.db = db
+        self.settings = {**NAME_INDEX_SETTINGS, **(settings or {})}
+        self._chats = LRUCache(maxsize=self.settings['max_chats'])
+        self._loading: Dict[int, asyncio.Task] = {}
+
+    async def _load(self, chat_id: int) -> ChatNameIndex:
+        index = ChatNameIndex(await self.db.get_chat_member_names(chat_id))
+        self._chats.set(chat_id, index)
+        return index
+
+    async def get_chat(self, chat_id: int) -> ChatNameIndex:
+        """Index of a chat, loading it at most once concurrently"""
+        index = self._chats.get(chat_id)
+        if index is not None:
+            return index
+        task = self._loading.get(chat_id)
+        if task is None:
+            task = asyncio.create_task(self._load(chat_id))
+            self._loading[chat_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    def observe(self, chat_id: int, user_id: int, username: Optional[str], first_name: Optional[str]):
+        """Record a message author's current names in a loaded chat"""
+        index = self._chats.get(chat_id)
+        if index is None:
+            return
+        current = index.members.get(user_id)
+        nickname = current[NICKNAME] if current else None
+        index.update(user_id, username, nickname, first_name)
+
+    def set_nickname(self, user_id: int, nickname: Optional[str]):
+        """Apply a nickname change to every loaded chat the user is in"""
+        for index in self._chats.values():
+            current = index.members.get(user_id)
+            if current is not None:
+                index.update(user_id, current[USERNAME], nickname, current[FIRST_NAME])
+
+    async def resolve(self, chat_id: int, query: str, prefix: bool = True) -> List[Tuple[int, str]]:
+        """Members matching @username, a nickname or a first name, as (user_id, display name).
+
+        An exact match wins; otherwise, with ``prefix``, names starting with
+        the query (at least ``min_prefix`` characters) are returned. More
+        than one result means the query is ambiguous; at most
+        ``max_candidates`` are listed, labelled with their usernames.
+        """
+        usernames_only = query.startswith('@')
+        key = _key(query.lstrip('@'))
+        if not key:
+            return []
+        index = await self.get_chat(chat_id)
+        found = index.exact(key, usernames_only)
+        if not found and prefix and len(key) >= self.settings['min_prefix']:
+            found = index.prefix(key, self.settings['max_candidates'], usernames_only)
+        found = found[:self.settings['max_candidates']]
+        if len(found) == 1:
+            return [(found[0], index.display_name(found[0]))]
+        return [(user_id, index.label(user_id)) for user_id in found]
+
+    def forget_chat(self, chat_id: int):
+        """Drop a chat the bot is no longer part of"""
+        self._chats.pop(chat_id)
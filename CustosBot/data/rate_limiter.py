@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Optional, Dict, List, Tuple
+
+from config import RATE_LIMITS, RATE_LIMITER_SETTINGS
+from data.database import Database
+
+logger = logging.getLogger(__name__)
+
+def parse_limit(value) -> Tuple[int, float]:
+    """RATE_LIMITS value -> (uses, window seconds); a bare number means one use per window"""
+    if isinstance(value, (tuple, list)):
+        return int(value[0]), float(value[1])
+    return 1, float(value)
+
+class RateLimiter:
+    """Sliding-window limits on commands, per chat, user and command.
+
+    Limits are named ``<command>_<rank>`` (e.g. ``warn_moderator``) and come
+    from config.RATE_LIMITS unless the chat has its own value in
+    rate_limit_overrides. Each (chat, user, command) keeps the timestamps of
+    its last ``uses`` calls in a deque, so a check is O(1). A window is
+    kept until one window after its last use; once more than ``maxsize``
+    are held, expired ones are swept, never one still in its cooldown.
+
+    With ``persist`` the uses are queued and written to rate_limit_hits in
+    one batch every ``flush_interval`` seconds, and reloaded on startup, so
+    a restart does not reset cooldowns. While the database is unavailable
+    at most ``max_pending`` uses are kept, the oldest dropped first.
+    """
+
+    def __init__(self, db: Database, settings: Optional[Dict] = None):
+        self.db = db
+        self.settings = {**RATE_LIMITER_SETTINGS, **(settings or {})}
+        self.limits = {name: parse_limit(value) for name, value in RATE_LIMITS.items()}
+        self._overrides: Dict[Tuple[int, str], Tuple[int, float]] = {}
+        # (chat_id, user_id, command) -> [use timestamps, expires at]
+        self._windows: Dict[Tuple[int, int, str], list] = {}
+        self._sweep_at = self.settings['maxsize']
+        self._pending: List[tuple] = []
+        self.stats = {'windows': 0, 'swept': 0, 'dropped_hits': 0}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def pending(self) -> int:
+        """Number of uses recorded but not yet written"""
+        return len(self._pending)
+
+    def _all_limits(self) -> List[Tuple[int, float]]:
+        return list(self.limits.values()) + list(self._overrides.values())
+
+    def get_limit(self, chat_id: int, command: str, rank: str) -> Optional[Tuple[int, float]]:
+        """(uses, window) for this command and rank in the chat, None when unlimited"""
+        name = f"{command}_{rank}"
+        return self._overrides.get((chat_id, name), self.limits.get(name))
+
+    def hit(self, chat_id: int, user_id: int, command: str, rank: str) -> bool:
+        """Record a use and return True, or return False if the limit is reached"""
+        limit = self.get_limit(chat_id, command, rank)
+        if limit is None:
+            return True
+        uses, window = limit
+        now = time.time()
+        key = (chat_id, user_id, command)
+
+        used_at = self._used_at(key, now)
+        if used_at is None or used_at.maxlen != uses:
+            used_at = deque(used_at or (), maxlen=uses)
+        if len(used_at) == uses and now - used_at[0] < window:
+            return False
+
+        used_at.append(now)
+        self._windows[key] = [used_at, now + window]
+        if len(self._windows) > self._sweep_at:
+            self._sweep(now)
+        self.stats['windows'] = len(self._windows)
+        if self.settings['persist']:
+            self._pending.append((chat_id, user_id, command, now))
+        return True
+
+    def _used_at(self, key: Tuple[int, int, str], now: float) -> Optional[deque]:
+        entry = self._windows.get(key)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry[0]
+
+    def _sweep(self, now: float):
+        """Drop expired windows; the next sweep waits until as many new ones are added"""
+        before = len(self._windows)
+        self._windows = {key: entry for key, entry in self._windows.items() if entry[1] > now}
+        self.stats['swept'] += before - len(self._windows)
+        self._sweep_at = max(self.settings['maxsize'], 2 * len(self._windows))
+
+    def retry_after(self, chat_id: int, user_id: int, command: str, rank: str) -> float:
+        """Seconds until the command can be used again (0 if it can be used now)"""
+        limit = self.get_limit(chat_id, command, rank)
+        used_at = self._used_at((chat_id, user_id, command), time.time())
+        if limit is None or not used_at or len(used_at) < limit[0]:
+            return 0.0
+        return max(0.0, used_at[0] + limit[1] - time.time())
+
+    async def set_chat_limit(self, chat_id: int, name: str, uses: Optional[int], window: Optional[float] = None):
+        """Override a limit for one chat; uses=None restores the config value"""
+        await self.db.set_rate_limit_override(chat_id, name, uses, window)
+        if uses is None:
+            self._overrides.pop((chat_id, name), None)
+        else:
+            self._overrides[(chat_id, name)] = (uses, window)
+
+    async def load(self):
+        """Load per-chat overrides and, when persisting, uses still inside their window"""
+        self._overrides = {(chat_id, name): (uses, window)
+                           for chat_id, name, uses, window in await self.db.get_rate_limit_overrides()}
+        if not self.settings['persist']:
+            return
+        longest = max([window for _, window in self._all_limits()], default=0)
+        most_uses = max([uses for uses, _ in self._all_limits()], default=1)
+        for chat_id, user_id, command, used_at in await self.db.get_rate_limit_hits(time.time() - longest):
+            key = (chat_id, user_id, command)
+            entry = self._windows.get(key)
+            if entry is None:
+                entry = self._windows[key] = [deque(maxlen=most_uses), 0.0]
+            entry[0].append(used_at)
+            entry[1] = max(entry[1], used_at + longest)
+        self.stats['windows'] = len(self._windows)
+
+    def start(self):
+        """Start the background flush loop (only needed with persist)"""
+        if self._task is None and self.settings['persist']:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write pending uses"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Write queued uses in one batch and prune expired ones"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        longest = max([window for _, window in self._all_limits()], default=0)
+        try:
+            await self.db.save_rate_limit_hits(pending, time.time() - longest)
+        except Exception:
+            pending += self._pending
+            dropped = len(pending) - self.settings['max_pending']
+            if dropped > 0:
+                # The oldest uses are the nearest to leaving their window anyway
+                del pending[:dropped]
+                self.stats['dropped_hits'] += dropped
+                logger.warning("Rate limit queue full, dropped %s oldest uses", dropped)
+            self._pending = pending
+            raise
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.settings['flush_interval'])
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Rate limit flush failed: %s", e)
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Optional, Dict
+
+from config import ROLLUP_SETTINGS
+from data.database import Database
+
+logger = logging.getLogger(__name__)
+
+class RollupReconciler:
+    """Background job that rebuilds recent weekly/monthly rollups from message_stats.
+
+    The rollup tables are updated incrementally in the same transaction as
+    every message batch, so they only drift if message_stats is changed some
+    other way (manual fixes, an interrupted migration). Every
+    ``reconcile_interval`` seconds the periods touching the last
+    ``reconcile_days`` days are recomputed from the daily rows, one chat
+    per transaction with a pause between them so message flushes keep
+    going.
+    """
+
+    def __init__(self, db: Database, settings: Optional[Dict] = None):
+        self.db = db
+        self.settings = {**ROLLUP_SETTINGS, **(settings or {})}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        """Start the background reconcile loop"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the reconcile loop, abandoning a run between two chats"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def reconcile(self):
+        """Recompute the rollups of recent periods, chat by chat"""
+        since = date.today() - timedelta(days=self.settings['reconcile_days'])
+        chats = await self.db.get_rollup_chats(since)
+        for done, chat_id in enumerate(chats, 1):
+            await self.db.reconcile_chat_rollups(chat_id, since)
+            # Yield the writer between chats
+            await asyncio.sleep(self.settings['slice_pause'])
+            if self._stopping:
+                logger.info("Rollup reconcile stopped after %s of %s chats", done, len(chats))
+                return
+        logger.info("Message rollups of %s chats reconciled since %s", len(chats), since.isoformat())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.settings['reconcile_interval'])
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                break
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error("Rollup reconcile failed: %s", e)
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict
+
+from aiogram import Bot
+from aiogram.types import ChatMemberUpdated
+
+from config import ROSTER_SETTINGS
+from data.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Telegram member status -> bot rank for statuses that always win over the database
+TELEGRAM_STAFF_STATUSES = {
+    'creator': 'owner',
+    'administrator': 'administrator'
+}
+
+class AdminRoster:
+    """In-memory mirror of every chat's staff, persisted to chat_members.rank.
+
+    A chat is loaded with a single get_chat_administrators call (when the bot
+    is added, or on first use) and then kept current from chat_member updates,
+    so permission checks and /staff need no Telegram API calls. Chats are
+    reloaded after ``refresh_interval`` seconds as a safety net for chats
+    where the bot is not an administrator and does not receive those updates.
+    """
+
+    def __init__(self, db: Database, settings: Optional[Dict] = None):
+        self.db = db
+        self.settings = {**ROSTER_SETTINGS, **(settings or {})}
+        # chat_id -> {user_id: rank} for every non-participant
+        self._chats: Dict[int, Dict[int, str]] = {}
+        self._loaded_at: Dict[int, float] = {}
+        self._loading: Dict[int, asyncio.Task] = {}
+        self._failed_at: Dict[int, float] = {}
+
+    def is_loaded(self, chat_id: int) -> bool:
+        """Whether the chat roster is present and not due for a refresh"""
+        loaded_at = self._loaded_at.get(chat_id)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.settings['refresh_interval']
+
+    async def load_chat(self, bot: Bot, chat_id: int) -> Dict[int, str]:
+        """Fetch chat administrators once and sync them to the database"""
+        admins = await bot.get_chat_administrators(chat_id)
+        ranks = {}
+        for member in admins:
+            if member.user.is_bot:
+                continue
+            ranks[member.user.id] = TELEGRAM_STAFF_STATUSES.get(member.status, 'participant')
+            await self.db.add_user(member.user.id, member.user.username,
+                                   member.user.first_name, member.user.last_name)
+        await self.db.sync_chat_admins(chat_id, ranks)
+
+        # Moderators are a bot-level rank and live only in the database
+        staff = await self.db.get_staff_list(chat_id)
+        for member in staff['moderator']:
+            ranks.setdefault(member['user_id'], 'moderator')
+
+        self._chats[chat_id] = ranks
+        self._loaded_at[chat_id] = time.monotonic()
+        return ranks
+
+    def cached_rank(self, chat_id: int, user_id: int) -> Optional[str]:
+        """Rank from memory only; None when the chat roster is not loaded"""
+        ranks = self._chats.get(chat_id)
+        if ranks is None:
+            return None
+        return ranks.get(user_id, 'participant')
+
+    async def ensure_loaded(self, bot: Bot, chat_id: int) -> Optional[Dict[int, str]]:
+        """Return the chat roster, loading it at most once concurrently; None if unavailable"""
+        if self.is_loaded(chat_id):
+            return self._chats[chat_id]
+        failed_at = self._failed_at.get(chat_id)
+        if failed_at is not None and time.monotonic() - failed_at < self.settings['retry_after_failure']:
+            return None
+        task = self._loading.get(chat_id)
+        if task is None:
+            task = asyncio.create_task(self.load_chat(bot, chat_id))
+            self._loading[chat_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(chat_id, None))
+        try:
+            ranks = await asyncio.shield(task)
+        except Exception as e:
+            logger.warning("Failed to load roster for chat %s: %s", chat_id, e)
+            self._failed_at[chat_id] = time.monotonic()
+            return None
+        self._failed_at.pop(chat_id, None)
+        return ranks
+
+    async def get_rank(self, bot: Bot, chat_id: int, user_id: int) -> Optional[str]:
+        """Rank from the roster, or None when the chat roster cannot be loaded"""
+        ranks = await self.ensure_loaded(bot, chat_id)
+        if ranks is None:
+            return None
+        return ranks.get(user_id, 'participant')
+
+    async def set_rank(self, chat_id: int, user_id: int, rank: str):
+        """Record a rank assigned by the bot itself (e.g. /upstaff)"""
+        await self.db.set_user_rank(user_id, chat_id, rank)
+        ranks = self._chats.get(chat_id)
+        if ranks is not None:
+            if rank == 'participant':
+                ranks.pop(user_id, None)
+            else:
+                ranks[user_id] = rank
+
+    async def apply_member_update(self, event: ChatMemberUpdated):
+        """Apply a chat_member update to the roster and the database"""
+        chat_id = event.chat.id
+        user = event.new_chat_member.user
+        status = event.new_chat_member.status
+        if user.is_bot:
+            return
+
+        ranks = self._chats.get(chat_id)
+        old_rank = ranks.get(user.id) if ranks is not None else None
+        if old_rank is None:
+            # Not in memory: a participant, or a moderator who had left the chat
+            old_rank = await self.db.get_user_rank(user.id, chat_id) or 'participant'
+
+        if status in TELEGRAM_STAFF_STATUSES:
+            new_rank = TELEGRAM_STAFF_STATUSES[status]
+        elif old_rank == 'moderator':
+            # Bot-level rank survives demotion, leaving and rejoining
+            new_rank = 'moderator'
+        else:
+            new_rank = 'participant'
+
+        await self.db.add_user(user.id, user.username, user.first_name, user.last_name)
+        if new_rank != old_rank:
+            await self.db.set_user_rank(user.id, chat_id, new_rank)
+
+        if ranks is not None:
+            if new_rank == 'participant' or status in ('left', 'kicked'):
+                ranks.pop(user.id, None)
+            else:
+                ranks[user.id] = new_rank
+
+    def forget_chat(self, chat_id: int):
+        """Drop a chat the bot is no longer part of"""
+        self._chats.pop(chat_id, None)
+        self._loaded_at.pop(chat_id, None)
+        self._failed_at.pop(chat_id, None)
@@ -1,20 +1,25 @@
 from aiogram import F, Router
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, CommandStart
+import logging
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from keyboards.main_keyboards import get_main_menu_keyboard, get_menu_buttons_keyboard
 from data.database import Database
+from data.message_buffer import MessageBuffer
 from utils.image_generator import image_gen
+from utils.asset_registry import AssetRegistry
+from middlewares.text_commands import text_commands
 from config import BOT_DESCRIPTION
 
+logger = logging.getLogger(__name__)
+
 router = Router()
-db = Database()
 
 @router.message(CommandStart())
-async def start_command(message: Message):
+async def start_command(message: Message, db: Database, assets: AssetRegistry):
     """Handle /start command"""
     user = message.from_user
     if not user:
@@ -25,24 +30,17 @@ async def start_command(message: Message):
     
     # Check if it's a private chat
     if message.chat.type == 'private':
-        # Generate main menu image if not exists
-        image_path = "images/main_menu.png"
-        if not os.path.exists(image_path):
-            try:
-                await image_gen.generate_main_menu_image()
-            except Exception as e:
-                print(f"Failed to generate main menu image: {e}")
+        # Main menu image (built at startup, or awaited if still building)
+        image = await image_gen.get_asset("main_menu")
         
         # Send main menu with image
         try:
-            if os.path.exists(image_path):
-                photo = FSInputFile(image_path)
-                await message.answer_photo(
-                    photo=photo,
-                    caption=BOT_DESCRIPTION,
-                    reply_markup=get_main_menu_keyboard()
-                )
-            else:
+            sent = await assets.answer_photo(
+                message, image,
+                caption=BOT_DESCRIPTION,
+                reply_markup=get_main_menu_keyboard()
+            )
+            if not sent:
                 await message.answer(
                     BOT_DESCRIPTION,
                     reply_markup=get_main_menu_keyboard()
@@ -69,15 +67,10 @@ async def start_command(message: Message):
         )
 
 @router.message(Command("help"))
-async def help_command(message: Message):
+async def help_command(message: Message, assets: AssetRegistry):
     """Handle /help command"""
-    # Generate commands image if not exists
-    image_path = "images/commands.png"
-    if not os.path.exists(image_path):
-        try:
-            await image_gen.generate_commands_image()
-        except Exception as e:
-            print(f"Failed to generate commands image: {e}")
+    # Commands image (built at startup, or awaited if still building)
+    image = await image_gen.get_asset("commands")
     
     # Different help text for private chat vs group chat
     if message.chat.type == 'private':
@@ -90,7 +83,8 @@ async def help_command(message: Message):
 • `/warn [пользователь] [причина]` или `варн [пользователь] [причина]` - выдать варн
 • `/kick [пользователь] [причина]` или `кик [пользователь] [причина]` - кикнуть
 • `/staff` или `стафф`, `админы`, `стаф`, `кто админ` - список персонала
-• `/stats` или `стата` - статистика активности чата
+• `/stats [день|неделя|месяц|период] [страница]` или `стата` - статистика активности чата
+• `/find [текст] [страница]` или `найти` - поиск участников по имени, нику и описанию
 
 **Информация:**
 • `/help` или `помощь` - эта справка
@@ -113,7 +107,8 @@ async def help_command(message: Message):
 • /warn [пользователь] [причина] или варн [пользователь] [причина] - выдать варн
 • /kick [пользователь] [причина] или кик [пользователь] [причина] - кикнуть
 • /staff или стафф, админы, стаф, кто админ - список персонала
-• /stats или стата - статистика активности чата
+• /stats [день|неделя|месяц|период] [страница] или стата - статистика активности чата
+• /find [текст] [страница] или найти - поиск участников по имени, нику и описанию
 
 Информация:
 • /help или помощь - эта справка
@@ -128,22 +123,20 @@ async def help_command(message: Message):
 """
     
     try:
-        if os.path.exists(image_path):
-            photo = FSInputFile(image_path)
-            if message.chat.type == 'private':
-                from keyboards.main_keyboards import get_back_keyboard
-                await message.answer_photo(
-                    photo=photo,
-                    caption=help_text,
-                    parse_mode="Markdown",
-                    reply_markup=get_back_keyboard()
-                )
-            else:
-                await message.answer_photo(
-                    photo=photo,
-                    caption=help_text
-                )
+        if message.chat.type == 'private':
+            from keyboards.main_keyboards import get_back_keyboard
+            sent = await assets.answer_photo(
+                message, image,
+                caption=help_text,
+                parse_mode="Markdown",
+                reply_markup=get_back_keyboard()
+            )
         else:
+            sent = await assets.answer_photo(
+                message, image,
+                caption=help_text
+            )
+        if not sent:
             if message.chat.type == 'private':
                 from keyboards.main_keyboards import get_back_keyboard
                 await message.answer(help_text, parse_mode="Markdown", reply_markup=get_back_keyboard())
@@ -156,8 +149,8 @@ async def help_command(message: Message):
         else:
             await message.answer(help_text)
 
-@router.message(F.text == "💬 Мои чаты")
-async def my_chats_command(message: Message):
+@text_commands.phrase("💬 Мои чаты")
+async def my_chats_command(message: Message, db: Database, assets: AssetRegistry):
     """Handle 'My Chats' button"""
     user = message.from_user
     if not user:
@@ -167,13 +160,8 @@ async def my_chats_command(message: Message):
     if message.chat.type != 'private':
         return
     
-    # Generate my chats image if not exists
-    image_path = "images/my_chats.png"
-    if not os.path.exists(image_path):
-        try:
-            await image_gen.generate_my_chats_image()
-        except Exception as e:
-            print(f"Failed to generate my chats image: {e}")
+    # My chats image (built at startup, or awaited if still building)
+    image = await image_gen.get_asset("my_chats")
     
     # Get user's chats
     chats = await db.get_user_chats(user.id)
@@ -199,32 +187,30 @@ async def my_chats_command(message: Message):
     
     try:
         from keyboards.main_keyboards import get_back_keyboard
-        if os.path.exists(image_path):
-            photo = FSInputFile(image_path)
-            await message.answer_photo(
-                photo=photo,
-                caption=chat_text,
-                parse_mode="Markdown",
-                reply_markup=get_back_keyboard()
-            )
-        else:
+        sent = await assets.answer_photo(
+            message, image,
+            caption=chat_text,
+            parse_mode="Markdown",
+            reply_markup=get_back_keyboard()
+        )
+        if not sent:
             await message.answer(chat_text, parse_mode="Markdown", reply_markup=get_back_keyboard())
     except Exception as e:
         from keyboards.main_keyboards import get_back_keyboard
         await message.answer(chat_text, parse_mode="Markdown", reply_markup=get_back_keyboard())
 
-@router.message(F.text == "📋 Команды")
-async def commands_button(message: Message):
+@text_commands.phrase("📋 Команды")
+async def commands_button(message: Message, assets: AssetRegistry):
     """Handle 'Commands' button"""
-    await help_command(message)
+    await help_command(message, assets)
 
-@router.message(F.text.in_(["помощь"]))
-async def help_text_command(message: Message):
+@text_commands.phrase("помощь")
+async def help_text_command(message: Message, assets: AssetRegistry):
     """Handle text alternatives for /help command"""
-    await help_command(message)
+    await help_command(message, assets)
 
 @router.message(F.new_chat_members)
-async def new_chat_members(message: Message):
+async def new_chat_members(message: Message, db: Database):
     """Handle when bot is added to a chat"""
     if not message.new_chat_members:
         return
@@ -249,33 +235,26 @@ async def new_chat_members(message: Message):
             break
 
 @router.callback_query(F.data == "back_to_menu")
-async def back_to_menu_handler(callback: CallbackQuery):
+async def back_to_menu_handler(callback: CallbackQuery, assets: AssetRegistry):
     """Handle 'Back' button press"""
     user = callback.from_user
     if not user:
         return
     
-    # Generate main menu image if not exists
-    image_path = "images/main_menu.png"
-    if not os.path.exists(image_path):
-        try:
-            await image_gen.generate_main_menu_image()
-        except Exception as e:
-            print(f"Failed to generate main menu image: {e}")
+    # Main menu image (built at startup, or awaited if still building)
+    image = await image_gen.get_asset("main_menu")
     
     # Send new main menu message (simpler and more reliable)
     try:
         from config import BOT_DESCRIPTION
         from keyboards.main_keyboards import get_main_menu_keyboard, get_menu_buttons_keyboard
         
-        if os.path.exists(image_path):
-            photo = FSInputFile(image_path)
-            await callback.message.answer_photo(
-                photo=photo,
-                caption=BOT_DESCRIPTION,
-                reply_markup=get_main_menu_keyboard()
-            )
-        else:
+        sent = await assets.answer_photo(
+            callback.message, image,
+            caption=BOT_DESCRIPTION,
+            reply_markup=get_main_menu_keyboard()
+        )
+        if not sent:
             await callback.message.answer(
                 BOT_DESCRIPTION,
                 reply_markup=get_main_menu_keyboard()
@@ -294,12 +273,13 @@ async def back_to_menu_handler(callback: CallbackQuery):
             pass  # Ignore if can't delete
             
     except Exception as e:
-        print(f"Error in back_to_menu_handler: {e}")
+        logger.exception("Error in back_to_menu_handler: %s", e)
     
     await callback.answer()
 
 @router.message(F.content_type.in_(["text"]))
-async def track_messages(message: Message):
+@text_commands.fallback
+async def track_messages(message: Message, message_buffer: MessageBuffer):
     """Track messages for statistics - this handler should be last"""
     user = message.from_user
     chat = message.chat
@@ -307,7 +287,5 @@ async def track_messages(message: Message):
     if not user or chat.type == 'private':
         return
     
-    # Add user and update message count
-    await db.add_user(user.id, user.username, user.first_name, user.last_name)
-    await db.add_chat_member(user.id, chat.id)
-    await db.increment_message_count(user.id, chat.id)
\ No newline at end of file
+    # Counted in memory and written in batches by MessageBuffer
+    message_buffer.record_message(user.id, chat.id, user.username, user.first_name, user.last_name)
\ No newline at end of file
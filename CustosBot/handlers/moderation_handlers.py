@@ -1,101 +1,135 @@
-from aiogram import F, Router
-from aiogram.types import Message, CallbackQuery
+from aiogram import Bot, F, Router
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
 from aiogram.filters import Command
-from data.database import Database
-from config import RANKS, RANK_NAMES, COMMAND_PERMISSIONS, RATE_LIMITS
+from data.database import Database, member_search_query
+from data.roster import AdminRoster
+from data.leaderboard import Leaderboard
+from data.rate_limiter import RateLimiter
+from data.name_index import NameIndex
+from config import RANKS, RANK_NAMES, COMMAND_PERMISSIONS, RANK_CACHE_SETTINGS, MEMBER_SEARCH_SETTINGS
 from keyboards.main_keyboards import get_confirmation_keyboard
+from utils.cache import LRUCache
+from utils.asset_registry import AssetRegistry
+from utils.activity_charts import activity_charts
+from middlewares.text_commands import text_commands
+from utils.periods import PERIOD_ALIASES, PERIOD_TITLES, period_range, parse_range, align_to_horizon, daily_horizon
+import html
+import logging
 import re
-from datetime import datetime, timedelta
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 router = Router()
-db = Database()
 
-# Rate limit storage (in production, use Redis or database)
-rate_limits = {}
+# Telegram-derived ranks per (chat_id, user_id)
+rank_cache = LRUCache(RANK_CACHE_SETTINGS['maxsize'], ttl=RANK_CACHE_SETTINGS['ttl'])
+
+def forget_cached_rank(chat_id: int, user_id: int):
+    """Drop cached rank after it was changed by the bot itself"""
+    rank_cache.pop((chat_id, user_id))
 
-async def get_user_telegram_rank(message: Message, user_id: int) -> str:
-    """Get user's real rank from Telegram chat and sync with database"""
+async def get_user_telegram_rank(message: Message, user_id: int, db: Database, roster: AdminRoster) -> str:
+    """Get user's real rank from the admin roster, falling back to get_chat_member"""
+    rank = await roster.get_rank(message.bot, message.chat.id, user_id)
+    if rank is not None:
+        return rank
+    
+    # Roster unavailable for this chat: ask Telegram about this one user
+    chat_id = message.chat.id
+    cached_rank = rank_cache.get((chat_id, user_id))
+    if cached_rank is not None:
+        return cached_rank
+    
     try:
-        chat_member = await message.bot.get_chat_member(message.chat.id, user_id)
-        
-        if chat_member.status == "creator":
-            # Chat creator (owner)
-            await db.add_chat_member(user_id, message.chat.id)
-            await db.update_user_rank(user_id, message.chat.id, "owner")
-            return "owner"
-        elif chat_member.status == "administrator":
-            # Chat administrator
-            await db.add_chat_member(user_id, message.chat.id)
-            await db.update_user_rank(user_id, message.chat.id, "administrator")
-            return "administrator"
-        elif chat_member.status in ["member", "restricted"]:
-            # Regular member - check if they have a rank in database
-            db_rank = await db.get_user_rank(user_id, message.chat.id)
-            if db_rank and db_rank in ["moderator"]:
-                # Keep moderator rank from database
-                return db_rank
-            else:
-                # Regular participant
-                await db.add_chat_member(user_id, message.chat.id)
-                await db.update_user_rank(user_id, message.chat.id, "participant")
-                return "participant"
-        else:
-            # Left or kicked
-            return "participant"
-            
+        chat_member = await message.bot.get_chat_member(chat_id, user_id)
     except Exception as e:
-        print(f"Error getting chat member: {e}")
-        # Fallback to database rank if Telegram API fails
-        db_rank = await db.get_user_rank(user_id, message.chat.id)
-        return db_rank or "participant"
+        logger.warning("get_chat_member failed for user %s: %s", user_id, e)
+        # Fallback to database rank if Telegram API fails; cache it only briefly
+        db_rank = await db.get_user_rank(user_id, chat_id)
+        rank = db_rank or "participant"
+        rank_cache.set((chat_id, user_id), rank, ttl=RANK_CACHE_SETTINGS['negative_ttl'])
+        return rank
+    
+    db_rank = await db.get_user_rank(user_id, chat_id)
+    if chat_member.status == "creator":
+        # Chat creator (owner)
+        rank = "owner"
+    elif chat_member.status == "administrator":
+        # Chat administrator
+        rank = "administrator"
+    elif chat_member.status in ["member", "restricted"]:
+        # Regular member - keep moderator rank from database, otherwise participant
+        rank = db_rank if db_rank == "moderator" else "participant"
+    else:
+        # Left or kicked - nothing to sync, remember it only briefly
+        rank_cache.set((chat_id, user_id), "participant", ttl=RANK_CACHE_SETTINGS['negative_ttl'])
+        return "participant"
+    
+    # Write only when Telegram disagrees with what we have stored
+    if rank != db_rank:
+        await db.set_user_rank(user_id, chat_id, rank)
+    
+    rank_cache.set((chat_id, user_id), rank)
+    return rank
 
-async def check_rate_limit(user_id: int, command: str, rank: str) -> bool:
+async def check_rate_limit(rate_limiter: RateLimiter, chat_id: int, user_id: int, command: str, rank: str) -> bool:
     """Check if user is rate limited for command"""
     if rank in ['administrator', 'owner']:
         return True  # No rate limits for high ranks
     
-    limit_key = f"{user_id}_{command}"
-    current_time = datetime.now()
-    
-    if limit_key in rate_limits:
-        last_used = rate_limits[limit_key]
-        if command == 'warn' and rank == 'moderator':
-            if current_time - last_used < timedelta(seconds=RATE_LIMITS['warn_moderator']):
-                return False
-        elif command == 'kick' and rank == 'moderator':
-            if current_time - last_used < timedelta(seconds=RATE_LIMITS['kick_moderator']):
-                return False
-    
-    rate_limits[limit_key] = current_time
-    return True
+    return rate_limiter.hit(chat_id, user_id, command, rank)
+
+def _list_candidates(matches: list) -> str:
+    return "\n".join(f"• {html.escape(name)} — {user_id}" for user_id, name in matches)
+
+async def resolve_target_user(message: Message, name_index: NameIndex, target: str,
+                              exact: bool = False) -> tuple[int, str]:
+    """Resolve a user ID, @username, nickname or first name within the chat.
+    
+    Returns (user_id, display name), or (0, error text) when nobody or
+    more than one member matches. With ``exact`` (commands that punish or
+    change ranks) a name prefix never selects anyone: its matches are only
+    listed so the moderator can repeat the command with @username or ID.
+    """
+    if target.isdigit():
+        return int(target), target
+    
+    matches = await name_index.resolve(message.chat.id, target, prefix=not exact)
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        return 0, (f"❓ Под «{html.escape(target)}» подходят несколько участников:\n"
+                   f"{_list_candidates(matches)}\nУкажите @username или ID.")
+    if exact:
+        candidates = await name_index.resolve(message.chat.id, target)
+        if candidates:
+            return 0, (f"❓ Участника с именем «{html.escape(target)}» нет, но подходят:\n"
+                       f"{_list_candidates(candidates)}\nУкажите @username или ID.")
+    return 0, f"❌ Пользователь {html.escape(target)} не найден в чате!"
 
-async def get_target_user(message: Message, text: str) -> tuple[int, str]:
+async def get_target_user(message: Message, text: str, name_index: NameIndex) -> tuple[int, str]:
     """Extract target user from command"""
     # Check if it's a reply
     if message.reply_to_message and message.reply_to_message.from_user:
         user = message.reply_to_message.from_user
         return user.id, user.first_name or user.username or str(user.id)
     
-    # Parse username or user ID from text
+    # Parse username, name or user ID from text
     words = text.split()[2:]  # Skip command and number if present
     if words:
-        target = words[0]
-        if target.startswith('@'):
-            # Username - in real implementation, you'd need to resolve this
-            return 0, target  # Placeholder
-        elif target.isdigit():
-            return int(target), target
+        return await resolve_target_user(message, name_index, words[0], exact=True)
     
     return 0, ""
 
-async def get_moderation_target_user(message: Message, text: Optional[str] = None) -> tuple[int, str]:
+async def get_moderation_target_user(message: Message, db: Database, name_index: NameIndex,
+                                     text: Optional[str] = None) -> tuple[int, str]:
     """Extract target user for ban/warn/kick commands"""
     # Check if it's a reply first - this is the most reliable method
     if message.reply_to_message and message.reply_to_message.from_user:
         user = message.reply_to_message.from_user
         display_name = user.first_name or user.username or str(user.id)
-        print(f"DEBUG: Found user via reply: {user.id} ({display_name})")
+        logger.debug("Moderation target %s taken from reply", user.id)
         
         # Ensure the target user exists in database
         await db.ensure_user_exists(user.id, user.username, user.first_name, user.last_name, message.chat.id)
@@ -104,62 +138,22 @@ async def get_moderation_target_user(message: Message, text: Optional[str] = Non
     
     # Use provided text or message.text
     command_text = text or message.text or ""
-    print(f"DEBUG: Parsing target from: {command_text}")
     
     # Parse target from text (target is at position 1 after command)
     words = command_text.split()
     if len(words) < 2:
-        print("DEBUG: No target specified in command")
+        logger.debug("No moderation target in command")
         return 0, ""
     
-    target = words[1]
-    print(f"DEBUG: Target string: {target}")
-    
-    # Try different methods to find the user
-    user_id = None
-    display_name = target
-    
-    # Method 1: Direct user ID
-    if target.isdigit():
-        user_id = int(target)
-        display_name = target
-        print(f"DEBUG: Found direct user ID: {user_id}")
-    
-    # Method 2: Username (with or without @)
-    elif target.startswith('@') or not target.isdigit():
-        chat_id = message.chat.id
-        
-        # Try username lookup
-        if target.startswith('@'):
-            user_id = await db.find_user_by_username(target, chat_id)
-            if user_id:
-                print(f"DEBUG: Found user by username {target}: {user_id}")
-                display_name = target
-        
-        # Try nickname lookup if username failed
-        if not user_id:
-            user_id = await db.find_user_by_nickname(target, chat_id)
-            if user_id:
-                print(f"DEBUG: Found user by nickname {target}: {user_id}")
-                display_name = target
-        
-        # Try first name lookup if nickname failed
-        if not user_id:
-            user_id = await db.find_user_by_name(target, chat_id)
-            if user_id:
-                print(f"DEBUG: Found user by name {target}: {user_id}")
-                display_name = target
-    
-    if user_id:
-        return user_id, display_name
-    else:
-        print(f"DEBUG: Could not find user: {target}")
-        return 0, target
+    # One lookup in the chat's name index: user ID, @username, nickname or first name (exact only)
+    user_id, display_name = await resolve_target_user(message, name_index, words[1], exact=True)
+    logger.debug("Moderation target %r resolved to %s", words[1], user_id)
+    return user_id, display_name
 
-async def can_moderate_target(message: Message, user_rank: str, target_user_id: int) -> bool:
+async def can_moderate_target(message: Message, user_rank: str, target_user_id: int, db: Database, roster: AdminRoster) -> bool:
     """Check if user can moderate target (prevent acting on equal/higher ranks)"""
     try:
-        target_rank = await get_user_telegram_rank(message, target_user_id)
+        target_rank = await get_user_telegram_rank(message, target_user_id, db, roster)
         
         # Rank hierarchy: owner (3) > administrator (2) > moderator (1) > participant (0)
         user_level = RANKS.get(user_rank, 0)
@@ -169,11 +163,11 @@ async def can_moderate_target(message: Message, user_rank: str, target_user_id:
         return user_level > target_level
     except Exception as e:
         # SECURITY: If we can't determine target rank, DENY moderation (fail-closed)
-        print(f"Error determining target rank for user {target_user_id}: {e}")
+        logger.warning("Could not determine rank of user %s, denying: %s", target_user_id, e)
         return False
 
 @router.message(Command("upstaff"))
-async def upstaff_command(message: Message):
+async def upstaff_command(message: Message, db: Database, roster: AdminRoster, name_index: NameIndex):
     """Handle /upstaff command for rank promotion"""
     user = message.from_user
     chat = message.chat
@@ -183,7 +177,7 @@ async def upstaff_command(message: Message):
         return
     
     # Get user rank from Telegram and sync with database
-    user_rank = await get_user_telegram_rank(message, user.id)
+    user_rank = await get_user_telegram_rank(message, user.id, db, roster)
     if not user_rank or user_rank not in COMMAND_PERMISSIONS['upstaff']:
         await message.answer("❌ Слишком низкий ранг для использования этой команды!")
         return
@@ -203,9 +197,9 @@ async def upstaff_command(message: Message):
         return
     
     # Get target user
-    target_user_id, target_name = await get_target_user(message, text)
+    target_user_id, target_name = await get_target_user(message, text, name_index)
     if not target_user_id:
-        await message.answer("❌ Не удалось найти указанного пользователя!")
+        await message.answer(target_name or "❌ Не удалось найти указанного пользователя!")
         return
     
     # Get target user current rank
@@ -248,14 +242,15 @@ async def upstaff_command(message: Message):
         return
     
     # Perform promotion
-    await db.update_user_rank(target_user_id, chat.id, new_rank)
+    await roster.set_rank(chat.id, target_user_id, new_rank)
+    forget_cached_rank(chat.id, target_user_id)
     
     await message.answer(
         f"✅ {target_name} повышен в ранге, теперь он {RANK_NAMES[new_rank]}!"
     )
 
 @router.callback_query(F.data.startswith("confirm_promote_owner_"))
-async def confirm_owner_promotion(callback: CallbackQuery):
+async def confirm_owner_promotion(callback: CallbackQuery, db: Database, roster: AdminRoster):
     """Handle owner promotion confirmation"""
     user = callback.from_user
     chat = callback.message.chat if callback.message else None
@@ -264,7 +259,7 @@ async def confirm_owner_promotion(callback: CallbackQuery):
         return
     
     # Check if user is owner
-    user_rank = await get_user_telegram_rank(callback.message, user.id)
+    user_rank = await get_user_telegram_rank(callback.message, user.id, db, roster)
     if user_rank != 'owner':
         await callback.answer("🚫 Эта кнопка не для вас ^-^", show_alert=True)
         return
@@ -277,15 +272,17 @@ async def confirm_owner_promotion(callback: CallbackQuery):
         return
     
     # Perform promotion
-    await db.update_user_rank(target_user_id, chat.id, 'owner')
-    await db.update_user_rank(user.id, chat.id, 'administrator')  # Demote current owner
+    await roster.set_rank(chat.id, target_user_id, 'owner')
+    await roster.set_rank(chat.id, user.id, 'administrator')  # Demote current owner
+    forget_cached_rank(chat.id, target_user_id)
+    forget_cached_rank(chat.id, user.id)
     
     if callback.message and hasattr(callback.message, 'edit_text'):
         await callback.message.edit_text("✅ Права владельца успешно переданы!")
     await callback.answer()
 
 @router.message(Command("ban"))
-async def ban_command(message: Message):
+async def ban_command(message: Message, db: Database, roster: AdminRoster, name_index: NameIndex):
     """Handle /ban command"""
     user = message.from_user
     chat = message.chat
@@ -298,7 +295,7 @@ async def ban_command(message: Message):
     await db.ensure_user_exists(user.id, user.username, user.first_name, user.last_name, chat.id)
     
     # Check permissions
-    user_rank = await get_user_telegram_rank(message, user.id)
+    user_rank = await get_user_telegram_rank(message, user.id, db, roster)
     if not user_rank or user_rank not in COMMAND_PERMISSIONS['ban']:
         await message.answer("❌ Недостаточно прав для использования этой команды!")
         return
@@ -310,15 +307,15 @@ async def ban_command(message: Message):
         await message.answer("❌ Использование: `/ban [пользователь] [причина]` или ответьте на сообщение пользователя", parse_mode="Markdown")
         return
     
-    target_user_id, target_name = await get_moderation_target_user(message, text)
+    target_user_id, target_name = await get_moderation_target_user(message, db, name_index, text)
     reason = parts[2] if len(parts) > 2 else "Нарушение правил"
     
     if not target_user_id:
-        await message.answer("❌ Не удалось найти указанного пользователя!")
+        await message.answer(target_name or "❌ Не удалось найти указанного пользователя!")
         return
     
     # Check if user can moderate target
-    if not await can_moderate_target(message, user_rank, target_user_id):
+    if not await can_moderate_target(message, user_rank, target_user_id, db, roster):
         await message.answer("❌ Нельзя забанить пользователя с равным или высшим рангом!")
         return
     
@@ -330,7 +327,8 @@ async def ban_command(message: Message):
         await message.answer(f"❌ Не удалось забанить пользователя: {str(e)}")
 
 @router.message(Command("warn"))
-async def warn_command(message: Message):
+async def warn_command(message: Message, db: Database, roster: AdminRoster, rate_limiter: RateLimiter,
+                       name_index: NameIndex):
     """Handle /warn command"""
     user = message.from_user
     chat = message.chat
@@ -343,13 +341,13 @@ async def warn_command(message: Message):
     await db.ensure_user_exists(user.id, user.username, user.first_name, user.last_name, chat.id)
     
     # Check permissions
-    user_rank = await get_user_telegram_rank(message, user.id)
+    user_rank = await get_user_telegram_rank(message, user.id, db, roster)
     if not user_rank or user_rank not in COMMAND_PERMISSIONS['warn']:
         await message.answer("❌ Недостаточно прав для использования этой команды!")
         return
     
     # Check rate limit
-    if not await check_rate_limit(user.id, 'warn', user_rank):
+    if not await check_rate_limit(rate_limiter, chat.id, user.id, 'warn', user_rank):
         await message.answer("⏰ Вы можете использовать эту команду раз в час!")
         return
     
@@ -360,15 +358,15 @@ async def warn_command(message: Message):
         await message.answer("❌ Использование: `/warn [пользователь] [причина]` или ответьте на сообщение пользователя", parse_mode="Markdown")
         return
     
-    target_user_id, target_name = await get_moderation_target_user(message, text)
+    target_user_id, target_name = await get_moderation_target_user(message, db, name_index, text)
     reason = parts[2] if len(parts) > 2 else "Нарушение правил"
     
     if not target_user_id:
-        await message.answer("❌ Не удалось найти указанного пользователя!")
+        await message.answer(target_name or "❌ Не удалось найти указанного пользователя!")
         return
     
     # Check if user can moderate target
-    if not await can_moderate_target(message, user_rank, target_user_id):
+    if not await can_moderate_target(message, user_rank, target_user_id, db, roster):
         await message.answer("❌ Нельзя выдать варн пользователю с равным или высшим рангом!")
         return
     
@@ -388,7 +386,8 @@ async def warn_command(message: Message):
         await message.answer(f"⚠️ {target_name} получил варн ({warning_count}/5). Причина: {reason}")
 
 @router.message(Command("kick"))
-async def kick_command(message: Message):
+async def kick_command(message: Message, db: Database, roster: AdminRoster, rate_limiter: RateLimiter,
+                       name_index: NameIndex):
     """Handle /kick command"""
     user = message.from_user
     chat = message.chat
@@ -401,13 +400,13 @@ async def kick_command(message: Message):
     await db.ensure_user_exists(user.id, user.username, user.first_name, user.last_name, chat.id)
     
     # Check permissions
-    user_rank = await get_user_telegram_rank(message, user.id)
+    user_rank = await get_user_telegram_rank(message, user.id, db, roster)
     if not user_rank or user_rank not in COMMAND_PERMISSIONS['kick']:
         await message.answer("❌ Недостаточно прав для использования этой команды!")
         return
     
     # Check rate limit
-    if not await check_rate_limit(user.id, 'kick', user_rank):
+    if not await check_rate_limit(rate_limiter, chat.id, user.id, 'kick', user_rank):
         await message.answer("⏰ Модератор может использовать эту команду раз в 15 минут!")
         return
     
@@ -418,15 +417,15 @@ async def kick_command(message: Message):
         await message.answer("❌ Использование: `/kick [пользователь] [причина]` или ответьте на сообщение пользователя", parse_mode="Markdown")
         return
     
-    target_user_id, target_name = await get_moderation_target_user(message, text)
+    target_user_id, target_name = await get_moderation_target_user(message, db, name_index, text)
     reason = parts[2] if len(parts) > 2 else "Нарушение правил"
     
     if not target_user_id:
-        await message.answer("❌ Не удалось найти указанного пользователя!")
+        await message.answer(target_name or "❌ Не удалось найти указанного пользователя!")
         return
     
     # Check if user can moderate target
-    if not await can_moderate_target(message, user_rank, target_user_id):
+    if not await can_moderate_target(message, user_rank, target_user_id, db, roster):
         await message.answer("❌ Нельзя кикнуть пользователя с равным или высшим рангом!")
         return
     
@@ -439,7 +438,7 @@ async def kick_command(message: Message):
         await message.answer(f"❌ Не удалось кикнуть пользователя: {str(e)}")
 
 @router.message(Command("staff"))
-async def staff_command(message: Message):
+async def staff_command(message: Message, db: Database, roster: AdminRoster):
     """Handle /staff command"""
     chat = message.chat
     
@@ -447,10 +446,13 @@ async def staff_command(message: Message):
         await message.answer("❌ Команда доступна только в групповых чатах!")
         return
     
-    print(f"DEBUG: Getting staff for chat {chat.id}")
+    # Make sure Telegram admins are mirrored before reading the staff list
+    await roster.ensure_loaded(message.bot, chat.id)
+    
     # Get staff list
     staff = await db.get_staff_list(chat.id)
-    print(f"DEBUG: Staff result: {staff}")
+    logger.debug("Staff list: %d owners, %d administrators, %d moderators",
+                 len(staff['owner']), len(staff['administrator']), len(staff['moderator']))
     
     staff_text = "👥 **Персонал чата:**\n\n"
     
@@ -480,11 +482,34 @@ async def staff_command(message: Message):
     if not any(staff.values()):
         staff_text += "Персонал не назначен."
     
-    print(f"DEBUG: Final staff text: {staff_text}")
     await message.answer(staff_text, parse_mode="Markdown")
 
+STATS_USAGE = ("❌ Использование: /stats [day|week|month|ДД.ММ.ГГГГ-ДД.ММ.ГГГГ] [страница]\n"
+               "Период не может начинаться в будущем.")
+
+def parse_stats_args(text: str) -> tuple:
+    """Parse '/stats [day|week|month|<from>..<to>] [page]' into (window, title, page, command).
+
+    Raises ValueError for a date range that cannot be shown.
+    """
+    args = text.split()[1:]
+    window, title, command = None, None, "/stats"
+    date_range = parse_range(args[0]) if args else None
+    if args and args[0].lower() in PERIOD_ALIASES:
+        period = PERIOD_ALIASES[args[0].lower()]
+        window = period_range(period)
+        title = PERIOD_TITLES[period]
+        command += f" {args.pop(0)}"
+    elif date_range:
+        # Days before the retention horizon only exist as monthly totals
+        window = align_to_horizon(*date_range, daily_horizon())
+        title = f"за {window[0]:%d.%m.%Y} – {window[1]:%d.%m.%Y}"
+        command += f" {args.pop(0)}"
+    page = int(args[0]) if args and args[0].isdigit() and int(args[0]) > 0 else 1
+    return window, title, page, command
+
 @router.message(Command("stats"))
-async def stats_command(message: Message):
+async def stats_command(message: Message, db: Database, assets: AssetRegistry, leaderboard: Leaderboard):
     """Handle /stats command for chat statistics"""
     chat = message.chat
     
@@ -492,18 +517,47 @@ async def stats_command(message: Message):
         await message.answer("❌ Команда доступна только в групповых чатах!")
         return
     
-    # Get chat statistics from database
-    results = await db.get_chat_stats(chat.id, 20)
+    # /stats [day|week|month|2025-01-01..2025-01-31] [page]
+    try:
+        window, title, page, command = parse_stats_args(message.text or "")
+    except ValueError:
+        await message.answer(STATS_USAGE)
+        return
+    page_size = leaderboard.settings['page_size']
+    
+    if window:
+        # Windowed leaderboard from the weekly/monthly rollups
+        try:
+            rows, members = await db.get_window_leaderboard(chat.id, window[0], window[1],
+                                                            page_size, (page - 1) * page_size)
+        except (ValueError, OverflowError):
+            # Dates at the edge of the calendar that the period split cannot handle
+            await message.answer(STATS_USAGE)
+            return
+        results = [(place, *row) for place, row in enumerate(rows, (page - 1) * page_size + 1)]
+        pages = max(1, -(-members // page_size))
+    else:
+        # Leaderboard page from memory (loaded from the database on first use)
+        results, pages = await leaderboard.get_page(chat.id, page)
     
     if not results:
+        if page > 1:
+            await message.answer(f"❌ Такой страницы нет. Всего страниц: {pages}")
+            return
+        if window:
+            await message.answer(f"📊 **Статистика {title}**\n\nЗа этот период сообщений нет.", parse_mode="Markdown")
+            return
         await message.answer("📊 **Статистика чата**\n\nСтатистика пока не собрана. Начните общаться в чате!")
         return
     
-    stats_text = "📊 **Статистика активности чата**\n\n"
+    if window:
+        stats_text = f"📊 **Статистика активности {title}**\n\n"
+    else:
+        stats_text = "📊 **Статистика активности чата**\n\n"
     stats_text += "🏆 **Самые активные участники:**\n\n"
     
-    for i, row in enumerate(results, 1):
-        user_id, nickname, first_name, username, message_count = row
+    for row in results:
+        i, user_id, nickname, first_name, username, message_count = row
         # Use nickname if available, otherwise first_name, then username, then user_id
         display_name = nickname or first_name or username or str(user_id)
         
@@ -518,23 +572,126 @@ async def stats_command(message: Message):
         
         stats_text += f"{emoji} {display_name} — {message_count} сообщений\n"
     
+    if pages > 1:
+        stats_text += f"\nСтраница {page} из {pages}"
+        if page < pages:
+            stats_text += f" • следующая: `{command} {page + 1}`"
+    
+    if page > 1 or window:
+        await message.answer(stats_text, parse_mode="Markdown")
+        return
+    
+    # Daily activity chart, with the top list as its caption when it fits
+    try:
+        if len(stats_text) <= 1024:
+            sent = await activity_charts.answer_chart(message, db, assets,
+                                                      caption=stats_text, parse_mode="Markdown")
+            if sent:
+                return
+        else:
+            await activity_charts.answer_chart(message, db, assets)
+    except Exception as e:
+        logger.warning("Failed to send activity chart: %s", e)
+    
     await message.answer(stats_text, parse_mode="Markdown")
 
+@router.message(Command("find"))
+async def find_command(message: Message, db: Database, roster: AdminRoster):
+    """Handle /find command: full-text search over the chat's members"""
+    user = message.from_user
+    chat = message.chat
+    
+    if not user or chat.type == 'private':
+        await message.answer("❌ Команда доступна только в групповых чатах!")
+        return
+    
+    user_rank = await get_user_telegram_rank(message, user.id, db, roster)
+    if not user_rank or user_rank not in COMMAND_PERMISSIONS['find']:
+        await message.answer("❌ Недостаточно прав для использования этой команды!")
+        return
+    
+    # /find <текст> [страница]
+    args = (message.text or "").split()[1:]
+    page = 1
+    if len(args) > 1 and args[-1].isdigit() and int(args[-1]) > 0:
+        page = int(args.pop())
+    query = " ".join(args)
+    match = member_search_query(query, MEMBER_SEARCH_SETTINGS['min_term_length'],
+                                MEMBER_SEARCH_SETTINGS['max_terms'])
+    if not match:
+        await message.answer("❌ Использование: /find [имя, ник или описание] [страница]")
+        return
+    
+    page_size = MEMBER_SEARCH_SETTINGS['page_size']
+    rows, total = await db.search_chat_members(chat.id, match, page_size, (page - 1) * page_size)
+    pages = max(1, -(-total // page_size))
+    if not rows:
+        if page > 1 and total:
+            await message.answer(f"❌ Такой страницы нет. Всего страниц: {pages}")
+        else:
+            await message.answer(f"🔎 По запросу «{html.escape(query)}» никого не нашлось.")
+        return
+    
+    result_text = f"🔎 <b>Найдено участников: {total}</b>\n\n"
+    for place, (user_id, username, first_name, last_name, nickname, message_count) in enumerate(rows, (page - 1) * page_size + 1):
+        name = " ".join(part for part in (first_name, last_name) if part) or str(user_id)
+        line = f"{place}. {html.escape(nickname or name)}"
+        if nickname and nickname != name:
+            line += f" ({html.escape(name)})"
+        if username:
+            line += f" @{html.escape(username)}"
+        result_text += f"{line} — {message_count} сообщ., ID {user_id}\n"
+    
+    if pages > 1:
+        result_text += f"\nСтраница {page} из {pages}"
+        if page < pages:
+            result_text += f" • следующая: <code>/find {html.escape(query)} {page + 1}</code>"
+    
+    await message.answer(result_text)
+
+@router.my_chat_member()
+async def bot_membership_changed(event: ChatMemberUpdated, bot: Bot, db: Database, roster: AdminRoster,
+                                 name_index: NameIndex):
+    """Preload chat admins when the bot joins or is promoted, forget the chat when it leaves"""
+    chat = event.chat
+    if chat.type == 'private':
+        return
+    
+    status = event.new_chat_member.status
+    if status in ("member", "administrator"):
+        await db.add_chat(chat.id, chat.title or "Unknown Chat", chat.type)
+        roster.forget_chat(chat.id)
+        await roster.ensure_loaded(bot, chat.id)
+    elif status in ("left", "kicked"):
+        roster.forget_chat(chat.id)
+        name_index.forget_chat(chat.id)
+
+@router.chat_member()
+async def chat_member_changed(event: ChatMemberUpdated, roster: AdminRoster):
+    """Keep the admin roster current from member status updates"""
+    await roster.apply_member_update(event)
+    forget_cached_rank(event.chat.id, event.new_chat_member.user.id)
+
 # Alternative text commands (without slash)
-@router.message(F.text.in_(["стафф", "админы", "стаф", "кто админ"]))
-async def staff_text_command(message: Message):
+@text_commands.phrase("стафф", "админы", "стаф", "кто админ")
+async def staff_text_command(message: Message, db: Database, roster: AdminRoster):
     """Handle text alternatives for /staff command"""
     if message.chat.type != 'private':
-        await staff_command(message)
+        await staff_command(message, db, roster)
 
-@router.message(F.text.in_(["стата"]))
-async def stats_text_command(message: Message):
+@text_commands.command("стата", max_args=2)
+async def stats_text_command(message: Message, db: Database, assets: AssetRegistry, leaderboard: Leaderboard):
     """Handle text alternatives for /stats command"""
     if message.chat.type != 'private':
-        await stats_command(message)
+        await stats_command(message, db, assets, leaderboard)
+
+@text_commands.command("найти", "поиск", min_args=1)
+async def find_text_command(message: Message, db: Database, roster: AdminRoster):
+    """Handle text alternatives for /find command"""
+    await find_command(message, db, roster)
 
-@router.message(F.text.regexp(r"^бан\s+.+"))
-async def ban_text_command(message: Message):
+@text_commands.command("бан", min_args=1)
+async def ban_text_command(message: Message, db: Database, roster: AdminRoster, name_index: NameIndex):
     """Handle text alternatives for /ban command"""
     user = message.from_user
     chat = message.chat
@@ -543,30 +700,30 @@ async def ban_text_command(message: Message):
         return
     
     # Check permissions
-    user_rank = await get_user_telegram_rank(message, user.id)
+    user_rank = await get_user_telegram_rank(message, user.id, db, roster)
     if not user_rank or user_rank not in COMMAND_PERMISSIONS['ban']:
         await message.answer("❌ Недостаточно прав для использования этой команды!")
         return
     
     text = message.text or ""
     # Convert: "бан пользователь причина" -> "/ban пользователь причина"
-    # Find the word "бан" and replace it with "/ban"
-    command_text = text.replace("бан", "/ban", 1)
+    # Swap only the first word, whatever its case, so "бан" inside the arguments is kept
+    command_text = " ".join(["/ban"] + text.split()[1:])
     parts = command_text.split(maxsplit=2)
     
     if len(parts) < 2:
         await message.answer("❌ Использование: `бан [пользователь] [причина]` или ответьте на сообщение пользователя", parse_mode="Markdown")
         return
     
-    target_user_id, target_name = await get_moderation_target_user(message, command_text)
+    target_user_id, target_name = await get_moderation_target_user(message, db, name_index, command_text)
     reason = parts[2] if len(parts) > 2 else "Нарушение правил"
     
     if not target_user_id:
-        await message.answer("❌ Не удалось найти указанного пользователя!")
+        await message.answer(target_name or "❌ Не удалось найти указанного пользователя!")
         return
     
     # Check if user can moderate target
-    if not await can_moderate_target(message, user_rank, target_user_id):
+    if not await can_moderate_target(message, user_rank, target_user_id, db, roster):
         await message.answer("❌ Нельзя забанить пользователя с равным или высшим рангом!")
         return
     
@@ -577,8 +734,9 @@ async def ban_text_command(message: Message):
     except Exception as e:
         await message.answer(f"❌ Не удалось забанить пользователя: {str(e)}")
 
-@router.message(F.text.regexp(r"^кик\s+.+"))
-async def kick_text_command(message: Message):
+@text_commands.command("кик", min_args=1)
+async def kick_text_command(message: Message, db: Database, roster: AdminRoster, rate_limiter: RateLimiter,
+                            name_index: NameIndex):
     """Handle text alternatives for /kick command"""
     user = message.from_user
     chat = message.chat
@@ -587,34 +745,35 @@ async def kick_text_command(message: Message):
         return
     
     # Check permissions
-    user_rank = await get_user_telegram_rank(message, user.id)
+    user_rank = await get_user_telegram_rank(message, user.id, db, roster)
     if not user_rank or user_rank not in COMMAND_PERMISSIONS['kick']:
         await message.answer("❌ Недостаточно прав для использования этой команды!")
         return
     
     # Check rate limit
-    if not await check_rate_limit(user.id, 'kick', user_rank):
+    if not await check_rate_limit(rate_limiter, chat.id, user.id, 'kick', user_rank):
         await message.answer("⏰ Модератор может использовать эту команду раз в 15 минут!")
         return
     
     text = message.text or ""
     # Convert: "кик пользователь причина" -> "/kick пользователь причина"
-    command_text = text.replace("кик", "/kick", 1)
+    # Swap only the first word, whatever its case, so "кик" inside the arguments is kept
+    command_text = " ".join(["/kick"] + text.split()[1:])
     parts = command_text.split(maxsplit=2)
     
     if len(parts) < 2:
         await message.answer("❌ Использование: `кик [пользователь] [причина]` или ответьте на сообщение пользователя", parse_mode="Markdown")
         return
     
-    target_user_id, target_name = await get_moderation_target_user(message, command_text)
+    target_user_id, target_name = await get_moderation_target_user(message, db, name_index, command_text)
     reason = parts[2] if len(parts) > 2 else "Нарушение правил"
     
     if not target_user_id:
-        await message.answer("❌ Не удалось найти указанного пользователя!")
+        await message.answer(target_name or "❌ Не удалось найти указанного пользователя!")
         return
     
     # Check if user can moderate target
-    if not await can_moderate_target(message, user_rank, target_user_id):
+    if not await can_moderate_target(message, user_rank, target_user_id, db, roster):
         await message.answer("❌ Нельзя кикнуть пользователя с равным или высшим рангом!")
         return
     
@@ -626,8 +785,9 @@ async def kick_text_command(message: Message):
     except Exception as e:
         await message.answer(f"❌ Не удалось кикнуть пользователя: {str(e)}")
 
-@router.message(F.text.regexp(r"^варн\s+.+"))
-async def warn_text_command(message: Message):
+@text_commands.command("варн", min_args=1)
+async def warn_text_command(message: Message, db: Database, roster: AdminRoster, rate_limiter: RateLimiter,
+                            name_index: NameIndex):
     """Handle text alternatives for /warn command"""
     user = message.from_user
     chat = message.chat
@@ -636,34 +796,35 @@ async def warn_text_command(message: Message):
         return
     
     # Check permissions
-    user_rank = await get_user_telegram_rank(message, user.id)
+    user_rank = await get_user_telegram_rank(message, user.id, db, roster)
     if not user_rank or user_rank not in COMMAND_PERMISSIONS['warn']:
         await message.answer("❌ Недостаточно прав для использования этой команды!")
         return
     
     # Check rate limit
-    if not await check_rate_limit(user.id, 'warn', user_rank):
+    if not await check_rate_limit(rate_limiter, chat.id, user.id, 'warn', user_rank):
         await message.answer("⏰ Вы можете использовать эту команду раз в час!")
         return
     
     text = message.text or ""
     # Convert: "варн пользователь причина" -> "/warn пользователь причина"
-    command_text = text.replace("варн", "/warn", 1)
+    # Swap only the first word, whatever its case, so "варн" inside the arguments is kept
+    command_text = " ".join(["/warn"] + text.split()[1:])
     parts = command_text.split(maxsplit=2)
     
     if len(parts) < 2:
         await message.answer("❌ Использование: `варн [пользователь] [причина]` или ответьте на сообщение пользователя", parse_mode="Markdown")
         return
     
-    target_user_id, target_name = await get_moderation_target_user(message, command_text)
+    target_user_id, target_name = await get_moderation_target_user(message, db, name_index, command_text)
     reason = parts[2] if len(parts) > 2 else "Нарушение правил"
     
     if not target_user_id:
-        await message.answer("❌ Не удалось найти указанного пользователя!")
+        await message.answer(target_name or "❌ Не удалось найти указанного пользователя!")
         return
     
     # Check if user can moderate target
-    if not await can_moderate_target(message, user_rank, target_user_id):
+    if not await can_moderate_target(message, user_rank, target_user_id, db, roster):
         await message.answer("❌ Нельзя выдать варн пользователю с равным или высшим рангом!")
         return
     
@@ -1,37 +1,71 @@
-from aiogram import F, Router
-from aiogram.types import Message, FSInputFile
+import logging
+from aiogram import Router
+from aiogram.types import Message
 from aiogram.filters import Command
 from data.database import Database
-from utils.image_generator import image_gen
+from utils.asset_registry import AssetRegistry
+from utils.render_cache import render_cache
+from utils.render_engine import render_profile_card
+from data.name_index import NameIndex
+from handlers.moderation_handlers import resolve_target_user
+from middlewares.text_commands import text_commands
 from config import RANK_NAMES
-import os
+
+logger = logging.getLogger(__name__)
 
 router = Router()
-db = Database()
 
-async def get_target_user_for_profile(message: Message) -> tuple[int, str]:
+def format_card_count(count: int) -> str:
+    """Compact counter for profile cards: 999, 12.3K, 1.2M"""
+    if count < 10000:
+        return str(count)
+    if count < 1000000:
+        return f"{count / 1000:.1f}K".replace(".0K", "K")
+    return f"{count / 1000000:.1f}M".replace(".0M", "M")
+
+async def answer_profile(message: Message, assets: AssetRegistry, user_id: int,
+                         display_name: str, rank_name: str, message_count: int,
+                         description: str, profile_text: str):
+    """Send the profile text with the user's rendered card.
+
+    The card is content-addressed by the fields it shows: while they stay
+    the same the cached file_id is reused and nothing is rendered.
+    """
+    fields = (display_name, rank_name, format_card_count(message_count),
+              description or "Описание не установлено")
+    signature = render_cache.key_for(render_profile_card, *fields)
+
+    async def render():
+        return await render_cache.get_by_key(signature, render_profile_card, *fields)
+
+    try:
+        await assets.answer_rendered(
+            message, f"profile_card:{message.chat.id}:{user_id}", signature, render,
+            caption=profile_text,
+            parse_mode="Markdown"
+        )
+    except Exception as e:
+        logger.warning("Failed to send profile card: %s", e)
+        await message.answer(profile_text, parse_mode="Markdown")
+
+async def get_target_user_for_profile(message: Message, name_index: NameIndex) -> tuple[int, str]:
     """Get target user for profile commands"""
     # Check if it's a reply
     if message.reply_to_message and message.reply_to_message.from_user:
         user = message.reply_to_message.from_user
         return user.id, user.first_name or user.username or str(user.id)
     
-    # Parse username from command
+    # Parse user ID, @username, nickname or first name from command
     text = message.text or ""
     parts = text.split()
     if len(parts) > 1:
-        target = parts[1]
-        if target.startswith('@'):
-            # In real implementation, resolve username
-            return 0, target
-        elif target.isdigit():
-            return int(target), target
+        return await resolve_target_user(message, name_index, parts[1])
     
     return 0, ""
 
 @router.message(Command("me"))
-@router.message(F.text.lower() == "кто я")
-async def me_command(message: Message):
+@text_commands.phrase("кто я")
+async def me_command(message: Message, db: Database, assets: AssetRegistry):
     """Handle /me and 'кто я' commands"""
     user = message.from_user
     chat = message.chat
@@ -40,14 +74,6 @@ async def me_command(message: Message):
         await message.answer("❌ Команда доступна только в групповых чатах!")
         return
     
-    # Generate user profile image if not exists
-    image_path = "images/user_profile.png"
-    if not os.path.exists(image_path):
-        try:
-            await image_gen.generate_user_profile_image()
-        except Exception as e:
-            print(f"Failed to generate user profile image: {e}")
-    
     # Get user info
     user_info = await db.get_user_info(user.id)
     user_rank = await db.get_user_rank(user.id, chat.id)
@@ -68,22 +94,13 @@ async def me_command(message: Message):
     else:
         profile_text += "**Описание:** не установлено\n"
     
-    try:
-        if os.path.exists(image_path):
-            photo = FSInputFile(image_path)
-            await message.answer_photo(
-                photo=photo,
-                caption=profile_text,
-                parse_mode="Markdown"
-            )
-        else:
-            await message.answer(profile_text, parse_mode="Markdown")
-    except Exception as e:
-        await message.answer(profile_text, parse_mode="Markdown")
+    await answer_profile(message, assets, user.id, display_name,
+                         RANK_NAMES.get(user_rank, 'Неизвестен'), message_count,
+                         user_info['description'] if user_info else None, profile_text)
 
 @router.message(Command("you"))
-@router.message(F.text.lower() == "кто ты")
-async def you_command(message: Message):
+@text_commands.phrase("кто ты")
+async def you_command(message: Message, db: Database, assets: AssetRegistry, name_index: NameIndex):
     """Handle /you and 'кто ты' commands"""
     user = message.from_user
     chat = message.chat
@@ -93,20 +110,16 @@ async def you_command(message: Message):
         return
     
     # Get target user
-    target_user_id, target_name = await get_target_user_for_profile(message)
+    target_user_id, target_name = await get_target_user_for_profile(message, name_index)
     
     if not target_user_id:
+        if target_name:
+            # Not found in the chat, or more than one member matches
+            await message.answer(target_name)
+            return
         await message.answer("❌ Укажите пользователя: `/you @username` или ответьте на сообщение", parse_mode="Markdown")
         return
     
-    # Generate user profile image if not exists
-    image_path = "images/user_profile.png"
-    if not os.path.exists(image_path):
-        try:
-            await image_gen.generate_user_profile_image()
-        except Exception as e:
-            print(f"Failed to generate user profile image: {e}")
-    
     # Get user info
     user_info = await db.get_user_info(target_user_id)
     user_rank = await db.get_user_rank(target_user_id, chat.id)
@@ -131,23 +144,13 @@ async def you_command(message: Message):
     else:
         profile_text += "**Описание:** не установлено\n"
     
-    try:
-        if os.path.exists(image_path):
-            photo = FSInputFile(image_path)
-            await message.answer_photo(
-                photo=photo,
-                caption=profile_text,
-                parse_mode="Markdown"
-            )
-        else:
-            await message.answer(profile_text, parse_mode="Markdown")
-    except Exception as e:
-        await message.answer(profile_text, parse_mode="Markdown")
+    await answer_profile(message, assets, target_user_id, display_name,
+                         RANK_NAMES.get(user_rank, 'Неизвестен'), message_count,
+                         user_info['description'] if user_info else None, profile_text)
 
 @router.message(Command("nickname"))
-@router.message(F.text.startswith("+ник "))
-@router.message(F.text.startswith("+имя "))
-async def nickname_command(message: Message):
+@text_commands.command("+ник", "+имя", min_args=1)
+async def nickname_command(message: Message, db: Database, name_index: NameIndex):
     """Handle nickname setting commands"""
     user = message.from_user
     chat = message.chat
@@ -158,14 +161,9 @@ async def nickname_command(message: Message):
     
     text = message.text or ""
     
-    # Parse nickname from different command formats
-    nickname = ""
-    if text.startswith("/nickname "):
-        nickname = text[10:].strip()
-    elif text.startswith("+ник "):
-        nickname = text[5:].strip()
-    elif text.startswith("+имя "):
-        nickname = text[5:].strip()
+    # Everything after the command word: /nickname, +ник or +имя
+    parts = text.split(maxsplit=1)
+    nickname = parts[1].strip() if len(parts) > 1 else ""
     
     if not nickname:
         await message.answer("❌ Укажите никнейм: `/nickname ВашНикнейм`", parse_mode="Markdown")
@@ -177,12 +175,12 @@ async def nickname_command(message: Message):
     
     # Set nickname
     await db.set_user_nickname(user.id, nickname)
+    name_index.set_nickname(user.id, nickname)
     await message.answer(f"✅ Никнейм установлен: **{nickname}**", parse_mode="Markdown")
 
 @router.message(Command("description"))
-@router.message(F.text.startswith("+опис "))
-@router.message(F.text.startswith("+описание "))
-async def description_command(message: Message):
+@text_commands.command("+опис", "+описание", min_args=1)
+async def description_command(message: Message, db: Database):
     """Handle description setting commands"""
     user = message.from_user
     chat = message.chat
@@ -193,14 +191,9 @@ async def description_command(message: Message):
     
     text = message.text or ""
     
-    # Parse description from different command formats
-    description = ""
-    if text.startswith("/description "):
-        description = text[13:].strip()
-    elif text.startswith("+опис "):
-        description = text[6:].strip()
-    elif text.startswith("+описание "):
-        description = text[10:].strip()
+    # Everything after the command word: /description, +опис or +описание
+    parts = text.split(maxsplit=1)
+    description = parts[1].strip() if len(parts) > 1 else ""
     
     if not description:
         await message.answer("❌ Укажите описание: `/description Ваше описание`", parse_mode="Markdown")
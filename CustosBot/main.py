@@ -1,18 +1,207 @@
 import asyncio
 import logging
 import os
+import signal
+from typing import Dict
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from handlers import main_handlers, moderation_handlers, user_handlers
 from data.database import Database
-from config import BOT_TOKEN
+from data.message_buffer import MessageBuffer
+from data.leaderboard import Leaderboard
+from data.name_index import NameIndex
+from data.rollups import RollupReconciler
+from data.compaction import CompactionJob
+from data.rate_limiter import RateLimiter
+from middlewares.flood_guard import FloodGuard
+from middlewares.log_context import UpdateLogContext, HandlerLogName
+from middlewares.metrics import HandlerMetrics, ApiMetrics
+from middlewares.send_scheduler import SendScheduler
+from middlewares.text_commands import TextCommandDispatcher, text_commands
+from data.roster import AdminRoster
+from utils.asset_registry import AssetRegistry
+from utils.image_generator import image_gen
+from utils.metrics import metrics, start_metrics_server
+from utils.render_cache import render_cache
+from utils.render_engine import render_engine
+from utils.sharding import WorkerPool, ShardForwarder, serve_queue
+from utils.webhook_server import run_webhook
+from utils.logs import setup_logging
+from config import BOT_TOKEN, BOT_MODE, SEND_SCHEDULER_SETTINGS, WORKER_SETTINGS
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging: records are written by a background thread, never by the event loop
+setup_logging()
 logger = logging.getLogger(__name__)
 
+def create_bot() -> Bot:
+    return Bot(
+        token=BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+
+def include_routers(dp: Dispatcher):
+    # Register routers - specific handlers BEFORE general handlers
+    dp.include_router(moderation_handlers.router)
+    dp.include_router(user_handlers.router)
+    dp.include_router(main_handlers.router)
+
+async def start_services(bot: Bot, dp: Dispatcher, worker: int = 0, workers: int = 1) -> Dict:
+    """Create the services handlers depend on and register them with dp.
+    
+    With several worker processes each one gets 1/workers of the global send
+    rate, and only worker 0 runs the database maintenance jobs.
+    """
+    # Every outgoing message is paced to Telegram's limits and retried after 429s
+    send_scheduler = SendScheduler({
+        'global_rate': SEND_SCHEDULER_SETTINGS['global_rate'] / workers,
+        'global_burst': max(1, SEND_SCHEDULER_SETTINGS['global_burst'] // workers)
+    })
+    bot.session.middleware(send_scheduler)
+    dp["send_scheduler"] = send_scheduler
+    # Count each API attempt by method and result (inside the scheduler, so 429 retries count too)
+    bot.session.middleware(ApiMetrics())
+    
+    # Initialize the shared database service and inject it into handlers
+    db = Database()
+    await db.init_db()
+    dp["db"] = db
+    
+    # /stats leaderboards, kept current by the message buffer
+    leaderboard = Leaderboard(db)
+    dp["leaderboard"] = leaderboard
+    
+    # Member names per chat for resolving @username/nickname targets, kept warm by the buffer
+    name_index = NameIndex(db)
+    dp["name_index"] = name_index
+    
+    # Batch message counters instead of writing on every message
+    message_buffer = MessageBuffer(db, leaderboard=leaderboard, name_index=name_index)
+    message_buffer.start()
+    dp["message_buffer"] = message_buffer
+    
+    # Periodically rebuild recent weekly/monthly rollups from the daily rows
+    rollups = RollupReconciler(db)
+    # Fold old statistics, expire warnings, vacuum and analyze in small slices
+    compaction = CompactionJob(db)
+    if worker == 0:
+        rollups.start()
+        compaction.start()
+    
+    # Command cooldowns, persisted across restarts
+    rate_limiter = RateLimiter(db)
+    await rate_limiter.load()
+    rate_limiter.start()
+    dp["rate_limiter"] = rate_limiter
+    
+    # Staff mirror kept current from chat_member updates
+    dp["roster"] = AdminRoster(db)
+    
+    # Send images by Telegram file_id once they have been uploaded
+    assets = AssetRegistry(db)
+    await assets.load()
+    dp["assets"] = assets
+    
+    # chat_id/user_id/handler/latency on every record logged while handling an update
+    dp.update.outer_middleware(UpdateLogContext())
+    # Latency histogram and error count per handler
+    dp.update.outer_middleware(HandlerMetrics())
+    dp.message.middleware(HandlerLogName())
+    dp.callback_query.middleware(HandlerLogName())
+    
+    # Drop flood before any handler or database work
+    flood_guard = FloodGuard()
+    dp.message.outer_middleware(flood_guard)
+    # Plain text goes straight to its text command or to the message counter
+    text_dispatcher = TextCommandDispatcher(text_commands)
+    dp.message.outer_middleware(text_dispatcher)
+    
+    include_routers(dp)
+    
+    # Create images directory
+    os.makedirs("images", exist_ok=True)
+    
+    # Build all bot images in the background; handlers wait on the same builds
+    render_engine.start()
+    image_gen.start_warm_up()
+    
+    # Services' own counters next to the handler/DB/API metrics, read when scraped
+    metrics.expose_stats('custos_send_scheduler', "Send scheduler", lambda: {**send_scheduler.stats, 'depth': send_scheduler.depth})
+    metrics.expose_stats('custos_render_engine', "Render engine", lambda: render_engine.stats)
+    metrics.expose_stats('custos_render_cache', "Render cache", lambda: render_cache.stats)
+    metrics.expose_stats('custos_flood_guard', "Flood guard", lambda: flood_guard.stats)
+    metrics.expose_stats('custos_message_buffer', "Message buffer", lambda: {**message_buffer.stats, 'pending': message_buffer.pending})
+    metrics.expose_stats('custos_rate_limiter', "Rate limiter", lambda: {**rate_limiter.stats, 'pending': rate_limiter.pending})
+    metrics.expose_stats('custos_text_commands', "Text command dispatcher", lambda: text_dispatcher.stats)
+    metrics_server = await start_metrics_server(metrics, worker=worker)
+    
+    return {
+        'send_scheduler': send_scheduler, 'db': db, 'message_buffer': message_buffer,
+        'rollups': rollups, 'compaction': compaction, 'rate_limiter': rate_limiter,
+        'metrics_server': metrics_server
+    }
+
+async def stop_services(bot: Bot, services: Dict):
+    if services['metrics_server'] is not None:
+        await services['metrics_server'].cleanup()
+    await services['message_buffer'].stop()
+    await services['rollups'].stop()
+    await services['compaction'].stop()
+    await services['rate_limiter'].stop()
+    await services['db'].close()
+    await image_gen.close()
+    render_engine.shutdown()
+    await services['send_scheduler'].close()
+    await bot.session.close()
+
+async def receive_updates(bot: Bot, dp: Dispatcher):
+    # Receive updates by long polling or through the webhook server
+    if BOT_MODE == "webhook":
+        await run_webhook(bot, dp)
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
+
+async def run_worker(index: int, count: int, worker_queue):
+    """One worker process: the full bot, fed by the supervisor instead of Telegram"""
+    bot = create_bot()
+    dp = Dispatcher()
+    render_engine.settings['workers'] = WORKER_SETTINGS['render_workers']
+    services = await start_services(bot, dp, worker=index, workers=count)
+    logger.info("Worker %s/%s is ready", index, count)
+    try:
+        await serve_queue(bot, dp, worker_queue)
+    finally:
+        await stop_services(bot, services)
+
+def worker_process(index: int, count: int, worker_queue):
+    # Ctrl+C and systemd signal the whole process group; the supervisor stops workers in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(run_worker(index, count, worker_queue))
+
+async def run_supervisor(bot: Bot, dp: Dispatcher):
+    """Receive updates and hand each chat to one of the worker processes"""
+    # Migrate the schema and build the image assets once, before the workers share them
+    db = Database()
+    await db.init_db()
+    await db.close()
+    os.makedirs("images", exist_ok=True)
+    await image_gen.warm_up()
+    await image_gen.close()
+    
+    pool = WorkerPool(worker_process)
+    pool.start()
+    dp.update.outer_middleware(ShardForwarder(pool))
+    # Routers are only included so polling/webhook subscribe to the update types they use
+    include_routers(dp)
+    try:
+        await receive_updates(bot, dp)
+    finally:
+        await pool.stop()
+        logger.info("Updates forwarded per worker: %s", pool.stats['forwarded'])
+
 async def main():
     """Main function to start the bot"""
     # Check if BOT_TOKEN is available
@@ -26,33 +215,29 @@ async def main():
         return
     
     # Initialize bot and dispatcher
-    bot = Bot(
-        token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
+    bot = create_bot()
     dp = Dispatcher()
     
-    # Initialize database
-    db = Database()
-    await db.init_db()
-    
-    # Register routers - specific handlers BEFORE general handlers
-    dp.include_router(moderation_handlers.router)
-    dp.include_router(user_handlers.router) 
-    dp.include_router(main_handlers.router)
+    if WORKER_SETTINGS['processes'] > 1:
+        logger.info("Custos Bot is starting (%s, %s workers)...", BOT_MODE, WORKER_SETTINGS['processes'])
+        try:
+            await run_supervisor(bot, dp)
+        except Exception as e:
+            logger.error("Bot error: %s", e)
+        finally:
+            await bot.session.close()
+        return
     
-    # Create images directory
-    os.makedirs("images", exist_ok=True)
+    services = await start_services(bot, dp)
     
-    logger.info("Custos Bot is starting...")
+    logger.info("Custos Bot is starting (%s)...", BOT_MODE)
     
-    # Start polling
     try:
-        await dp.start_polling(bot)
+        await receive_updates(bot, dp)
     except Exception as e:
-        logger.error(f"Bot error: {e}")
+        logger.error("Bot error: %s", e)
     finally:
-        await bot.session.close()
+        await stop_services(bot, services)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import ChatPermissions, Message
+
+from config import FLOOD_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+class SlidingWindowCounter:
+    """Approximate sliding-window counters for many keys, O(1) per hit.
+
+    Each key keeps the count of the current and the previous fixed window;
+    the rate is the current count plus the previous one weighted by how
+    much of it still overlaps the sliding window. Keys are kept in LRU
+    order and the least recently hit are dropped past ``maxsize``.
+    """
+
+    __slots__ = ('window', 'maxsize', '_entries')
+
+    def __init__(self, window: float, maxsize: int):
+        self.window = window
+        self.maxsize = maxsize
+        # key -> [window start, previous count, current count]
+        self._entries: OrderedDict = OrderedDict()
+
+    def hit(self, key, now: float) -> float:
+        """Count one event for key and return the events in the last window"""
+        entries = self._entries
+        window = self.window
+        entry = entries.get(key)
+        if entry is None:
+            entry = [now, 0, 0]
+            entries[key] = entry
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+        else:
+            entries.move_to_end(key)
+            elapsed = now - entry[0]
+            if elapsed >= window:
+                if elapsed < 2 * window:
+                    entry[1] = entry[2]
+                    entry[0] += window
+                else:
+                    entry[1] = 0
+                    entry[0] = now
+                entry[2] = 0
+        entry[2] += 1
+        return entry[1] * (1 - (now - entry[0]) / window) + entry[2]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class FloodGuard(BaseMiddleware):
+    """Outer message middleware that drops flood before any handler runs.
+
+    Registered with ``dp.message.outer_middleware`` so flooding messages
+    never reach filters, handlers, the message buffer or SQLite. A user over
+    ``user_limit`` messages per ``user_window`` seconds in a chat is muted
+    (or warned, see ``action``) once per ``notice_cooldown``; while a whole
+    chat is over ``chat_limit`` its messages are dropped and a single raid
+    notice is posted. Staff known to the admin roster are never limited.
+    Telegram calls run as background tasks so the guard itself never waits.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self.settings = {**FLOOD_SETTINGS, **(settings or {})}
+        self.users = SlidingWindowCounter(self.settings['user_window'], self.settings['max_tracked'])
+        self.chats = SlidingWindowCounter(self.settings['chat_window'], self.settings['max_tracked'])
+        # key -> time of the last action, oldest first
+        self._acted_at: OrderedDict = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {'checked': 0, 'dropped': 0, 'actions': 0}
+
+    def check(self, chat_id: int, user_id: int, now: Optional[float] = None) -> Optional[str]:
+        """Count a message; 'user' or 'chat' when it is flood, None otherwise"""
+        now = time.monotonic() if now is None else now
+        self.stats['checked'] += 1
+        if self.chats.hit(chat_id, now) > self.settings['chat_limit']:
+            return 'chat'
+        if self.users.hit((chat_id, user_id), now) > self.settings['user_limit']:
+            return 'user'
+        return None
+
+    def _should_act(self, key: tuple, now: float) -> bool:
+        acted = self._acted_at
+        cooldown = self.settings['notice_cooldown']
+        acted_at = acted.get(key)
+        if acted_at is not None and now - acted_at < cooldown:
+            return False
+        acted[key] = now
+        acted.move_to_end(key)
+        # Drop from the oldest end: expired entries, then any past max_tracked
+        while acted:
+            oldest = next(iter(acted.values()))
+            if now - oldest < cooldown and len(acted) <= self.settings['max_tracked']:
+                break
+            acted.popitem(last=False)
+        return True
+
+    def _spawn(self, coro: Awaitable):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _punish(self, message: Message, data: Dict[str, Any]):
+        user = message.from_user
+        name = user.first_name or user.username or str(user.id)
+        try:
+            if self.settings['action'] == 'restrict':
+                await message.bot.restrict_chat_member(
+                    message.chat.id, user.id,
+                    permissions=ChatPermissions(can_send_messages=False),
+                    until_date=timedelta(seconds=self.settings['restrict_seconds'])
+                )
+                minutes = max(1, self.settings['restrict_seconds'] // 60)
+                await message.answer(f"🔇 {name} замучен на {minutes} мин. за флуд")
+            else:
+                db = data.get('db')
+                if db is not None:
+                    await db.add_warning(user.id, message.chat.id, "Флуд", message.bot.id)
+                await message.answer(f"⚠️ {name}, не флудите!")
+        except Exception as e:
+            logger.warning("Flood action against %s in %s failed: %s", user.id, message.chat.id, e)
+
+    async def _announce_raid(self, message: Message):
+        try:
+            await message.answer("🚨 Слишком много сообщений в чате. Бот временно не обрабатывает команды.")
+        except Exception as e:
+            logger.warning("Raid notice in %s failed: %s", message.chat.id, e)
+
+    async def __call__(self, handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+                       event: Message, data: Dict[str, Any]) -> Any:
+        if not self.settings['enabled'] or event.chat.type == 'private' or event.from_user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        verdict = self.check(event.chat.id, event.from_user.id, now)
+        if verdict is None:
+            return await handler(event, data)
+
+        roster = data.get('roster')
+        if roster is not None and roster.cached_rank(event.chat.id, event.from_user.id) not in (None, 'participant'):
+            return await handler(event, data)
+
+        self.stats['dropped'] += 1
+        if verdict == 'user' and self._should_act((event.chat.id, event.from_user.id), now):
+            self.stats['actions'] += 1
+            self._spawn(self._punish(event, data))
+        elif verdict == 'chat' and self._should_act((event.chat.id,), now):
+            self.stats['actions'] += 1
+            self._spawn(self._announce_raid(event))
+        return None
@@ -0,0 +1,50 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import LOGGING_SETTINGS
+from utils.logs import bind_log_fields, reset_log_fields, set_log_fields
+
+logger = logging.getLogger(__name__)
+
+class UpdateLogContext(BaseMiddleware):
+    """Outer update middleware that gives every log record of an update its context.
+
+    Registered first with ``dp.update.outer_middleware``: records logged
+    while the update is handled carry chat_id and user_id (and handler,
+    once HandlerLogName or the text command dispatcher picked one). The
+    update's latency is logged at DEBUG, or as a warning past ``slow_update``.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self.settings = {**LOGGING_SETTINGS, **(settings or {})}
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        chat = data.get('event_chat')
+        user = data.get('event_from_user')
+        token = bind_log_fields(chat_id=chat.id if chat else None, user_id=user.id if user else None)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            set_log_fields(latency_ms=round(elapsed * 1000, 1))
+            if elapsed >= self.settings['slow_update']:
+                logger.warning("Slow update %s (%s)", event.update_id, event.event_type)
+            else:
+                logger.debug("Update %s (%s) handled", event.update_id, event.event_type)
+            reset_log_fields(token)
+
+class HandlerLogName(BaseMiddleware):
+    """Inner middleware that names the router handler in the log context"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        if handler_object is not None:
+            set_log_fields(handler=handler_object.callback.__name__)
+        return await handler(event, data)
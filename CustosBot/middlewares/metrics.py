@@ -0,0 +1,83 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.exceptions import (TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+                                TelegramNotFound, TelegramRetryAfter, TelegramServerError)
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Update
+
+from config import METRICS_SETTINGS
+from utils.logs import get_log_fields
+from utils.metrics import metrics
+
+HANDLER_SECONDS = metrics.histogram('custos_handler_seconds', "Update handling time in seconds",
+                                    ('handler', 'event'), METRICS_SETTINGS['handler_buckets'])
+HANDLER_ERRORS = metrics.counter('custos_handler_errors_total', "Updates whose handler raised",
+                                 ('handler', 'event', 'error'))
+API_SECONDS = metrics.histogram('custos_telegram_api_seconds', "Telegram Bot API request time in seconds",
+                                ('method',), METRICS_SETTINGS['api_buckets'])
+API_CALLS = metrics.counter('custos_telegram_api_calls_total', "Telegram Bot API requests by result",
+                            ('method', 'result'))
+
+# Checked in order, so subclasses come before their bases
+API_RESULTS = (
+    (TelegramRetryAfter, 'retry_after'),
+    (TelegramNotFound, 'not_found'),
+    (TelegramBadRequest, 'bad_request'),
+    (TelegramForbiddenError, 'forbidden'),
+    (TelegramServerError, 'server_error'),
+    (TelegramNetworkError, 'network_error'),
+)
+
+def api_result(error: Exception) -> str:
+    for error_type, result in API_RESULTS:
+        if isinstance(error, error_type):
+            return result
+    return 'error'
+
+class HandlerMetrics(BaseMiddleware):
+    """Outer update middleware: latency histogram and error count per handler.
+
+    Registered with ``dp.update.outer_middleware`` after UpdateLogContext,
+    whose context names the handler that ran (``unhandled`` if none did).
+    """
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except Exception as e:
+            name = get_log_fields().get('handler', 'unknown')
+            HANDLER_ERRORS.inc(name, event.event_type, type(e).__name__)
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name, event.event_type)
+            raise
+        name = 'unhandled' if result is UNHANDLED else get_log_fields().get('handler', 'other')
+        HANDLER_SECONDS.observe(time.perf_counter() - started, name, event.event_type)
+        return result
+
+class ApiMetrics(BaseRequestMiddleware):
+    """Session middleware counting Bot API requests by method and result.
+
+    Registered with ``bot.session.middleware`` after the SendScheduler, so
+    each attempt is counted (a 429 and its retry are two calls) and the
+    time waiting for a send budget is not included.
+    """
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            response = await make_request(bot, method)
+        except Exception as e:
+            API_CALLS.inc(name, api_result(e))
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+        API_CALLS.inc(name, 'ok')
+        return response
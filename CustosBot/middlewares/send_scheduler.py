@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import SEND_SCHEDULER_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Scheduled before replies when both wait for the same budget
+PRIORITY_MODERATION = 0
+PRIORITY_REPLY = 1
+
+MODERATION_METHODS = {
+    'BanChatMember', 'UnbanChatMember', 'RestrictChatMember', 'PromoteChatMember',
+    'DeleteMessage', 'DeleteMessages', 'AnswerCallbackQuery'
+}
+
+# Methods that count against Telegram's message limits
+REPLY_PREFIXES = ('Send', 'Edit', 'Copy', 'Forward')
+
+def method_priority(method: TelegramMethod) -> Optional[int]:
+    """Queue priority of an API method, None for calls that are not rate limited (reads etc.)"""
+    name = type(method).__name__
+    if name in MODERATION_METHODS:
+        return PRIORITY_MODERATION
+    if name.startswith(REPLY_PREFIXES):
+        return PRIORITY_REPLY
+    return None
+
+class TokenBucket:
+    """``rate`` tokens per second, at most ``capacity`` saved up"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+        self.blocked_until = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def ready_at(self, now: float) -> float:
+        """Monotonic time when one token is available"""
+        self.refill(now)
+        if self.tokens >= 1:
+            return max(now, self.blocked_until)
+        return max(now + (1 - self.tokens) / self.rate, self.blocked_until)
+
+class _Ticket:
+    __slots__ = ('chat_id', 'future', 'queued_at')
+
+    def __init__(self, chat_id, future: asyncio.Future, queued_at: float):
+        self.chat_id = chat_id
+        self.future = future
+        self.queued_at = queued_at
+
+class SendScheduler(BaseRequestMiddleware):
+    """Session middleware that paces every outgoing message through one queue.
+
+    Registered with ``bot.session.middleware``, so handlers keep calling
+    ``message.answer`` and friends directly. Calls that send or moderate
+    wait for a token from the global bucket (``global_rate`` per second)
+    and from their chat's bucket (``group_rate`` in groups,
+    ``private_rate`` in private chats); moderation actions are granted
+    before replies. A 429 blocks the chat (or, without a chat, every chat)
+    for the ``retry_after`` Telegram returned and the call is queued again,
+    up to ``max_retries`` times. Reads such as getChatMember pass straight
+    through. Queue depth and wait times are collected in ``stats``.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self.settings = {**SEND_SCHEDULER_SETTINGS, **(settings or {})}
+        now = time.monotonic()
+        self._global = TokenBucket(self.settings['global_rate'], self.settings['global_burst'], now)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._queues = {PRIORITY_MODERATION: deque(), PRIORITY_REPLY: deque()}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'granted': 0, 'max_depth': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+                      'retry_after': 0, 'retry_after_seconds': 0.0, 'gave_up': 0}
+
+    @property
+    def depth(self) -> int:
+        """Calls currently waiting for a send budget"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.settings['max_chats']:
+                self._forget_idle_chats(now)
+            group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+            rate = self.settings['group_rate'] if group else self.settings['private_rate']
+            burst = self.settings['group_burst'] if group else self.settings['private_burst']
+            bucket = self._chats[chat_id] = TokenBucket(rate, burst, now)
+        return bucket
+
+    def _forget_idle_chats(self, now: float):
+        # A full, unblocked bucket carries no state worth keeping
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items()
+                        if bucket.ready_at(now) <= now and bucket.tokens >= bucket.capacity]:
+            del self._chats[chat_id]
+
+    async def _acquire(self, chat_id, priority: int):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(_Ticket(chat_id, future, time.monotonic()))
+        self.stats['max_depth'] = max(self.stats['max_depth'], self.depth)
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def _grant_ready(self, now: float) -> float:
+        """Grant every ticket whose budgets allow it; return when to look again"""
+        next_check = float('inf')
+        for queue in self._queues.values():
+            for ticket in list(queue):
+                if ticket.future.done():
+                    queue.remove(ticket)
+                    continue
+                global_at = self._global.ready_at(now)
+                if global_at > now:
+                    return min(next_check, global_at)
+                chat_at = self._chat_bucket(ticket.chat_id, now).ready_at(now) if ticket.chat_id is not None else now
+                if chat_at > now:
+                    next_check = min(next_check, chat_at)
+                    continue
+                self._global.tokens -= 1
+                if ticket.chat_id is not None:
+                    self._chats[ticket.chat_id].tokens -= 1
+                queue.remove(ticket)
+                ticket.future.set_result(None)
+
+                waited = now - ticket.queued_at
+                self.stats['granted'] += 1
+                self.stats['wait_seconds'] += waited
+                self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], waited)
+        return next_check
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            next_check = self._grant_ready(time.monotonic())
+            timeout = None if next_check == float('inf') else max(0.0, next_check - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _block(self, chat_id, retry_after: float):
+        now = time.monotonic()
+        bucket = self._chat_bucket(chat_id, now) if chat_id is not None else self._global
+        bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+        bucket.tokens = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        priority = method_priority(method)
+        if priority is None:
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, 'chat_id', None)
+        for attempt in range(self.settings['max_retries'] + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.stats['retry_after'] += 1
+                self.stats['retry_after_seconds'] += e.retry_after
+                if attempt == self.settings['max_retries']:
+                    self.stats['gave_up'] += 1
+                    raise
+                logger.warning("%s to %s hit flood control, retrying in %s s",
+                               type(method).__name__, chat_id, e.retry_after)
+                self._block(chat_id, e.retry_after)
+
+    async def close(self):
+        """Stop the scheduler loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
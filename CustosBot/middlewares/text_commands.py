@@ -0,0 +1,108 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.types import Message
+
+from utils.logs import set_log_fields
+
+class TextCommand:
+    __slots__ = ('callback', 'min_args', 'max_args')
+
+    def __init__(self, callback: Callable, min_args: int = 0, max_args: Optional[int] = None):
+        self.callback = CallableObject(callback)
+        self.min_args = min_args
+        self.max_args = max_args
+
+    def accepts(self, args: str) -> bool:
+        if self.min_args == 0 and self.max_args is None:
+            return True
+        limit = self.max_args if self.max_args is not None else self.min_args
+        count = len(args.split(None, limit)) if args else 0
+        if self.max_args is not None and count > self.max_args:
+            return False
+        return count >= self.min_args
+
+class TextCommandTable:
+    """Text commands without a slash, looked up by their first word.
+
+    Handlers register with the decorators below instead of ``F.text``
+    filters; matching is case-insensitive. ``phrase`` matches the whole
+    message (extra spaces ignored), ``command`` its first word followed by
+    between ``min_args`` and ``max_args`` words, and the ``fallback``
+    handler gets any other text that does not start with a slash.
+    """
+
+    def __init__(self):
+        self._phrases: Dict[str, TextCommand] = {}
+        self._commands: Dict[str, TextCommand] = {}
+        self._longest_phrase = 0
+        self.default: Optional[CallableObject] = None
+
+    def phrase(self, *phrases: str):
+        def decorator(callback):
+            for phrase in phrases:
+                key = " ".join(phrase.lower().split())
+                self._phrases[key] = TextCommand(callback)
+                self._longest_phrase = max(self._longest_phrase, len(phrase))
+            return callback
+        return decorator
+
+    def command(self, *names: str, min_args: int = 0, max_args: Optional[int] = None):
+        def decorator(callback):
+            for name in names:
+                self._commands[name.lower()] = TextCommand(callback, min_args, max_args)
+            return callback
+        return decorator
+
+    def fallback(self, callback):
+        self.default = CallableObject(callback)
+        return callback
+
+    def match(self, text: str) -> Optional[TextCommand]:
+        lowered = text.lower()
+        # Phrases are short; longer messages skip the whitespace normalization
+        if len(text) <= self._longest_phrase * 2:
+            found = self._phrases.get(" ".join(lowered.split()))
+            if found is not None:
+                return found
+        words = lowered.split(None, 1)
+        if not words:
+            return None
+        found = self._commands.get(words[0])
+        if found is not None and found.accepts(words[1] if len(words) > 1 else ""):
+            return found
+        return None
+
+class TextCommandDispatcher(BaseMiddleware):
+    """Outer message middleware that routes plain text without the filter cascade.
+
+    Registered with ``dp.message.outer_middleware`` after the flood guard.
+    A text message is looked up once in the table and handed to the
+    matching handler (or, if none matches, to the table's fallback, the
+    message counter); routers only see slash commands and non-text messages.
+    """
+
+    def __init__(self, table: TextCommandTable):
+        self.table = table
+        self.stats = {'commands': 0, 'default': 0}
+
+    async def __call__(self, handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+                       event: Message, data: Dict[str, Any]) -> Any:
+        text = event.text
+        if text is None or text.startswith('/'):
+            return await handler(event, data)
+
+        command = self.table.match(text)
+        if command is not None:
+            self.stats['commands'] += 1
+            set_log_fields(handler=command.callback.callback.__name__)
+            return await command.callback.call(event, **data)
+        if self.table.default is not None:
+            self.stats['default'] += 1
+            set_log_fields(handler=self.table.default.callback.__name__)
+            return await self.table.default.call(event, **data)
+        return await handler(event, data)
+
+# Create global instance
+text_commands = TextCommandTable()
@@ -0,0 +1,150 @@
+"""Throughput benchmark for the per-message path: FloodGuard and MessageBuffer.
+
+Two measurements:
+
+* ``check``: FloodGuard.check alone on a synthetic stream where a share of
+  the users flood and a few chats are raided, with a simulated clock at
+  ``--rate`` messages per second.
+* ``path``: each message goes through the FloodGuard middleware into the
+  real track_messages handler, which records it in the write-behind
+  MessageBuffer; the buffer flushes to a temporary SQLite database as it
+  does in production. The time includes the final flush, and the counters
+  written are checked against the messages that passed the guard.
+
+Run from the CustosBot directory::
+
+    python scripts/bench_flood_guard.py --messages 50000
+
+Exits with status 1 when either rate is below ``--target`` (5000 msg/s).
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import Chat, Message, User
+
+from config import FLOOD_SETTINGS
+from data.database import Database
+from data.leaderboard import Leaderboard
+from data.message_buffer import MessageBuffer
+from data.name_index import NameIndex
+from handlers.main_handlers import track_messages
+from middlewares.flood_guard import FloodGuard
+
+def synthetic_stream(count: int, chats: int, users: int, flooders: float, seed: int):
+    """(chat_id, user_id) pairs; ``flooders`` of the messages come from 20 users in 5 chats"""
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(count):
+        if rng.random() < flooders:
+            stream.append((-1000 - rng.randrange(5), 1 + rng.randrange(20)))
+        else:
+            stream.append((-2000 - rng.randrange(chats), 100 + rng.randrange(users)))
+    return stream
+
+def bench_check(stream, rate: float) -> dict:
+    guard = FloodGuard()
+    step = 1 / rate
+    started = time.perf_counter()
+    verdicts = {None: 0, 'user': 0, 'chat': 0}
+    for i, (chat_id, user_id) in enumerate(stream):
+        verdicts[guard.check(chat_id, user_id, i * step)] += 1
+    elapsed = time.perf_counter() - started
+    return {'elapsed': elapsed, 'rate': len(stream) / elapsed,
+            'passed': verdicts[None], 'user': verdicts['user'], 'chat': verdicts['chat']}
+
+def build_messages(stream):
+    now = datetime.now()
+    chats = {}
+    users = {}
+    messages = []
+    for message_id, (chat_id, user_id) in enumerate(stream, 1):
+        chat = chats.get(chat_id) or chats.setdefault(chat_id, Chat(id=chat_id, type='supergroup', title='bench'))
+        user = users.get(user_id) or users.setdefault(
+            user_id, User(id=user_id, is_bot=False, first_name=f"user{user_id}", username=f"user{user_id}"))
+        messages.append(Message(message_id=message_id, date=now, chat=chat, from_user=user, text="hello"))
+    return messages
+
+async def bench_path(messages, batch: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="custos-bench-")
+    db = Database(os.path.join(workdir, "bench.db"))
+    await db.init_db()
+    leaderboard = Leaderboard(db)
+    buffer = MessageBuffer(db, leaderboard=leaderboard, name_index=NameIndex(db))
+    # Benign traffic only: a flood verdict would try to mute through a real bot
+    guard = FloodGuard()
+    data = {'message_buffer': buffer}
+    flushes = 0
+    flush = buffer.flush
+
+    async def counted_flush():
+        nonlocal flushes
+        flushes += 1
+        await flush()
+    buffer.flush = counted_flush
+
+    async def handler(event, data):
+        return await track_messages(event, data['message_buffer'])
+
+    buffer.start()
+    started = time.perf_counter()
+    for i, message in enumerate(messages, 1):
+        await guard(handler, message, data)
+        if i % batch == 0:
+            # Let the flush loop run, as it would between updates
+            await asyncio.sleep(0)
+    feed_elapsed = time.perf_counter() - started
+    await buffer.stop()
+    elapsed = time.perf_counter() - started
+
+    async with db._read() as conn:
+        rows = await conn.execute_fetchall("SELECT COALESCE(SUM(count), 0) FROM message_stats")
+    await db.close()
+    passed = guard.stats['checked'] - guard.stats['dropped']
+    return {'elapsed': elapsed, 'feed_elapsed': feed_elapsed, 'rate': len(messages) / elapsed,
+            'passed': passed, 'dropped': guard.stats['dropped'], 'written': rows[0][0], 'flushes': flushes}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--chats', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--flooders', type=float, default=0.2, help="share of flood traffic in the check run")
+    parser.add_argument('--rate', type=float, default=5000, help="simulated msg/s for the check run")
+    parser.add_argument('--batch', type=int, default=100, help="messages between event loop yields")
+    parser.add_argument('--target', type=float, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"FLOOD_SETTINGS: user {FLOOD_SETTINGS['user_limit']}/{FLOOD_SETTINGS['user_window']}s, "
+          f"chat {FLOOD_SETTINGS['chat_limit']}/{FLOOD_SETTINGS['chat_window']}s")
+
+    check = bench_check(synthetic_stream(args.messages, args.chats, args.users, args.flooders, args.seed),
+                        args.rate)
+    print(f"check: {args.messages} messages in {check['elapsed']:.3f}s = {check['rate']:,.0f} msg/s "
+          f"(passed {check['passed']}, user flood {check['user']}, raid {check['chat']})")
+
+    messages = build_messages(synthetic_stream(args.messages, args.chats, args.users, 0, args.seed))
+    path = asyncio.run(bench_path(messages, args.batch))
+    print(f"path:  {args.messages} messages in {path['elapsed']:.3f}s = {path['rate']:,.0f} msg/s "
+          f"(feed {path['feed_elapsed']:.3f}s, {path['flushes']} flushes, passed {path['passed']}, "
+          f"dropped {path['dropped']}, written {path['written']})")
+
+    if path['written'] != path['passed']:
+        print(f"FAIL: {path['passed']} messages passed but {path['written']} were written")
+        sys.exit(1)
+    slowest = min(check['rate'], path['rate'])
+    if slowest < args.target:
+        print(f"FAIL: {slowest:,.0f} msg/s is below the {args.target:,.0f} msg/s target")
+        sys.exit(1)
+    print(f"OK: at least {slowest:,.0f} msg/s (target {args.target:,.0f})")
+
+if __name__ == "__main__":
+    main()
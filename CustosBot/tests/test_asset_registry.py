@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from data.database import Database
+from utils.asset_registry import AssetRegistry
+
+async def stored_file_ids(db_path: str):
+    db = Database(db_path)
+    await db.init_db()
+    for index in range(5):
+        await db.set_asset_file_id(f"profile_card:-100:{index}", f"sig{index}", f"FID{index}")
+    return db
+
+def test_registry_keeps_only_max_cached_in_memory(tmp_path):
+    async def run():
+        db = await stored_file_ids(str(tmp_path / "custos.db"))
+        try:
+            registry = AssetRegistry(db, {'max_cached': 2})
+            await registry.load()
+            assert len(registry._file_ids) == 2
+            # Evicted or never loaded ids are still found in the table
+            assert await registry.get_file_id("profile_card:-100:0", "sig0") == "FID0"
+            assert len(registry._file_ids) == 2
+            # A stale signature means the image changed and has to be uploaded again
+            assert await registry.get_file_id("profile_card:-100:1", "other") is None
+            assert await registry.get_file_id("profile_card:-100:9", "sig9") is None
+        finally:
+            await db.close()
+    asyncio.run(run())
+
+def test_prune_deletes_old_file_ids_in_batches(tmp_path):
+    async def run():
+        db = await stored_file_ids(str(tmp_path / "custos.db"))
+        try:
+            async with db._write() as conn:
+                await conn.execute("""
+                    UPDATE asset_file_ids SET updated_at = datetime('now', '-60 days')
+                    WHERE asset_key != 'profile_card:-100:4'
+                """)
+            cutoff = datetime.utcnow() - timedelta(days=30)
+            assert await db.prune_asset_file_ids(cutoff, 3) == 3
+            assert await db.prune_asset_file_ids(cutoff, 3) == 1
+            assert await db.prune_asset_file_ids(cutoff, 3) == 0
+            assert await db.get_asset_file_id("profile_card:-100:4") == ("sig4", "FID4")
+        finally:
+            await db.close()
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from middlewares import flood_guard
+from middlewares.flood_guard import FloodGuard, SlidingWindowCounter
+
+SETTINGS = {'user_limit': 8, 'user_window': 5, 'chat_limit': 150, 'chat_window': 5,
+            'notice_cooldown': 60, 'max_tracked': 1000}
+
+def test_counter_threshold_and_decay():
+    counter = SlidingWindowCounter(window=5, maxsize=10)
+    assert [counter.hit('k', i * 0.1) for i in range(9)] == list(range(1, 10))
+    # Half of the previous window still overlaps the sliding one
+    assert counter.hit('k', 7.5) == pytest.approx(9 * 0.5 + 1)
+    # Two windows later nothing is left
+    assert counter.hit('k', 20) == 1
+
+def test_counter_drops_least_recently_hit_keys():
+    counter = SlidingWindowCounter(window=5, maxsize=2)
+    for key in ('a', 'b', 'a', 'c'):
+        counter.hit(key, 0)
+    assert len(counter) == 2
+    assert counter.hit('b', 0) == 1
+
+def test_user_flood_is_flagged_past_the_limit():
+    guard = FloodGuard(SETTINGS)
+    verdicts = [guard.check(-100, 1, i * 0.1) for i in range(10)]
+    assert verdicts == [None] * 8 + ['user', 'user']
+    # Another user in the same chat is not affected
+    assert guard.check(-100, 2, 1.0) is None
+
+def test_raid_triggers_and_releases():
+    guard = FloodGuard(SETTINGS)
+    verdicts = [guard.check(-100, user_id, user_id * 0.01) for user_id in range(151)]
+    assert verdicts[:150] == [None] * 150
+    assert verdicts[150] == 'chat'
+    assert guard.check(-100, 999, 2.0) == 'chat'
+    # Other chats keep working during the raid
+    assert guard.check(-200, 1, 2.0) is None
+    # Once the chat is quiet for two windows the raid is over
+    assert guard.check(-100, 1000, 12.0) is None
+
+def test_actions_are_rate_limited_and_bounded():
+    guard = FloodGuard({**SETTINGS, 'max_tracked': 3})
+    assert guard._should_act((-100, 1), 0)
+    assert not guard._should_act((-100, 1), 30)
+    for user_id in range(2, 10):
+        assert guard._should_act((-100, user_id), 31)
+    assert len(guard._acted_at) == 3
+    # Past max_tracked the oldest go first
+    assert guard._should_act((-100, 1), 80)
+    assert list(guard._acted_at) == [(-100, 8), (-100, 9), (-100, 1)]
+    # Cooldowns that ran out are dropped on the next action
+    assert guard._should_act((-100, 2), 200)
+    assert list(guard._acted_at) == [(-100, 2)]
+
+def test_middleware_drops_raid_and_posts_one_notice(monkeypatch):
+    clock = [1000.0]
+    # Only the guard's clock; the event loop keeps the real one
+    monkeypatch.setattr(flood_guard, 'time', SimpleNamespace(monotonic=lambda: clock[0]))
+
+    async def run():
+        guard = FloodGuard(SETTINGS)
+        notices = []
+        handled = []
+
+        async def answer(text, **kwargs):
+            notices.append(text)
+
+        async def handler(event, data):
+            handled.append(event.from_user.id)
+
+        def message(user_id):
+            return SimpleNamespace(chat=SimpleNamespace(id=-100, type='supergroup'),
+                                   from_user=SimpleNamespace(id=user_id, first_name="u"), answer=answer)
+
+        for user_id in range(200):
+            await guard(handler, message(user_id), {})
+        await asyncio.sleep(0)
+        assert len(handled) == 150
+        assert len(notices) == 1
+        assert guard.stats == {'checked': 200, 'dropped': 50, 'actions': 1}
+
+        clock[0] += 12
+        await guard(handler, message(500), {})
+        assert handled[-1] == 500
+    asyncio.run(run())
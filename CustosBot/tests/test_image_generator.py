@@ -0,0 +1,112 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+
+import utils.image_generator as image_generator
+from utils.image_generator import ImageGenerator
+
+PNG = b"\x89PNG\r\n\x1a\n stand-in image"
+
+class InProcessRenderer:
+    """Runs renders in the test process instead of the worker pool"""
+
+    async def render(self, func, *args):
+        return func(*args)
+
+@pytest.fixture(autouse=True)
+def local_setup(monkeypatch):
+    monkeypatch.setattr(image_generator, 'render_engine', InProcessRenderer())
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+def generator(tmp_path, handler, **settings):
+    settings = {'base_url': "http://stand-in/v1", 'max_retries': 0, **settings}
+    return ImageGenerator(str(tmp_path), settings, transport=httpx.MockTransport(handler))
+
+def generate(gen, name="commands"):
+    async def run():
+        try:
+            return await gen._generate_asset(name)
+        finally:
+            await gen.close()
+    with open(asyncio.run(run()), 'rb') as f:
+        return f.read()
+
+def test_inline_image_is_written(tmp_path):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={'created': 0, 'data': [{'b64_json': base64.b64encode(PNG).decode()}]})
+
+    assert generate(generator(tmp_path, handler)) == PNG
+    assert requests[0].url == "http://stand-in/v1/images/generations"
+    assert requests[0].headers['authorization'] == "Bearer test-key"
+    assert json.loads(requests[0].content)['response_format'] == 'b64_json'
+
+def test_image_url_is_downloaded(tmp_path):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            return httpx.Response(200, json={'created': 0, 'data': [{'url': "http://cdn.stand-in/image.png"}]})
+        assert request.url == "http://cdn.stand-in/image.png"
+        return httpx.Response(200, content=PNG)
+
+    assert generate(generator(tmp_path, handler, response_format='url')) == PNG
+
+@pytest.mark.parametrize('failure', ['server_error', 'timeout', 'download_error'])
+def test_failures_fall_back_to_local_rendering(tmp_path, failure):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if failure == 'timeout':
+            raise httpx.ReadTimeout("stand-in timed out", request=request)
+        if failure == 'server_error':
+            return httpx.Response(500, json={'error': {'message': "boom"}})
+        if request.method == "POST":
+            return httpx.Response(200, json={'created': 0, 'data': [{'url': "http://cdn.stand-in/image.png"}]})
+        return httpx.Response(404)
+
+    data = generate(generator(tmp_path, handler, response_format='url'))
+    assert data.startswith(b"\x89PNG") and data != PNG
+    assert not list(tmp_path.glob("*.part"))
+
+def test_no_api_key_renders_locally_without_requests(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("no request expected")
+
+    gen = generator(tmp_path, handler)
+    assert gen.openai_client is None
+    assert generate(gen).startswith(b"\x89PNG")
+
+def test_local_fallback_is_rebuilt_once_openai_is_available(tmp_path, monkeypatch):
+    def no_requests(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("no request expected")
+
+    def openai_image(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'created': 0, 'data': [{'b64_json': base64.b64encode(PNG).decode()}]})
+
+    def build(handler):
+        async def run():
+            gen = generator(tmp_path, handler)
+            gen._load_manifest()
+            try:
+                asset = await gen._build_asset("commands")
+            finally:
+                await gen.close()
+            with open(asset.path, 'rb') as f:
+                return f.read(), gen._manifest_data["commands"]
+        return asyncio.run(run())
+
+    monkeypatch.delenv("OPENAI_API_KEY")
+    data, entry = build(no_requests)
+    assert entry['source'] == 'local' and data != PNG
+    # Still no client: the local image stays
+    assert build(no_requests)[1]['source'] == 'local'
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    data, entry = build(openai_image)
+    assert entry['source'] == 'openai' and data == PNG
+    # Final now: reused without asking OpenAI again
+    assert build(no_requests) == (data, entry)
@@ -0,0 +1,57 @@
+import asyncio
+import random
+from datetime import date
+
+from data.database import Database
+from data.leaderboard import ChatLeaderboard, Leaderboard
+
+def ranking(counts):
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+def test_updates_keep_count_then_user_id_order():
+    board = ChatLeaderboard([(5, 10), (2, 3), (7, 3)])
+    board.add(7, 8)      # overtakes user 5
+    board.add(9, 3)      # new member, ties with user 2 and goes after
+    board.add(2, 0)
+    assert board.page(0, 10) == [(7, 11), (5, 10), (2, 3), (9, 3)]
+    assert board.page(1, 2) == [(5, 10), (2, 3)]
+    assert board.page(4, 2) == []
+
+def test_random_updates_match_a_full_sort():
+    rng = random.Random(7)
+    counts = {}
+    board = ChatLeaderboard([])
+    for _ in range(2000):
+        user_id, delta = rng.randrange(50), rng.randrange(1, 4)
+        counts[user_id] = counts.get(user_id, 0) + delta
+        board.add(user_id, delta)
+    assert board.page(0, len(board)) == ranking(counts)
+
+def test_flushed_batches_match_the_database_order(tmp_path):
+    async def run():
+        db = Database(str(tmp_path / "custos.db"))
+        await db.init_db()
+        try:
+            leaderboard = Leaderboard(db, {'page_size': 3})
+            today = date.today().isoformat()
+            profiles = {user_id: (f"user{user_id}", f"User {user_id}", None) for user_id in range(1, 6)}
+            await db.apply_message_batch(profiles, {(user_id, -100, today): user_id for user_id in range(1, 6)})
+            # Loaded once, then kept current by the batches as MessageBuffer applies them
+            await leaderboard.get_chat(-100)
+            for counts in ({(1, -100, today): 10, (6, -100, today): 4}, {(2, -100, today): 2, (6, -100, today): 1}):
+                async with leaderboard.lock:
+                    await db.apply_message_batch({}, counts)
+                    leaderboard.apply_counts(counts)
+
+            board = await leaderboard.get_chat(-100)
+            fresh = ChatLeaderboard(await db.get_chat_message_counts(-100))
+            assert board.page(0, 10) == fresh.page(0, 10)
+            assert board.page(0, 10) == [(1, 11), (5, 5), (6, 5), (2, 4), (4, 4), (3, 3)]
+
+            rows, pages = await leaderboard.get_page(-100, 2)
+            assert pages == 2
+            assert [(place, user_id, count) for place, user_id, *_, count in rows] == [(4, 2, 4), (5, 4, 4), (6, 3, 3)]
+            assert rows[0][3:5] == ("User 2", "user2")
+        finally:
+            await db.close()
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from data.database import Database, member_search_query
+
+def test_query_quotes_every_word_as_a_prefix():
+    assert member_search_query("Alex Smith") == '"Alex"* "Smith"*'
+    assert member_search_query("@alex_k") == '"alex_k"*'
+    assert member_search_query("Пётр") == '"Петр"*'
+
+def test_query_escapes_quotes_and_operators():
+    assert member_search_query('say "hi"') == '"say"* """hi"""*'
+    assert member_search_query("OR NOT x AND") == '"OR"* "NOT"* "AND"*'
+    assert member_search_query("a* (b) -c ^d col:e") == '"a*"* "(b)"* "-c"* "^d"* "col:e"*'
+
+def test_query_drops_short_words_and_caps_terms():
+    assert member_search_query("a b") is None
+    assert member_search_query("   ") is None
+    assert member_search_query("one two three four five six") == '"one"* "two"* "three"* "four"* "five"*'
+
+MEMBERS = [
+    # user_id, username, first_name, last_name, nickname, chat
+    (1, "alex_k", "Alexander", "Smith", None, -100),
+    (2, "or_not", "Пётр", "Ёлкин", "NEAR", -100),
+    (3, None, 'Джон "Джо"', "Doe", None, -100),
+    (4, "alexey", "Алексей", None, None, -200),
+]
+
+@pytest.fixture
+def search(tmp_path):
+    def run(text):
+        async def go():
+            db = Database(str(tmp_path / "custos.db"))
+            await db.init_db()
+            try:
+                for user_id, username, first_name, last_name, nickname, chat_id in MEMBERS:
+                    await db.add_user(user_id, username, first_name, last_name)
+                    await db.add_chat_member(user_id, chat_id)
+                    if nickname:
+                        await db.set_user_nickname(user_id, nickname)
+                rows, total = await db.search_chat_members(-100, member_search_query(text), 10)
+                return [row[0] for row in rows], total
+            finally:
+                await db.close()
+        return asyncio.run(go())
+    return run
+
+@pytest.mark.parametrize('text, found', [
+    ("alex", [1]),          # prefix of username and first name, other chats excluded
+    ("Alexander Smi", [1]),
+    ("петр елкин", [2]),    # ё folded on both sides
+    ("Пётр", [2]),
+    ("NEAR", [2]),          # operator words are plain text
+    ("or_not", [2]),
+    ('"Джо"', [3]),         # quotes inside the query
+    ("Doe*", [3]),          # punctuation is left to the tokenizer, never a syntax error
+    ("(Doe)", [3]),
+    ("nobody", []),
+])
+def test_search_matches_names_safely(search, text, found):
+    assert search(text) == (found, len(found))
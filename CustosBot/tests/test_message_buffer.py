@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from data.message_buffer import MessageBuffer
+
+class FlakyDatabase:
+    """Stands in for Database.apply_message_batch; fails while ``down``"""
+
+    def __init__(self):
+        self.down = True
+        self.batches = []
+
+    async def apply_message_batch(self, profiles, counts):
+        if self.down:
+            raise OSError("database is locked")
+        self.batches.append(counts)
+
+def test_failed_batch_is_retried_then_dropped_past_the_cap():
+    async def run():
+        db = FlakyDatabase()
+        buffer = MessageBuffer(db, {'max_retry_keys': 3})
+        buffer.record_message(1, -100)
+        buffer.record_message(1, -100)
+        buffer.record_message(2, -100)
+        with pytest.raises(OSError):
+            await buffer.flush()
+        assert buffer.pending == 3
+
+        buffer.record_message(3, -100)
+        buffer.record_message(4, -100)
+        with pytest.raises(OSError):
+            await buffer.flush()
+        # Four counters would be held for retry: the batch goes
+        assert buffer.pending == 0
+        assert buffer.stats == {'flushes': 0, 'failed_flushes': 2, 'dropped_messages': 5}
+
+        db.down = False
+        buffer.record_message(5, -100)
+        await buffer.flush()
+        assert [sum(batch.values()) for batch in db.batches] == [1]
+    asyncio.run(run())
+
+def test_retried_batch_is_merged_into_the_next_write():
+    async def run():
+        db = FlakyDatabase()
+        buffer = MessageBuffer(db, {'max_retry_keys': 10})
+        buffer.record_message(1, -100)
+        with pytest.raises(OSError):
+            await buffer.flush()
+        db.down = False
+        buffer.record_message(1, -100)
+        await buffer.flush()
+        assert [list(batch.values()) for batch in db.batches] == [[2]]
+        assert buffer.stats['flushes'] == 1
+    asyncio.run(run())
@@ -0,0 +1,29 @@
+from datetime import date
+
+import pytest
+
+from utils.periods import month_end, parse_range, split_range
+
+def test_month_end_at_the_end_of_the_calendar():
+    assert month_end(date(9999, 12, 1)) == date(9999, 12, 31)
+    assert month_end(date(2024, 2, 10)) == date(2024, 2, 29)
+
+def test_range_end_is_clamped_to_today():
+    today = date(2025, 6, 15)
+    assert parse_range("01.01.2025-31.12.9999", today=today) == (date(2025, 1, 1), today)
+
+def test_long_range_keeps_its_last_days():
+    today = date(2025, 6, 15)
+    start, end = parse_range("01.01.0001-31.12.9000", today=today, max_days=3660)
+    assert end == today
+    assert (end - start).days == 3659
+    months, weeks, days = split_range(start, end)
+    assert len(months) + len(weeks) + len(days) < 200
+
+def test_range_in_the_future_is_rejected():
+    with pytest.raises(ValueError):
+        parse_range("01.01.3000-01.01.3001", today=date(2025, 6, 15))
+
+def test_not_a_range():
+    assert parse_range("week") is None
+    assert parse_range("31.02.2025-01.03.2025") is None
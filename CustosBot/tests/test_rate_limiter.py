@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from data.rate_limiter import RateLimiter
+
+class FailingDatabase:
+    """Stands in for a Database whose writes fail"""
+
+    async def save_rate_limit_hits(self, hits, expired_before):
+        raise OSError("database is locked")
+
+def limiter(**settings):
+    limiter = RateLimiter(FailingDatabase(), {'persist': False, **settings})
+    limiter.limits = {'warn_moderator': (1, 60.0), 'note_moderator': (1, 0.001)}
+    return limiter
+
+def test_active_cooldown_survives_many_other_windows():
+    rate_limiter = limiter(maxsize=10)
+    assert rate_limiter.hit(-100, 1, 'warn', 'moderator')
+    for user_id in range(2, 100):
+        rate_limiter.hit(-100, user_id, 'warn', 'moderator')
+    assert not rate_limiter.hit(-100, 1, 'warn', 'moderator')
+    assert rate_limiter.retry_after(-100, 1, 'warn', 'moderator') > 0
+
+def test_expired_windows_are_swept(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('data.rate_limiter.time.time', lambda: clock[0])
+    rate_limiter = limiter(maxsize=10)
+    for user_id in range(10):
+        rate_limiter.hit(-100, user_id, 'note', 'moderator')
+    clock[0] += 1
+    rate_limiter.hit(-100, 10, 'warn', 'moderator')
+    rate_limiter.hit(-100, 11, 'note', 'moderator')
+    # The ten expired windows go, the active /warn cooldown stays
+    assert rate_limiter.stats['swept'] == 10
+    assert rate_limiter.stats['windows'] == 2
+    assert not rate_limiter.hit(-100, 10, 'warn', 'moderator')
+
+def test_failed_flushes_keep_at_most_max_pending():
+    rate_limiter = limiter(persist=True, max_pending=5)
+    for user_id in range(8):
+        rate_limiter.hit(-100, user_id, 'warn', 'moderator')
+    with pytest.raises(OSError):
+        asyncio.run(rate_limiter.flush())
+    assert rate_limiter.pending == 5
+    assert rate_limiter.stats['dropped_hits'] == 3
+    # The newest uses are the ones kept
+    assert [hit[1] for hit in rate_limiter._pending] == [3, 4, 5, 6, 7]
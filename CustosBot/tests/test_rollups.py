@@ -0,0 +1,57 @@
+import asyncio
+from datetime import date, timedelta
+
+from data.database import Database
+from data.rollups import RollupReconciler
+
+def test_reconcile_rebuilds_each_chat_from_daily_rows(tmp_path):
+    async def run():
+        db = Database(str(tmp_path / "custos.db"))
+        await db.init_db()
+        try:
+            today = date.today().isoformat()
+            await db.apply_message_batch({}, {(1, -100, today): 3, (2, -100, today): 1, (1, -200, today): 5})
+            async with db._write() as conn:
+                # Drifted rollups, and one for a chat with no daily rows left
+                await conn.execute("UPDATE message_stats_weekly SET count = 99 WHERE chat_id = -100")
+                await conn.execute("DELETE FROM message_stats_monthly WHERE chat_id = -200")
+                await conn.execute("""
+                    INSERT INTO message_stats_monthly (chat_id, month, user_id, count) VALUES (-300, ?, 7, 4)
+                """, (today[:7],))
+            assert sorted(await db.get_rollup_chats(date.today() - timedelta(days=62))) == [-300, -200, -100]
+
+            reconciler = RollupReconciler(db, {'slice_pause': 0})
+            await reconciler.reconcile()
+
+            async with db._read() as conn:
+                weekly = await conn.execute_fetchall(
+                    "SELECT chat_id, user_id, count FROM message_stats_weekly ORDER BY 1, 2")
+                monthly = await conn.execute_fetchall(
+                    "SELECT chat_id, user_id, count FROM message_stats_monthly ORDER BY 1, 2")
+            assert weekly == [(-200, 1, 5), (-100, 1, 3), (-100, 2, 1)]
+            assert monthly == [(-200, 1, 5), (-100, 1, 3), (-100, 2, 1)]
+        finally:
+            await db.close()
+    asyncio.run(run())
+
+def test_stop_abandons_reconcile_between_chats(tmp_path):
+    async def run():
+        db = Database(str(tmp_path / "custos.db"))
+        await db.init_db()
+        try:
+            today = date.today().isoformat()
+            await db.apply_message_batch({}, {(1, -100, today): 1, (1, -200, today): 1})
+            reconciler = RollupReconciler(db, {'slice_pause': 0})
+            done = []
+            reconcile_chat = db.reconcile_chat_rollups
+
+            async def record(chat_id, since):
+                done.append(chat_id)
+                reconciler._stopping = True
+                await reconcile_chat(chat_id, since)
+            db.reconcile_chat_rollups = record
+            await reconciler.reconcile()
+            assert len(done) == 1
+        finally:
+            await db.close()
+    asyncio.run(run())
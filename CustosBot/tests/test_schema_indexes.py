@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from data.database import Database
+
+async def query_plans(db_path: str, method: str, *args) -> list:
+    """EXPLAIN QUERY PLAN details of every statement a Database read method runs"""
+    db = Database(db_path)
+    await db.init_db()
+    statements = []
+    try:
+        for conn in db._reader_conns:
+            await conn.set_trace_callback(statements.append)
+        await getattr(db, method)(*args)
+        for conn in db._reader_conns:
+            await conn.set_trace_callback(None)
+        plans = []
+        async with db._read() as conn:
+            for sql in statements:
+                rows = await conn.execute_fetchall("EXPLAIN QUERY PLAN " + sql)
+                plans.append([row[3] for row in rows])
+        return plans
+    finally:
+        await db.close()
+
+@pytest.mark.parametrize("method, args, index", [
+    ('get_warning_count', (1, -100), 'idx_warnings_user_chat'),
+    ('find_user_by_username', ('@someone', -100), 'idx_users_username'),
+    ('find_user_by_nickname', ('Котик', -100), 'idx_users_nickname'),
+    ('find_user_by_name', ('Иван', -100), 'idx_users_first_name'),
+    ('get_chat_stats', (-100, 20), 'idx_chat_members_chat_count'),
+    ('get_staff_list', (-100,), 'idx_chat_members_chat_rank'),
+    ('get_user_chats', (1,), 'idx_chat_members_user_rank'),
+])
+def test_query_uses_index(tmp_path, method, args, index):
+    plans = asyncio.run(query_plans(str(tmp_path / "custos.db"), method, *args))
+    assert plans, f"{method} ran no query"
+    details = [detail for plan in plans for detail in plan]
+    assert any(detail.startswith('SEARCH') and index in detail for detail in details), details
+    # No table in these lookups is read in full
+    assert not any(detail.startswith('SCAN') for detail in details), details
+
+def test_chat_stats_needs_no_sort(tmp_path):
+    plans = asyncio.run(query_plans(str(tmp_path / "custos.db"), 'get_chat_stats', -100, 20))
+    assert not any('TEMP B-TREE' in detail for plan in plans for detail in plan), plans
@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import BanChatMember, GetChatMember, SendMessage
+
+from middlewares.send_scheduler import SendScheduler
+
+OPEN_CHATS = {'group_rate': 100, 'group_burst': 100, 'private_rate': 100, 'private_burst': 100}
+
+def test_moderation_is_granted_before_queued_replies():
+    async def run():
+        scheduler = SendScheduler({**OPEN_CHATS, 'global_rate': 50, 'global_burst': 1})
+        sent = []
+
+        async def make_request(bot, method):
+            sent.append(type(method).__name__ + str(getattr(method, 'text', '')))
+            return True
+
+        replies = [SendMessage(chat_id=-100, text=str(index)) for index in range(3)]
+        calls = [scheduler(make_request, None, method) for method in replies]
+        calls.append(scheduler(make_request, None, BanChatMember(chat_id=-100, user_id=7)))
+        await asyncio.gather(*calls)
+        await scheduler.close()
+        return sent, scheduler.stats
+    sent, stats = asyncio.run(run())
+    assert sent == ['BanChatMember', 'SendMessage0', 'SendMessage1', 'SendMessage2']
+    assert stats['granted'] == 4
+    assert stats['max_depth'] == 4
+
+def test_reads_are_not_queued():
+    async def run():
+        scheduler = SendScheduler({'global_rate': 1, 'global_burst': 1})
+        scheduler._global.tokens = 0
+
+        async def make_request(bot, method):
+            return "member"
+        result = await asyncio.wait_for(scheduler(make_request, None, GetChatMember(chat_id=-100, user_id=1)), 0.5)
+        await scheduler.close()
+        return result, scheduler.depth
+    assert asyncio.run(run()) == ("member", 0)
+
+def test_retry_after_blocks_only_that_chat_and_retries():
+    async def run():
+        scheduler = SendScheduler(OPEN_CHATS)
+        attempts = []
+
+        async def make_request(bot, method):
+            attempts.append((method.chat_id, time.monotonic()))
+            if method.chat_id == -100 and len(attempts) == 1:
+                raise TelegramRetryAfter(method, "Too Many Requests", retry_after=1)
+            return True
+
+        started = time.monotonic()
+        blocked = asyncio.create_task(scheduler(make_request, None, SendMessage(chat_id=-100, text="a")))
+        await asyncio.sleep(0.05)
+        # Another chat is served while -100 waits out its retry_after
+        await asyncio.wait_for(scheduler(make_request, None, SendMessage(chat_id=-200, text="b")), 0.5)
+        assert not blocked.done()
+        assert await blocked is True
+        await scheduler.close()
+        return started, attempts, scheduler.stats
+    started, attempts, stats = asyncio.run(run())
+    assert [chat_id for chat_id, _ in attempts] == [-100, -200, -100]
+    assert attempts[2][1] - started >= 0.95
+    assert stats['retry_after'] == 1 and stats['gave_up'] == 0
+
+def test_retry_after_reaches_the_caller_past_max_retries():
+    async def run():
+        scheduler = SendScheduler({**OPEN_CHATS, 'max_retries': 0})
+
+        async def make_request(bot, method):
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after=5)
+        try:
+            with pytest.raises(TelegramRetryAfter):
+                await scheduler(make_request, None, SendMessage(chat_id=-100, text="a"))
+        finally:
+            await scheduler.close()
+        return scheduler.stats
+    stats = asyncio.run(run())
+    assert stats['retry_after'] == 1 and stats['gave_up'] == 1
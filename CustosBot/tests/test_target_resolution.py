@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+from data.name_index import NameIndex
+from handlers.moderation_handlers import resolve_target_user
+
+CHAT_ID = -100
+
+class MemberNames:
+    """Stands in for Database.get_chat_member_names"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def get_chat_member_names(self, chat_id):
+        return self.rows
+
+def resolve(target, exact, rows=((1, "alexander_k", None, "Alexander"), (2, "bob", "Бобёр", "Bob"))):
+    message = SimpleNamespace(chat=SimpleNamespace(id=CHAT_ID))
+    index = NameIndex(MemberNames(list(rows)))
+    return asyncio.run(resolve_target_user(message, index, target, exact=exact))
+
+def test_prefix_selects_only_outside_moderation():
+    assert resolve("Alex", exact=False) == (1, "Alexander")
+    user_id, text = resolve("Alex", exact=True)
+    assert user_id == 0
+    assert "Alexander — 1" in text
+    assert "@username или ID" in text
+
+def test_exact_names_and_ids_select_in_moderation():
+    assert resolve("alexander", exact=True) == (1, "Alexander")
+    assert resolve("@bob", exact=True) == (2, "Бобёр")
+    assert resolve("бобёр", exact=True) == (2, "Бобёр")
+    assert resolve("12345", exact=True) == (12345, "12345")
+
+def test_several_exact_matches_are_listed():
+    rows = ((1, "a1", None, "Alex"), (2, "a2", None, "Alex"))
+    user_id, text = resolve("Alex", exact=True, rows=rows)
+    assert user_id == 0
+    assert "несколько участников" in text
+
+def test_unknown_name_is_not_found():
+    user_id, text = resolve("Zed", exact=True)
+    assert user_id == 0
+    assert "не найден" in text
@@ -0,0 +1,54 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from utils.webhook_server import create_webhook_app
+
+SECRET = "stand-in-secret"
+
+# A group message update as Telegram delivers it
+RECORDED_UPDATE = {
+    "update_id": 900001,
+    "message": {
+        "message_id": 42,
+        "date": 1760000000,
+        "chat": {"id": -1001234567890, "type": "supergroup", "title": "Test chat"},
+        "from": {"id": 111, "is_bot": False, "first_name": "Alex", "username": "alex"},
+        "text": "привет"
+    }
+}
+
+def post_update(headers):
+    async def run():
+        dp = Dispatcher()
+        received = []
+
+        @dp.message()
+        async def record(message: Message):
+            received.append((message.chat.id, message.from_user.id, message.text))
+
+        bot = Bot("1:stand-in")
+        app = create_webhook_app(bot, dp, SECRET, {'path': "/webhook", 'drain_timeout': 5})
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post("/webhook", json=RECORDED_UPDATE, headers=headers)
+            # Updates are handled in the background; let the dispatch finish
+            for _ in range(50):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+        await bot.session.close()
+        return response.status, received
+    return asyncio.run(run())
+
+def test_update_with_secret_is_dispatched():
+    status, received = post_update({"X-Telegram-Bot-Api-Secret-Token": SECRET})
+    assert status == 200
+    assert received == [(-1001234567890, 111, "привет")]
+
+def test_update_without_secret_is_rejected():
+    assert post_update({}) == (401, [])
+
+def test_update_with_wrong_secret_is_rejected():
+    assert post_update({"X-Telegram-Bot-Api-Secret-Token": "guess"}) == (401, [])
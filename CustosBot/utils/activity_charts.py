@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+
+from aiogram.types import Message
+
+from config import STATS_CHART_SETTINGS
+from data.database import Database
+from utils.asset_registry import AssetRegistry
+from utils.cache import LRUCache
+from utils.render_cache import render_cache
+from utils.render_engine import render_activity_chart
+
+class ActivityCharts:
+    """Daily activity charts for /stats, one per chat and day.
+
+    A chart is redrawn only when the day changes or the chat has written more
+    than ``change_threshold`` messages since it was last drawn; until then the
+    same chart, and so the same Telegram file_id, is sent again. Rendering
+    happens in the render pool through the shared render cache, so concurrent
+    /stats calls wait on a single render.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self.settings = {**STATS_CHART_SETTINGS, **(settings or {})}
+        # chat_id -> (day, messages counted, chart fields)
+        self._drawn = LRUCache(maxsize=self.settings['max_chats'])
+
+    async def chart_fields(self, db: Database, chat_id: int) -> Optional[tuple]:
+        """Arguments for render_activity_chart, reusing the last ones while the change is small"""
+        days = self.settings['days']
+        today = datetime.now().date()
+        since = today - timedelta(days=days - 1)
+        rows = await db.get_daily_activity(chat_id, since.isoformat())
+        if not rows:
+            return None
+
+        total = sum(count for _, count in rows)
+        drawn = self._drawn.get(chat_id)
+        if drawn and drawn[0] == today and total - drawn[1] < self.settings['change_threshold']:
+            return drawn[2]
+
+        by_date = dict(rows)
+        dates = tuple((since + timedelta(days=i)).isoformat() for i in range(days))
+        counts = tuple(by_date.get(date, 0) for date in dates)
+        fields = (f"Сообщения за {days} дней", dates, counts)
+        self._drawn.set(chat_id, (today, total, fields))
+        return fields
+
+    async def answer_chart(self, message: Message, db: Database, assets: AssetRegistry,
+                           **kwargs) -> Optional[Message]:
+        """Reply with the chat's activity chart; None when disabled or there is no activity yet"""
+        if not self.settings['enabled']:
+            return None
+        fields = await self.chart_fields(db, message.chat.id)
+        if fields is None:
+            return None
+        signature = render_cache.key_for(render_activity_chart, *fields)
+
+        async def render():
+            return await render_cache.get_by_key(signature, render_activity_chart, *fields)
+
+        return await assets.answer_rendered(message, f"stats_chart:{message.chat.id}",
+                                            signature, render, **kwargs)
+
+# Create global instance
+activity_charts = ActivityCharts()
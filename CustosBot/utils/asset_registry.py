@@ -0,0 +1,110 @@
+import logging
+from typing import Awaitable, Callable, Optional, Dict
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, FSInputFile, BufferedInputFile, InputFile
+
+from config import ASSET_REGISTRY_SETTINGS
+from data.database import Database
+from utils.cache import LRUCache
+from utils.image_generator import ImageAsset
+
+logger = logging.getLogger(__name__)
+
+class AssetRegistry:
+    """Remembers the Telegram file_id of every image the bot has uploaded.
+
+    The first send of an image uploads the file; the file_id Telegram returns
+    is stored in the asset_file_ids table, together with the content hash of
+    the image, and used for every later send. If Telegram rejects a stored id,
+    or the image has been rebuilt with different contents, the file is
+    uploaded again and the new id recorded.
+
+    Per-user slots such as profile cards make the table grow with chats x
+    users, so only ``max_cached`` ids are kept in memory (LRU) and the
+    rest are read from the table on demand; CompactionJob deletes rows
+    that were not re-uploaded for a while.
+    """
+
+    def __init__(self, db: Database, settings: Optional[Dict] = None):
+        self.db = db
+        self.settings = {**ASSET_REGISTRY_SETTINGS, **(settings or {})}
+        self._file_ids = LRUCache(maxsize=self.settings['max_cached'])
+        self._loaded = False
+
+    async def load(self):
+        """Read the most recently stored file_ids into memory"""
+        for asset_key, signature, file_id in await self.db.get_asset_file_ids(self.settings['max_cached']):
+            self._file_ids.set(asset_key, (signature, file_id))
+        self._loaded = True
+
+    async def get_file_id(self, asset_key: str, signature: str) -> Optional[str]:
+        """Stored file_id for this exact version of the asset"""
+        entry = self._file_ids.get(asset_key)
+        if entry is None:
+            entry = await self.db.get_asset_file_id(asset_key)
+            if entry is None:
+                return None
+            self._file_ids.set(asset_key, entry)
+        if entry[0] == signature:
+            return entry[1]
+        return None
+
+    async def remember(self, asset_key: str, signature: str, sent: Message):
+        """Record the file_id of a photo Telegram just accepted"""
+        if not sent or not sent.photo:
+            return
+        file_id = sent.photo[-1].file_id
+        if self._file_ids.get(asset_key) == (signature, file_id):
+            return
+        self._file_ids.set(asset_key, (signature, file_id))
+        await self.db.set_asset_file_id(asset_key, signature, file_id)
+
+    async def forget(self, asset_key: str):
+        """Drop a file_id Telegram no longer accepts"""
+        self._file_ids.pop(asset_key)
+        await self.db.set_asset_file_id(asset_key, "", None)
+
+    async def _answer_photo(self, message: Message, asset_key: str, signature: str,
+                            make_file: Callable[[], Awaitable[InputFile]], **kwargs) -> Message:
+        file_id = await self.get_file_id(asset_key, signature)
+        if file_id:
+            try:
+                return await message.answer_photo(photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                # Caption/markup errors are not the file_id's fault
+                if "file" not in str(e).lower():
+                    raise
+                logger.warning("Stored file_id for %s rejected, re-uploading: %s", asset_key, e)
+                await self.forget(asset_key)
+
+        sent = await message.answer_photo(photo=await make_file(), **kwargs)
+        await self.remember(asset_key, signature, sent)
+        return sent
+
+    async def answer_photo(self, message: Message, image: Optional[ImageAsset], **kwargs) -> Optional[Message]:
+        """Reply with an image, by file_id when possible. Returns None if there is no image."""
+        if image is None:
+            return None
+        if not self._loaded:
+            await self.load()
+
+        async def make_file():
+            return FSInputFile(image.path)
+
+        return await self._answer_photo(message, image.path, image.content_hash, make_file, **kwargs)
+
+    async def answer_rendered(self, message: Message, asset_key: str, signature: str,
+                              render: Callable[[], Awaitable[bytes]], **kwargs) -> Message:
+        """Reply with a rendered image; render() is only awaited when there is no usable file_id.
+
+        ``asset_key`` names the slot (e.g. one per user card) so a new version
+        replaces the file_id of the previous one.
+        """
+        if not self._loaded:
+            await self.load()
+
+        async def make_file():
+            return BufferedInputFile(await render(), filename=f"{signature[:16]}.png")
+
+        return await self._answer_photo(message, asset_key, signature, make_file, **kwargs)
@@ -1,168 +1,318 @@
 import os
 import asyncio
-import requests
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
-from openai import OpenAI
+import base64
+import hashlib
+import json
+import tempfile
+import logging
+import aiofiles
+import httpx
+from typing import Dict, NamedTuple, Optional, Tuple
+from openai import AsyncOpenAI
+
+from config import IMAGE_GENERATION_SETTINGS
+from utils.render_engine import render_engine, render_banner
+
+logger = logging.getLogger(__name__)
 
 # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
 # do not change this unless explicitly requested by the user
 
+class ImageAsset(NamedTuple):
+    """A built image: where it is and the sha256 of its contents"""
+    path: str
+    content_hash: str
+
+# Static bot images: name -> (filename, generation prompt)
+ASSETS = {
+    'main_menu': ("main_menu.png", """
+        Dark themed logo for Telegram bot called 'Custos | Чат-менеджер'. 
+        Modern minimalist design with dark purple, blue, black and white colors. 
+        Dark background with elegant white text. 
+        Futuristic chat management theme with geometric elements.
+        No realistic photos, just abstract geometric design.
+        """),
+    'commands': ("commands.png", """
+        Dark themed header image with text 'Команды' (Commands in Russian). 
+        Dark purple and blue gradient background with white text. 
+        Minimalist design with geometric elements and chat symbols.
+        Modern tech style, no realistic photos.
+        """),
+    'my_chats': ("my_chats.png", """
+        Dark themed header image with text 'Мои чаты' (My Chats in Russian). 
+        Dark background with purple and blue accents. 
+        Chat bubble icons and geometric elements. 
+        Modern minimalist style, white text on dark background.
+        """),
+    'user_profile': ("user_profile.png", """
+        Dark themed image for user profile with text 'Описание чатера' (User Description in Russian).
+        Dark purple background with blue accents. 
+        User avatar placeholder and profile elements.
+        Modern minimalist design with white text.
+        """),
+    'bot_avatar': ("bot_avatar.png", """
+        Bot avatar for 'Custos' chat manager. 
+        Circular avatar with dark theme - purple, blue, black colors. 
+        Modern robotic or AI assistant appearance. 
+        Professional and trustworthy design. 
+        No text, just the avatar icon.
+        """),
+}
+
 class ImageGenerator:
-    def __init__(self):
+    """Builds the static bot images with OpenAI, falling back to local rendering.
+
+    ``transport`` replaces the HTTP transport of the pooled client, so tests
+    can answer the API and image downloads without a network.
+    """
+
+    def __init__(self, images_path: str = "images", settings: Optional[Dict] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
         self.openai_client = None
-        self.images_path = "images"
+        self.settings = {**IMAGE_GENERATION_SETTINGS, **(settings or {})}
+        self.images_path = images_path
+        self.manifest_path = os.path.join(self.images_path, "manifest.json")
         os.makedirs(self.images_path, exist_ok=True)
+        self._manifest_data = {}
+        self._manifest = {}
+        self._inflight = {}
+        self._warm_up = None
+        # Concurrent builds save the manifest one at a time
+        self._manifest_lock = asyncio.Lock()
+        
+        # One pooled HTTP client shared by the OpenAI API calls and image downloads
+        settings = self.settings
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings['timeout'], connect=settings['connect_timeout']),
+            limits=httpx.Limits(max_connections=settings['max_connections'],
+                                max_keepalive_connections=settings['max_connections']),
+            transport=transport
+        )
+        # Bounds how many generations run at once
+        self._generation_slots = asyncio.Semaphore(settings['max_concurrency'])
         
         # Initialize OpenAI client only if API key is available
         openai_api_key = os.environ.get("OPENAI_API_KEY")
         if openai_api_key:
             try:
-                self.openai_client = OpenAI(api_key=openai_api_key)
+                self.openai_client = AsyncOpenAI(
+                    api_key=openai_api_key,
+                    base_url=settings['base_url'],
+                    http_client=self.http_client,
+                    max_retries=settings['max_retries']
+                )
             except Exception as e:
-                print(f"Failed to initialize OpenAI client: {e}")
+                logger.error("Failed to initialize OpenAI client: %s", e)
                 self.openai_client = None
     
+    async def close(self):
+        """Close pooled HTTP connections"""
+        await self.http_client.aclose()
+    
+    async def _write_file(self, filepath: str, data: bytes):
+        tmp_path = filepath + ".part"
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            await f.write(data)
+        os.replace(tmp_path, filepath)
+    
+    async def _download(self, url: str, filepath: str):
+        """Stream an image to disk in chunks"""
+        tmp_path = filepath + ".part"
+        async with self.http_client.stream("GET", url) as response:
+            if response.status_code != 200:
+                raise Exception(f"Failed to download image: {response.status_code}")
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                async for chunk in response.aiter_bytes(self.settings['chunk_size']):
+                    await f.write(chunk)
+        os.replace(tmp_path, filepath)
+    
     async def generate_with_openai(self, prompt: str, filename: str) -> str:
         """Generate image using OpenAI DALL-E"""
+        path, _ = await self._generate(prompt, filename)
+        return path
+    
+    async def _generate(self, prompt: str, filename: str) -> Tuple[str, str]:
+        """(path, source): 'openai', or 'local' when the PIL fallback drew it"""
         # If OpenAI client is not available, fallback to local generation
         if not self.openai_client:
-            print("OpenAI client not available, using local generation")
-            return await self.generate_local(prompt, filename)
+            logger.debug("OpenAI client not available, using local generation")
+            return await self.generate_local(prompt, filename), 'local'
             
         try:
-            response = self.openai_client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                n=1,
-                size="1024x1024"
-            )
-            
-            # Download the image
-            if response.data and len(response.data) > 0:
-                image_url = response.data[0].url
-                if image_url:
-                    image_response = requests.get(image_url)
+            async with self._generation_slots:
+                response = await self.openai_client.images.generate(
+                    model="dall-e-3",
+                    prompt=prompt,
+                    n=1,
+                    size="1024x1024",
+                    response_format=self.settings['response_format']
+                )
+                
+                if not response.data:
+                    raise Exception("No image data received from OpenAI")
+                
+                filepath = os.path.join(self.images_path, filename)
+                image_data = response.data[0]
+                if image_data.b64_json:
+                    # Image came inline, no second download needed
+                    await self._write_file(filepath, base64.b64decode(image_data.b64_json))
+                elif image_data.url:
+                    await self._download(image_data.url, filepath)
                 else:
                     raise Exception("No image URL received from OpenAI")
-            else:
-                raise Exception("No image data received from OpenAI")
-            
-            if image_response.status_code == 200:
-                filepath = os.path.join(self.images_path, filename)
-                with open(filepath, 'wb') as f:
-                    f.write(image_response.content)
-                return filepath
-            else:
-                raise Exception(f"Failed to download image: {image_response.status_code}")
+                return filepath, 'openai'
                 
         except Exception as e:
-            print(f"OpenAI generation failed: {e}")
+            logger.warning("OpenAI generation failed for %s: %s", filename, e)
             # Fallback to local generation
-            return await self.generate_local(prompt, filename)
+            return await self.generate_local(prompt, filename), 'local'
     
     async def generate_local(self, text: str, filename: str) -> str:
-        """Generate image locally using PIL as fallback"""
+        """Generate image locally using PIL as fallback (rendered in the process pool)"""
+        filepath = os.path.join(self.images_path, filename)
         try:
-            # Create dark themed image
-            width, height = 1024, 1024
-            background_color = (30, 20, 60)  # Dark purple
-            text_color = (255, 255, 255)     # White text
-            accent_color = (138, 43, 226)    # Blue violet
-            
-            image = Image.new('RGB', (width, height), background_color)
-            draw = ImageDraw.Draw(image)
-            
-            # Try to use a nice font, fallback to default
-            try:
-                font_size = 80
-                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-            
-            # Calculate text position
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            x = (width - text_width) // 2
-            y = (height - text_height) // 2
-            
-            # Draw accent background
-            margin = 50
-            draw.rectangle([x-margin, y-margin, x+text_width+margin, y+text_height+margin], 
-                         fill=accent_color, outline=None)
-            
-            # Draw text
-            draw.text((x, y), text, fill=text_color, font=font)
-            
-            # Add decorative elements
-            for i in range(5):
-                circle_x = 100 + i * 200
-                circle_y = 100
-                draw.ellipse([circle_x-10, circle_y-10, circle_x+10, circle_y+10], 
-                           fill=accent_color)
-            
-            filepath = os.path.join(self.images_path, filename)
-            image.save(filepath)
-            return filepath
-            
+            await self._write_file(filepath, await render_engine.render(render_banner, text))
         except Exception as e:
-            print(f"Local generation failed: {e}")
-            # Return a basic placeholder path
-            return os.path.join(self.images_path, filename)
+            logger.error("Local generation failed for %s: %s", filename, e)
+        # Return the path either way; callers check the file exists
+        return filepath
     
     async def generate_main_menu_image(self) -> str:
         """Generate main menu cover image"""
-        prompt = """
-        Dark themed logo for Telegram bot called 'Custos | Чат-менеджер'. 
-        Modern minimalist design with dark purple, blue, black and white colors. 
-        Dark background with elegant white text. 
-        Futuristic chat management theme with geometric elements.
-        No realistic photos, just abstract geometric design.
-        """
-        return await self.generate_with_openai(prompt, "main_menu.png")
+        return await self._generate_asset("main_menu")
     
     async def generate_commands_image(self) -> str:
         """Generate commands help image"""
-        prompt = """
-        Dark themed header image with text 'Команды' (Commands in Russian). 
-        Dark purple and blue gradient background with white text. 
-        Minimalist design with geometric elements and chat symbols.
-        Modern tech style, no realistic photos.
-        """
-        return await self.generate_with_openai(prompt, "commands.png")
+        return await self._generate_asset("commands")
     
     async def generate_my_chats_image(self) -> str:
         """Generate my chats image"""
-        prompt = """
-        Dark themed header image with text 'Мои чаты' (My Chats in Russian). 
-        Dark background with purple and blue accents. 
-        Chat bubble icons and geometric elements. 
-        Modern minimalist style, white text on dark background.
-        """
-        return await self.generate_with_openai(prompt, "my_chats.png")
+        return await self._generate_asset("my_chats")
     
     async def generate_user_profile_image(self) -> str:
         """Generate user profile description image"""
-        prompt = """
-        Dark themed image for user profile with text 'Описание чатера' (User Description in Russian).
-        Dark purple background with blue accents. 
-        User avatar placeholder and profile elements.
-        Modern minimalist design with white text.
-        """
-        return await self.generate_with_openai(prompt, "user_profile.png")
+        return await self._generate_asset("user_profile")
     
     async def generate_bot_avatar(self) -> str:
         """Generate bot avatar"""
-        prompt = """
-        Bot avatar for 'Custos' chat manager. 
-        Circular avatar with dark theme - purple, blue, black colors. 
-        Modern robotic or AI assistant appearance. 
-        Professional and trustworthy design. 
-        No text, just the avatar icon.
-        """
-        return await self.generate_with_openai(prompt, "bot_avatar.png")
+        return await self._generate_asset("bot_avatar")
+    
+    async def _generate_asset(self, name: str) -> str:
+        filename, prompt = ASSETS[name]
+        return await self.generate_with_openai(prompt, filename)
+    
+    # Asset manifest: every asset in ASSETS is built once (at startup by
+    # warm_up) and recorded in images/manifest.json with the hash of the
+    # prompt it was built from, the hash of the resulting file and its
+    # source. Images drawn by the local fallback are built again once an
+    # OpenAI client is available. Handlers read assets through get_asset(),
+    # which only consults the in-memory manifest and joins an in-flight
+    # build instead of starting another.
+    
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self._manifest_data = json.load(f)
+        except (OSError, ValueError):
+            self._manifest_data = {}
+    
+    def _write_manifest(self, data: dict):
+        # Own temporary file per write, so an interrupted or concurrent write never replaces another's
+        fd, tmp_path = tempfile.mkstemp(prefix="manifest.", suffix=".tmp", dir=self.images_path)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    
+    async def _save_manifest(self):
+        """Write a snapshot of the manifest; the loop keeps changing the live dict meanwhile"""
+        async with self._manifest_lock:
+            snapshot = dict(self._manifest_data)
+            try:
+                await asyncio.to_thread(self._write_manifest, snapshot)
+            except OSError as e:
+                # The asset itself is fine; it is only checked again on the next start
+                logger.warning("Failed to save image manifest: %s", e)
+    
+    @staticmethod
+    def _prompt_hash(name: str) -> str:
+        filename, prompt = ASSETS[name]
+        return hashlib.sha256(f"{filename}\n{prompt}".encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _file_hash(path: str) -> Optional[str]:
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+    
+    async def _build_asset(self, name: str) -> ImageAsset:
+        """Reuse the file on disk if it matches the prompt hash, otherwise generate it"""
+        filename, prompt = ASSETS[name]
+        path = os.path.join(self.images_path, filename)
+        prompt_hash = self._prompt_hash(name)
+        entry = self._manifest_data.get(name) or {}
+        # Files without a manifest entry predate the manifest and are adopted as-is
+        source = entry.get('source', 'existing')
+        
+        content_hash = await asyncio.to_thread(self._file_hash, path)
+        up_to_date = content_hash and (not entry or entry.get('prompt_hash') == prompt_hash)
+        if up_to_date and source == 'local' and self.openai_client:
+            up_to_date = False
+        if not up_to_date:
+            path, source = await self._generate(prompt, filename)
+            content_hash = await asyncio.to_thread(self._file_hash, path)
+            if not content_hash:
+                raise RuntimeError(f"Image generation produced no file for {name}")
+        
+        self._manifest_data[name] = {
+            'file': filename,
+            'prompt_hash': prompt_hash,
+            'content_hash': content_hash,
+            'source': source
+        }
+        await self._save_manifest()
+        asset = ImageAsset(path, content_hash)
+        self._manifest[name] = asset
+        return asset
+    
+    def _start_build(self, name: str) -> asyncio.Task:
+        task = self._inflight.get(name)
+        if task is None:
+            task = asyncio.create_task(self._build_asset(name))
+            self._inflight[name] = task
+            task.add_done_callback(lambda _: self._inflight.pop(name, None))
+        return task
+    
+    def start_warm_up(self) -> asyncio.Future:
+        """Build every asset concurrently in the background"""
+        self._load_manifest()
+        self._warm_up = asyncio.gather(*(self._start_build(name) for name in ASSETS), return_exceptions=True)
+        return self._warm_up
+    
+    async def warm_up(self):
+        """Build every asset concurrently and wait for all of them"""
+        for name, result in zip(ASSETS, await self.start_warm_up()):
+            if isinstance(result, Exception):
+                logger.error("Failed to build image asset %s: %s", name, result)
+    
+    async def get_asset(self, name: str) -> Optional[ImageAsset]:
+        """Ready asset from the manifest, waiting on its build if one is running"""
+        asset = self._manifest.get(name)
+        if asset is not None:
+            return asset
+        try:
+            return await asyncio.shield(self._start_build(name))
+        except Exception as e:
+            logger.error("Failed to build image asset %s: %s", name, e)
+            return None
 
 # Create global instance
 image_gen = ImageGenerator()
\ No newline at end of file
@@ -0,0 +1,191 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Dict, Optional
+
+from config import LOGGING_SETTINGS
+
+# Per-update fields attached to every record logged while the update is handled
+STRUCTURED_FIELDS = ('chat_id', 'user_id', 'handler', 'latency_ms')
+
+_log_fields: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar('log_fields', default=None)
+
+def bind_log_fields(**fields) -> contextvars.Token:
+    """Start a log context for the current task; pass the token to reset_log_fields"""
+    return _log_fields.set({key: value for key, value in fields.items() if value is not None})
+
+def set_log_fields(**fields):
+    """Add fields to the current log context (no-op outside one)"""
+    current = _log_fields.get()
+    if current is not None:
+        current.update(fields)
+
+def get_log_fields() -> Dict:
+    """Fields of the current log context (empty outside one)"""
+    return _log_fields.get() or {}
+
+def reset_log_fields(token: contextvars.Token):
+    _log_fields.reset(token)
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto the record; runs in the task that logs"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        fields = _log_fields.get()
+        if fields:
+            for key, value in fields.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+class DebugRateLimit(logging.Filter):
+    """Lets through at most ``limit`` DEBUG records per call site and ``window`` seconds.
+
+    A call site is the logger and the unformatted message, so hot-path debug
+    lines should pass their values as arguments (``logger.debug("chat %s", id)``)
+    rather than as f-strings. Past the limit only every ``sample``-th record
+    is kept; the next record let through reports how many were dropped.
+    """
+
+    def __init__(self, limit: int, window: float, sample: int):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sample = sample
+        # call site -> [window start, records seen, records dropped]
+        self._sites: Dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        site = self._sites.get(key)
+        if site is None or now - site[0] >= self.window:
+            if len(self._sites) > 10000:
+                self._sites.clear()
+            site = self._sites[key] = [now, 0, site[2] if site else 0]
+        site[1] += 1
+        over = site[1] - self.limit
+        if over > 0 and (not self.sample or over % self.sample):
+            site[2] += 1
+            return False
+        if site[2]:
+            record.suppressed = site[2]
+            site[2] = 0
+        return True
+
+_traceback_formatter = logging.Formatter()
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped (and counted) when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.dropped:
+            record.dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now (they may change later), keep the traceback apart for the formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class StructuredFormatter(logging.Formatter):
+    """Text lines with ``key=value`` fields appended, or one JSON object per line"""
+
+    def __init__(self, json_lines: bool = False):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.json_lines = json_lines
+
+    @staticmethod
+    def _fields(record: logging.LogRecord) -> Dict:
+        fields = {key: getattr(record, key) for key in STRUCTURED_FIELDS if hasattr(record, key)}
+        for key in ('suppressed', 'dropped'):
+            if hasattr(record, key):
+                fields[key] = getattr(record, key)
+        return fields
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not self.json_lines:
+            line = super().format(record)
+            fields = self._fields(record)
+            if fields:
+                line += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+            return line
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **self._fields(record)
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """'aiogram=WARNING,handlers=DEBUG' -> {'aiogram': 'WARNING', 'handlers': 'DEBUG'}"""
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging(settings: Optional[Dict] = None) -> logging.handlers.QueueListener:
+    """Route all logging through a queue to a writer thread.
+
+    Loggers only put records on a bounded queue, so a slow stdout or log
+    pipeline never blocks the event loop; the listener thread formats and
+    writes them. Safe to call more than once (each process calls it once).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    settings = {**LOGGING_SETTINGS, **(settings or {})}
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(StructuredFormatter(json_lines=settings['format'] == 'json'))
+
+    log_queue = queue.Queue(maxsize=settings['queue_size'])
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(DebugRateLimit(settings['debug_limit'], settings['debug_window'], settings['debug_sample']))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings['level'].upper())
+    for name, level in parse_levels(settings['levels']).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,186 @@
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from config import METRICS_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic count per label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labels, values)} {_number(value)}"
+                for values, value in self._values.items()]
+
+class Gauge(Counter):
+    """Current value per label values"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+
+class Histogram:
+    """Observations per label values in cumulative ``le`` buckets, with sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text format.
+
+    Hot paths only update plain dicts; ``collectors`` run when the endpoint
+    is scraped, to copy values such as the services' ``stats`` into gauges.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = ()) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def expose_stats(self, prefix: str, help_text: str, stats: Callable[[], Dict]):
+        """Publish a service's numeric ``stats`` entries as ``<prefix>_<key>`` gauges"""
+        def collect():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.gauge(f"{prefix}_{key}", f"{help_text}: {key}").set(value)
+        self.add_collector(collect)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+def timed_methods(histogram: Histogram, errors: Counter):
+    """Class decorator: time every public coroutine method, labelled with its name"""
+    def wrap(func, name: str):
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, name)
+        return timed
+
+    def decorate(cls):
+        for name, func in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.iscoroutinefunction(func):
+                setattr(cls, name, wrap(func, name))
+        return cls
+    return decorate
+
+async def start_metrics_server(registry: MetricsRegistry, worker: int = 0,
+                               settings: Optional[Dict] = None) -> Optional[web.AppRunner]:
+    """Serve GET <path> on host:port (+ worker index); None if disabled or the port is taken"""
+    settings = {**METRICS_SETTINGS, **(settings or {})}
+    if not settings['enabled']:
+        return None
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    app = web.Application()
+    app.router.add_get(settings['path'], handle)
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    port = settings['port'] + worker
+    try:
+        await web.TCPSite(runner, settings['host'], port).start()
+    except OSError as e:
+        logger.error("Metrics endpoint not started on %s:%s: %s", settings['host'], port, e)
+        await runner.cleanup()
+        return None
+    logger.info("Metrics on http://%s:%s%s", settings['host'], port, settings['path'])
+    return runner
+
+# Create global instance
+metrics = MetricsRegistry()
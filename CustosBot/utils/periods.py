@@ -0,0 +1,110 @@
+import calendar
+import re
+from datetime import date, timedelta
+from typing import Optional, List, Tuple
+
+from config import COMPACTION_SETTINGS, LEADERBOARD_SETTINGS, ROLLUP_SETTINGS
+
+# /stats period keywords -> canonical name
+PERIOD_ALIASES = {
+    'day': 'day', 'today': 'day', 'день': 'day', 'сегодня': 'day',
+    'week': 'week', 'неделя': 'week', 'неделю': 'week',
+    'month': 'month', 'месяц': 'month'
+}
+
+PERIOD_TITLES = {
+    'day': 'за сегодня',
+    'week': 'за неделю',
+    'month': 'за месяц'
+}
+
+_RANGE_RE = re.compile(
+    r"^(\d{4}-\d{2}-\d{2}|\d{2}\.\d{2}\.\d{4})(?:\.\.|—|-)(\d{4}-\d{2}-\d{2}|\d{2}\.\d{2}\.\d{4})$"
+)
+
+def week_start(day: date) -> date:
+    """Monday of the week the day belongs to"""
+    return day - timedelta(days=day.weekday())
+
+def month_end(day: date) -> date:
+    """Last day of the day's month"""
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+def daily_horizon(retention_days: Optional[int] = None, today: Optional[date] = None) -> date:
+    """First day that still has daily and weekly rows; earlier ones are folded into months"""
+    today = today or date.today()
+    retention_days = retention_days or COMPACTION_SETTINGS['daily_retention_days']
+    # Never fold days the rollup reconciler still rebuilds from
+    days = max(retention_days, ROLLUP_SETTINGS['reconcile_days'])
+    return (today - timedelta(days=days)).replace(day=1)
+
+def align_to_horizon(start: date, end: date, horizon: date) -> Tuple[date, date]:
+    """Widen the part of a window before the horizon to whole months"""
+    if start < horizon:
+        start = start.replace(day=1)
+        if end < horizon:
+            end = month_end(end)
+    return start, end
+
+def period_range(period: str, today: Optional[date] = None) -> Tuple[date, date]:
+    """Whole calendar day, week or month containing today"""
+    today = today or date.today()
+    if period == 'day':
+        return today, today
+    if period == 'week':
+        start = week_start(today)
+        return start, start + timedelta(days=6)
+    start = today.replace(day=1)
+    return start, month_end(today)
+
+def _parse_date(text: str) -> date:
+    if '.' in text:
+        day, month, year = text.split('.')
+        return date(int(year), int(month), int(day))
+    return date.fromisoformat(text)
+
+def parse_range(text: str, today: Optional[date] = None,
+                max_days: Optional[int] = None) -> Optional[Tuple[date, date]]:
+    """Parse 2025-01-01..2025-01-31 or 01.01.2025-31.01.2025; None if it is not a range.
+
+    There are no messages after today, so the end is clamped to today, and
+    the window to its last ``max_days`` days (so split_range stays small).
+    Raises ValueError for a range that lies entirely in the future.
+    """
+    match = _RANGE_RE.match(text)
+    if not match:
+        return None
+    try:
+        start, end = _parse_date(match.group(1)), _parse_date(match.group(2))
+    except ValueError:
+        return None
+    if start > end:
+        start, end = end, start
+    today = today or date.today()
+    max_days = max_days or LEADERBOARD_SETTINGS['max_range_days']
+    if start > today:
+        raise ValueError("range starts in the future")
+    end = min(end, today)
+    start = max(start, end - timedelta(days=max_days - 1))
+    return start, end
+
+def split_range(start: date, end: date) -> Tuple[List[str], List[str], List[str]]:
+    """Cover [start, end] with whole months, whole weeks and single days.
+
+    Returns (months 'YYYY-MM', week starts 'YYYY-MM-DD', days 'YYYY-MM-DD')
+    so a window is read from the rollup tables, with raw daily rows only
+    for the few days at its edges.
+    """
+    months, weeks, days = [], [], []
+    cursor = start
+    while cursor <= end:
+        if cursor.day == 1 and month_end(cursor) <= end:
+            months.append(cursor.strftime('%Y-%m'))
+            cursor = month_end(cursor) + timedelta(days=1)
+        elif cursor.weekday() == 0 and cursor + timedelta(days=6) <= end:
+            weeks.append(cursor.isoformat())
+            cursor += timedelta(days=7)
+        else:
+            days.append(cursor.isoformat())
+            cursor += timedelta(days=1)
+    return months, weeks, days
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Callable, Optional, Dict
+
+import aiofiles
+
+from config import RENDER_CACHE_SETTINGS
+from utils.render_engine import render_engine
+
+logger = logging.getLogger(__name__)
+
+class RenderCache:
+    """Content-addressed cache of rendered images.
+
+    An image is identified by the sha256 of the render function and the
+    arguments it is drawn from, so the same fields always map to the same
+    PNG and a render only happens when one of them changes. Encoded bytes
+    are kept in memory and on disk, each side bounded by a byte budget and
+    evicted least recently used first. Concurrent requests for the same
+    image share one render.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self.settings = {**RENDER_CACHE_SETTINGS, **(settings or {})}
+        self.cache_dir = self.settings['cache_dir']
+        self._memory: OrderedDict = OrderedDict()   # key -> bytes
+        self._memory_bytes = 0
+        self._disk: Optional[OrderedDict] = None    # key -> file size, loaded lazily
+        self._disk_bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'renders': 0}
+
+    @staticmethod
+    def key_for(render_func: Callable, *args) -> str:
+        """Hash of the render function and the fields it draws"""
+        payload = json.dumps([render_func.__module__, render_func.__qualname__, args],
+                             ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _load_disk_index(self):
+        # Rebuild the disk LRU from file modification times (touched on every hit)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self._disk = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._disk_bytes = sum(self._disk.values())
+        self._evict_disk()
+
+    def _remember_in_memory(self, key: str, data: bytes):
+        if len(data) > self.settings['memory_bytes']:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.settings['memory_bytes']:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.settings['disk_bytes'] and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _touch_disk(self, key: str):
+        self._disk.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    async def _read_or_render(self, key: str, render_func: Callable, args: tuple) -> bytes:
+        path = self._path(key)
+        if key in self._disk:
+            try:
+                async with aiofiles.open(path, 'rb') as f:
+                    data = await f.read()
+                self._touch_disk(key)
+                self.stats['disk_hits'] += 1
+                return data
+            except OSError:
+                self._disk_bytes -= self._disk.pop(key)
+
+        data = await render_engine.render(render_func, *args)
+        self.stats['renders'] += 1
+
+        tmp_path = path + ".part"
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            await f.write(data)
+        os.replace(tmp_path, path)
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        self._evict_disk()
+        return data
+
+    async def get(self, render_func: Callable, *args) -> bytes:
+        """PNG bytes of render_func(*args), rendered only on a cache miss"""
+        return await self.get_by_key(self.key_for(render_func, *args), render_func, *args)
+
+    async def get_by_key(self, key: str, render_func: Callable, *args) -> bytes:
+        """Same as get() for callers that already computed key_for()"""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            return data
+
+        if self._disk is None:
+            self._load_disk_index()
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._read_or_render(key, render_func, args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        data = await asyncio.shield(task)
+        self._remember_in_memory(key, data)
+        return data
+
+# Create global instance
+render_cache = RenderCache()
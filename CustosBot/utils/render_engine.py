@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import Callable, Optional, Dict
+
+from PIL import Image, ImageDraw, ImageFont
+
+from config import RENDER_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# --- Worker side -----------------------------------------------------------
+# Everything below runs inside pool processes. Render functions must be
+# module-level (picklable) and return encoded image bytes.
+
+@lru_cache(maxsize=32)
+def load_font(size: int, path: Optional[str] = None):
+    """Load a TrueType font once per worker, falling back to PIL's default"""
+    try:
+        return ImageFont.truetype(path or RENDER_SETTINGS['font_path'], size)
+    except OSError:
+        return ImageFont.load_default()
+
+def _init_worker():
+    # Warm the font cache with the sizes the bot draws with
+    for size in RENDER_SETTINGS['preload_font_sizes']:
+        load_font(size)
+    # matplotlib takes about a second to import; pay it at startup, not on the first /stats
+    import matplotlib.backends.backend_agg  # noqa: F401
+
+def _noop():
+    pass
+
+def _timed(func: Callable, *args) -> tuple:
+    started = time.perf_counter()
+    data = func(*args)
+    return data, time.perf_counter() - started
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def render_banner(text: str) -> bytes:
+    """Dark themed 1024x1024 banner with centered text (local image fallback)"""
+    width, height = 1024, 1024
+    background_color = (30, 20, 60)  # Dark purple
+    text_color = (255, 255, 255)     # White text
+    accent_color = (138, 43, 226)    # Blue violet
+
+    image = Image.new('RGB', (width, height), background_color)
+    draw = ImageDraw.Draw(image)
+    font = load_font(80)
+
+    # Calculate text position
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+
+    x = (width - text_width) // 2
+    y = (height - text_height) // 2
+
+    # Draw accent background
+    margin = 50
+    draw.rectangle([x-margin, y-margin, x+text_width+margin, y+text_height+margin],
+                 fill=accent_color, outline=None)
+
+    # Draw text
+    draw.text((x, y), text, fill=text_color, font=font)
+
+    # Add decorative elements
+    for i in range(5):
+        circle_x = 100 + i * 200
+        circle_y = 100
+        draw.ellipse([circle_x-10, circle_y-10, circle_x+10, circle_y+10],
+                   fill=accent_color)
+
+    return encode_png(image)
+
+def _fit_text(draw: ImageDraw.ImageDraw, text: str, font, max_width: int) -> str:
+    """Cut text with an ellipsis so it fits max_width pixels"""
+    if draw.textlength(text, font=font) <= max_width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > max_width:
+        text = text[:-1]
+    return text + "…"
+
+def _wrap_text(draw: ImageDraw.ImageDraw, text: str, font, max_width: int, max_lines: int) -> list:
+    """Greedy word wrap, the last line ellipsized when the text does not fit"""
+    lines, current = [], ""
+    for word in text.split():
+        candidate = f"{current} {word}".strip()
+        if draw.textlength(candidate, font=font) <= max_width or not current:
+            current = candidate
+        else:
+            lines.append(current)
+            current = word
+    if current:
+        lines.append(current)
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] += "…"
+    return [_fit_text(draw, line, font, max_width) for line in lines]
+
+def render_profile_card(name: str, rank: str, messages: str, description: str) -> bytes:
+    """960x480 profile card in the banner colours"""
+    width, height = 960, 480
+    background_color = (30, 20, 60)
+    accent_color = (138, 43, 226)
+    text_color = (255, 255, 255)
+    muted_color = (190, 180, 220)
+    padding = 48
+
+    image = Image.new('RGB', (width, height), background_color)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, width, 12], fill=accent_color)
+
+    # Name and rank badge
+    name_font, label_font, text_font = load_font(56), load_font(28), load_font(32)
+    draw.text((padding, 56), _fit_text(draw, name, name_font, width - 2 * padding),
+              fill=text_color, font=name_font)
+    badge_width = draw.textlength(rank, font=label_font) + 32
+    draw.rounded_rectangle([padding, 140, padding + badge_width, 188], radius=12, fill=accent_color)
+    draw.text((padding + 16, 148), rank, fill=text_color, font=label_font)
+
+    # Message counter
+    draw.text((padding, 220), "Сообщений", fill=muted_color, font=label_font)
+    draw.text((padding, 256), messages, fill=text_color, font=name_font)
+
+    # Description, wrapped to three lines
+    y = 350
+    for line in _wrap_text(draw, description, text_font, width - 2 * padding, 3):
+        draw.text((padding, y), line, fill=muted_color, font=text_font)
+        y += 40
+
+    return encode_png(image)
+
+def render_activity_chart(title: str, dates: list, counts: list) -> bytes:
+    """Bar chart of messages per day (matplotlib, imported in the worker only)"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    background_color = '#1e143c'
+    accent_color = '#8a2be2'
+    text_color = '#ffffff'
+
+    # Figure + Agg canvas directly: no pyplot global state in the worker
+    figure = Figure(figsize=(9.6, 4.8), dpi=100, facecolor=background_color)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.set_facecolor(background_color)
+    axes.bar(range(len(counts)), counts, color=accent_color, width=0.8)
+
+    step = max(1, len(dates) // 10)
+    axes.set_xticks(range(0, len(dates), step))
+    axes.set_xticklabels([date[8:10] + "." + date[5:7] for date in dates[::step]])
+    axes.set_title(title, color=text_color, fontsize=16, pad=12)
+    axes.tick_params(colors=text_color)
+    axes.grid(axis='y', color=text_color, alpha=0.15)
+    axes.set_axisbelow(True)
+    for spine in axes.spines.values():
+        spine.set_visible(False)
+    figure.tight_layout()
+
+    buffer = BytesIO()
+    figure.savefig(buffer, format='png', facecolor=background_color)
+    return buffer.getvalue()
+
+# --- Event loop side -------------------------------------------------------
+
+class RenderEngine:
+    """Runs CPU-bound render functions in a process pool.
+
+    At most ``max_in_flight`` renders are submitted at once; further callers
+    wait their turn on the event loop. Each render's queue wait and render
+    time are logged and aggregated in ``stats``.
+    """
+
+    def __init__(self, settings: Optional[Dict] = None):
+        self.settings = {**RENDER_SETTINGS, **(settings or {})}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.settings['max_in_flight'])
+        self.stats = {'renders': 0, 'failures': 0, 'render_seconds': 0.0,
+                      'wait_seconds': 0.0, 'max_render_seconds': 0.0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: never fork a process that owns sqlite and network threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.settings['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return self._pool
+
+    def start(self):
+        """Spawn the workers now so the first render does not pay for process start-up"""
+        pool = self._get_pool()
+        # Each submit starts a worker, which runs _init_worker as its initializer
+        for _ in range(self.settings['workers']):
+            pool.submit(_noop)
+
+    async def render(self, func: Callable, *args) -> bytes:
+        """Run func(*args) in a worker and return the encoded image bytes"""
+        queued = time.perf_counter()
+        async with self._slots:
+            waited = time.perf_counter() - queued
+            loop = asyncio.get_running_loop()
+            try:
+                data, elapsed = await loop.run_in_executor(self._get_pool(), _timed, func, *args)
+            except Exception:
+                self.stats['failures'] += 1
+                raise
+
+        self.stats['renders'] += 1
+        self.stats['render_seconds'] += elapsed
+        self.stats['wait_seconds'] += waited
+        self.stats['max_render_seconds'] = max(self.stats['max_render_seconds'], elapsed)
+        logger.debug("Rendered %s in %.1f ms (waited %.1f ms, %d bytes)",
+                     func.__name__, elapsed * 1000, waited * 1000, len(data))
+        return data
+
+    def shutdown(self):
+        """Stop worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+# Create global instance
+render_engine = RenderEngine()
@@ -0,0 +1,202 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import queue
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import Update
+
+from config import WORKER_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """Consistent hash of chat ids onto worker indexes.
+
+    Every worker owns ``replicas`` points on the ring and a key belongs to
+    the first point after its hash, so changing the number of workers only
+    moves about 1/N of the chats.
+    """
+
+    def __init__(self, nodes: int, replicas: int):
+        points = sorted((_hash(f"worker-{node}:{replica}"), node)
+                        for node in range(nodes) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key) -> int:
+        index = bisect.bisect(self._hashes, _hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+# --- Supervisor side -----------------------------------------------------
+
+class WorkerPool:
+    """Worker processes of the supervisor, one update queue each.
+
+    ``target(index, count, queue)`` runs in a spawned process and serves
+    the updates put on its queue (see serve_queue); ``None`` tells it to
+    finish. Processes that die are started again on a new queue.
+    """
+
+    def __init__(self, target: Callable, settings: Optional[Dict] = None):
+        self.target = target
+        self.settings = {**WORKER_SETTINGS, **(settings or {})}
+        self.count = self.settings['processes']
+        self.ring = HashRing(self.count, self.settings['replicas'])
+        # spawn: never fork a process that owns sqlite and network threads
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue() for _ in range(self.count)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * self.count
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {'forwarded': [0] * self.count, 'restarts': 0}
+
+    def _spawn(self, index: int):
+        process = self._context.Process(target=self.target, args=(index, self.count, self._queues[index]),
+                                        name=f"custos-worker-{index}")
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        """Spawn the workers and start watching them"""
+        if self._task is None:
+            self._stopping = False
+            for index in range(self.count):
+                self._spawn(index)
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, key: int, payload: str):
+        """Queue a serialized update for the worker that owns key"""
+        index = self.ring.node_for(key)
+        self._queues[index].put((key, payload))
+        self.stats['forwarded'][index] += 1
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.settings['check_interval'])
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                break
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error("Worker %s exited with code %s, restarting", index, process.exitcode)
+                    self.stats['restarts'] += 1
+                    # The dead process may have held the queue's lock; its unread updates are lost with it
+                    self._queues[index] = self._context.Queue()
+                    self._spawn(index)
+
+    async def stop(self):
+        """Let every worker finish its queue, then stop it"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+        for worker_queue in self._queues:
+            worker_queue.put(None)
+        loop = asyncio.get_running_loop()
+        for index, process in enumerate(self._processes):
+            await loop.run_in_executor(None, process.join, self.settings['drain_timeout'])
+            if process.is_alive():
+                logger.warning("Worker %s did not finish in %s s, terminating", index, self.settings['drain_timeout'])
+                process.terminate()
+                await loop.run_in_executor(None, process.join)
+
+class ShardForwarder(BaseMiddleware):
+    """Supervisor's outer update middleware: ships every update to its worker.
+
+    Registered with ``dp.update.outer_middleware``; it runs after aiogram's
+    own context middleware, so the chat (or, without one, the user) is
+    already known. No handler runs in the supervisor.
+    """
+
+    def __init__(self, pool: WorkerPool):
+        self.pool = pool
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        chat = data.get('event_chat')
+        user = data.get('event_from_user')
+        key = chat.id if chat is not None else (user.id if user is not None else 0)
+        self.pool.submit(key, event.model_dump_json(exclude_unset=True, by_alias=True))
+        return None
+
+# --- Worker side ---------------------------------------------------------
+
+class ChatLanes:
+    """Runs work for different chats concurrently and for one chat in order"""
+
+    def __init__(self, handle: Callable[[Any], Awaitable[Any]]):
+        self.handle = handle
+        self._lanes: Dict[int, deque] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, key: int, item: Any):
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append(item)
+            return
+        lane = self._lanes[key] = deque([item])
+        task = asyncio.create_task(self._drain(key, lane))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key: int, lane: deque):
+        while lane:
+            try:
+                await self.handle(lane[0])
+            except Exception as e:
+                logger.exception("Update for chat %s failed: %s", key, e)
+            lane.popleft()
+        del self._lanes[key]
+
+    async def join(self):
+        """Wait until every lane is empty"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+def _get_batch(worker_queue, batch_size: int) -> list:
+    # Wait up to a second for the first item, then take whatever else is already queued
+    try:
+        batch = [worker_queue.get(timeout=1)]
+    except queue.Empty:
+        return []
+    while len(batch) < batch_size and batch[-1] is not None:
+        try:
+            batch.append(worker_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+async def serve_queue(bot: Bot, dp: Dispatcher, worker_queue, settings: Optional[Dict] = None):
+    """Feed updates from the supervisor's queue into dp until it sends None"""
+    settings = {**WORKER_SETTINGS, **(settings or {})}
+    lanes = ChatLanes(lambda payload: dp.feed_raw_update(bot, json.loads(payload)))
+    loop = asyncio.get_running_loop()
+    supervisor = multiprocessing.parent_process()
+    finished = False
+    while not finished:
+        batch = await loop.run_in_executor(None, _get_batch, worker_queue, settings['batch_size'])
+        if not batch and supervisor is not None and not supervisor.is_alive():
+            logger.error("Supervisor is gone, stopping")
+            break
+        for item in batch:
+            if item is None:
+                finished = True
+                break
+            key, payload = item
+            lanes.submit(key, payload)
+    await lanes.join()
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import secrets
+import signal
+from typing import Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import WEBHOOK_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Webhook handler that lets accepted updates finish on shutdown.
+
+    Updates are acknowledged at once and processed in the background. Once
+    ``close()`` runs, new requests get 503 so Telegram delivers them again
+    later, and the updates already accepted get up to ``drain_timeout``
+    seconds to finish. The bot session is left open; main() closes it
+    after the other services.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, drain_timeout: float, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self.drain_timeout = drain_timeout
+        self._draining = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._draining:
+            return web.Response(status=503, text="shutting down")
+        return await super().handle(request)
+
+    async def close(self) -> None:
+        self._draining = True
+        pending = set(self._background_feed_update_tasks)
+        if not pending:
+            return
+        logger.info("Draining %s webhook updates", len(pending))
+        done, pending = await asyncio.wait(pending, timeout=self.drain_timeout)
+        if pending:
+            logger.warning("%s webhook updates still running after %s s, cancelling",
+                           len(pending), self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+def create_webhook_app(bot: Bot, dp: Dispatcher, secret_token: Optional[str],
+                       settings: Optional[Dict] = None) -> web.Application:
+    """aiohttp application dispatching updates POSTed to ``path`` (checked against secret_token)"""
+    settings = {**WEBHOOK_SETTINGS, **(settings or {})}
+    app = web.Application()
+    handler = DrainingRequestHandler(dp, bot, settings['drain_timeout'], secret_token=secret_token)
+    handler.register(app, path=settings['path'])
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(bot: Bot, dp: Dispatcher, settings: Optional[Dict] = None):
+    """Serve updates over a webhook until SIGINT/SIGTERM.
+
+    Without ``base_url`` setWebhook is not called, so recorded updates can
+    be POSTed to http://host:port/path by hand; send the
+    X-Telegram-Bot-Api-Secret-Token header when ``secret_token`` is set.
+    """
+    settings = {**WEBHOOK_SETTINGS, **(settings or {})}
+    secret_token = settings['secret_token']
+    if settings['base_url'] and not secret_token:
+        # Telegram needs the same token on every instance behind the URL, so only fine for one process
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET is not set, using a random secret token for this run")
+
+    app = create_webhook_app(bot, dp, secret_token, settings)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, settings['host'], settings['port'])
+    await site.start()
+    logger.info("Webhook listening on %s:%s%s", settings['host'], settings['port'], settings['path'])
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: KeyboardInterrupt still ends asyncio.run()
+            pass
+
+    try:
+        if settings['base_url']:
+            await bot.set_webhook(
+                settings['base_url'].rstrip('/') + settings['path'],
+                secret_token=secret_token,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=settings['drop_pending_updates']
+            )
+        await stop.wait()
+    finally:
+        logger.info("Webhook shutting down")
+        # Stops listening, waits for open requests, then runs on_shutdown (handler.close drains)
+        await runner.cleanup()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(sig)
+            except NotImplementedError:
+                pass